@@ -0,0 +1,62 @@
+# pyright: standard
+"""
+批量执行 仿真 → 渲染 → 合成，任务列表为 JSON 文件，例如：
+
+    [
+        {"midi": "song.mid", "tracks": [0, 1], "overrides": ["boundary=default_hexagon", "ball=ball_polygon"]},
+        {"midi": "other.mid", "renderer": "manim", "size": 480, "fps": 24, "audio": "impact"},
+        {"midi": "library/*.mid", "tracks": "n_onsets >= 200 and min_gap >= 0.12", "max_tracks": 1}
+    ]
+
+    python scripts/batch.py jobs.json --render-workers 2
+
+中断后以同样的参数再次运行即从未完成的步骤继续
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import _pre_init
+from rich import print
+
+from src.batch import BATCH_DB_PATH, BATCH_LOG_PATH, DEFAULT_LIMITS, MAX_ATTEMPTS, JobStore, load_jobs, run_batch
+from src.supervisor import load_metrics, metrics_table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("jobs", type=Path, help="JSON file with the list of jobs")
+    parser.add_argument("--db", type=Path, default=BATCH_DB_PATH, help="SQLite file keeping the job state")
+    for stage, limit in DEFAULT_LIMITS.items():
+        parser.add_argument(
+            f"--{stage}-workers", type=int, default=limit, help=f"Concurrent {stage} steps (default: {limit})"
+        )
+    parser.add_argument(
+        "--max-attempts", type=int, default=MAX_ATTEMPTS, help="Runs of a failing step before giving up"
+    )
+    parser.add_argument("--retry-failed", action="store_true", help="Give steps that were given up on a new chance")
+    parser.add_argument(
+        "--status", action="store_true", help="Only show the state of the jobs and the metrics of their stages"
+    )
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.jobs)
+    store = JobStore(args.db)
+    for job in jobs:
+        store.add(job)
+    if args.status:
+        print(store.summary(jobs))
+        job_ids = {job.job_id for job in jobs}
+        metrics = [row for row in load_metrics() if row.get("tags", {}).get("job") in job_ids]
+        if metrics:
+            print(metrics_table(metrics, title="Stage metrics of this batch"))
+        sys.exit(0)
+
+    store.recover(retry_failed=args.retry_failed)
+    limits = {stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_LIMITS}
+    print(f"Running {len(jobs)} job(s), logs in {BATCH_LOG_PATH}")
+    try:
+        completed = run_batch(jobs, store, limits, args.max_attempts)
+    except KeyboardInterrupt:
+        print("[yellow]Interrupted, run the same command again to resume[/yellow]")
+        sys.exit(130)
+    sys.exit(0 if completed else 1)
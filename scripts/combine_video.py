@@ -1,15 +1,20 @@
 # pyright: standard
 import argparse
-import pickle
-import subprocess
+import sys
 from pathlib import Path
 from typing import List, Set, Tuple
 
 import _pre_init
 from rich import print
 
-from src.midi import midi_tracks_to_wav
-from src.models.manim import SimulationRecord
+from src.manifest import Manifest, hash_json
+from src.impact import impact_wav_path, impacts_to_wav
+from src.midi import NoteRecord, midi_tracks_to_wav
+from src.onset import AUDIO_SUFFIXES, is_audio_file
+from src.pipeline import AUDIO_BACKENDS, build_mux_command
+from src.record import LEGACY_SUFFIX, RECORD_SUFFIX, RecordArrays, load_record_arrays
+from src.supervisor import Stage, measure, run_stage
+from src.utils import get_default_sf2_file
 
 MANIM_PATH = _pre_init.PROJECT_ROOT / "manim-videos"
 FINAL_PATH = _pre_init.PROJECT_ROOT / "final-videos"
@@ -45,68 +50,102 @@ def parse_manim_folder(midi_file: Path, tracks: List[int]) -> str:
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-m", "--music", type=str, required=True, help="Midi filename (without suffix)")
+    parser.add_argument("-m", "--music", type=str, required=True, help="Midi or audio filename (without suffix)")
     parser.add_argument("-s", "--soundfont", type=Path, default=None, help="SoundFont file path")
     parser.add_argument(
         "-t", "--tracks", type=int, nargs="+", default=[0], help="List of MIDI tracks to use (default: [0])"
     )
+    parser.add_argument(
+        "--audio",
+        choices=AUDIO_BACKENDS,
+        default="fluidsynth",
+        help="Synthesize the MIDI with FluidSynth (audio sources are used as they are), "
+        "or place an impact sound at every collision (no SoundFont needed)",
+    )
+    parser.add_argument(
+        "--sample", type=Path, default=None, help="Impact sample for --audio impact (default: synthesized)"
+    )
+    parser.add_argument("--force", action="store_true", help="Combine even if the final video is up to date")
+    parser.add_argument("--timeout", type=float, default=None, help="Give up the ffmpeg mux after this many seconds")
     args = parser.parse_args()
 
     midi_file = _pre_init.ASSETS_PATH / "midi" / (args.music + ".mid")
+    for suffix in AUDIO_SUFFIXES:  # 没有 MIDI 时查找同名的音频文件
+        if not midi_file.exists():
+            midi_file = midi_file.with_suffix(suffix)
     video_quality = parse_manim_folder(midi_file, args.tracks)
-    records: List[SimulationRecord] = []
+    records: List[RecordArrays] = []
     videos: List[Path] = []
+    record_files: List[Path] = []
 
     for t in args.tracks:
-        pkl_file = MANIM_PATH / f"{midi_file.stem}-{t}/{video_quality}.pkl"
-        videos.append(MANIM_PATH / f"{midi_file.stem}-{t}/{video_quality}.mp4")
-        with open(pkl_file, "rb") as f:
-            record: SimulationRecord = pickle.load(f)
-            records.append(record)
-
-    wav_path = midi_tracks_to_wav(
-        midi_file, args.tracks, wav_output_path=_pre_init.ASSETS_PATH / "wav", soundfont_path=args.soundfont
-    )
+        video_file = MANIM_PATH / f"{midi_file.stem}-{t}/{video_quality}.mp4"
+        record_file = video_file.with_suffix(RECORD_SUFFIX)
+        if not record_file.exists():  # 旧版渲染目录中只有 pickle
+            record_file = video_file.with_suffix(LEGACY_SUFFIX)
+        videos.append(video_file)
+        record_files.append(record_file)
+        records.append(load_record_arrays(record_file))
+
+    manifest = Manifest()
+    wav_output_path = _pre_init.ASSETS_PATH / "wav"
+    if args.audio == "impact":
+        # 撞击音由碰撞记录决定，记录变化后需要重新合成
+        wav_inputs = {
+            "audio": hash_json(args.audio),
+            "midi": manifest.hash_file(midi_file),
+            "records": hash_json([manifest.hash_file(r) for r in record_files]),
+            "sample": hash_json(None) if args.sample is None else manifest.hash_file(args.sample),
+            "tracks": hash_json(args.tracks),
+        }
+        wav_path = impact_wav_path(midi_file, args.tracks, wav_output_path)
+        if args.force or manifest.lookup("synth", wav_inputs) != wav_path:
+            midi = None if is_audio_file(midi_file) else NoteRecord(midi_file)
+            duration = records[0].meta.music_total_time
+            with measure("synth", {"output": wav_path.as_posix()}):
+                impacts_to_wav(records, wav_path, duration, midi=midi, sample_path=args.sample)
+            manifest.record("synth", wav_inputs, wav_path)
+    elif is_audio_file(midi_file):
+        # 由音频检测起音的记录直接使用原音频，时间轴与 MIDI 合成的 WAV 相同
+        wav_path = midi_file
+    else:
+        soundfont = get_default_sf2_file() if args.soundfont is None else args.soundfont
+        wav_inputs = {
+            "midi": manifest.hash_file(midi_file),
+            "soundfont": manifest.hash_file(soundfont),
+            "tracks": hash_json(args.tracks),
+        }
+        wav_is_cached = manifest.lookup("synth", wav_inputs) is not None
+        with measure("synth", {"cached": wav_is_cached}):
+            wav_path = midi_tracks_to_wav(
+                midi_file,
+                args.tracks,
+                wav_output_path=wav_output_path,
+                soundfont_path=soundfont,
+                overwrite=not wav_is_cached,
+            )
+        if not wav_is_cached:
+            manifest.record("synth", wav_inputs, wav_path)
     final_video_path = FINAL_PATH / f"{midi_file.stem}-{'-'.join(str(t) for t in args.tracks)}-{video_quality}.mp4"
 
-    offsets = [int(r.collisions[0].time * 1000) for r in records]
-    print(offsets)
-    audio_offset_ms = max(offsets)
-    video_delays_sec = [(audio_offset_ms - o) / 1000 for o in offsets]
-
-    match len(videos):
-        case 1:
-            ffmpeg_cmd = (
-                ["ffmpeg"]
-                + ["-i", videos[0].as_posix()]
-                + ["-i", wav_path.as_posix()]
-                + ["-filter_complex", f"[1:a]adelay={audio_offset_ms}[aout]"]
-                + ["-map", "0:v", "-map", "[aout]"]
-                + ["-c:v", "copy", "-c:a", "aac"]
-                + ["-strict", "experimental"]
-                + [final_video_path.as_posix(), "-y"]
-            )
-        case 2:
-            filter_complex = (  # 没有逗号，隐式拼接
-                f"[0:v]tpad=start_duration={video_delays_sec[0]}[v0];"
-                f"[1:v]tpad=start_duration={video_delays_sec[1]}[v1];"
-                f"[v0][v1]hstack=inputs=2[vout];"
-                f"[2:a]adelay={audio_offset_ms}[aout]"
-            )
+    inputs = {
+        "audio": manifest.hash_file(wav_path),
+        "videos": hash_json([manifest.hash_file(v) for v in videos]),
+        "records": hash_json([manifest.hash_file(r) for r in record_files]),
+    }
+    if not args.force and manifest.lookup("combine", inputs) == final_video_path:
+        print(f"Final video is up to date: {final_video_path}")
+        sys.exit(0)
 
-            ffmpeg_cmd = (
-                ["ffmpeg"]
-                + ["-i", videos[0].as_posix()]
-                + ["-i", videos[1].as_posix()]
-                + ["-i", wav_path.as_posix()]
-                + ["-filter_complex", filter_complex]
-                + ["-map", "[vout]", "-map", "[aout]"]
-                + ["-c:v", "libx264", "-c:a", "aac"]
-                + ["-strict", "experimental"]
-                + [final_video_path.as_posix(), "-y"]
-            )
-        case _:
-            raise NotImplementedError(f"Combining {len(videos)} tracks is not implemented yet.")
+    offsets = [int(r.time[0] * 1000) for r in records]
+    print(offsets)
+    ffmpeg_cmd = build_mux_command(videos, wav_path, offsets, final_video_path)
 
     print(f"Running command: '{" ".join(ffmpeg_cmd)}'")
-    subprocess.run(ffmpeg_cmd)
+    final_video_path.parent.mkdir(parents=True, exist_ok=True)
+    combine = Stage(
+        "combine", ffmpeg_cmd, kind="ffmpeg", timeout=args.timeout, tags={"output": final_video_path.as_posix()}
+    )
+    if run_stage(combine, check=False).status != "ok":
+        sys.exit(1)
+    manifest.record("combine", inputs, final_video_path)
@@ -0,0 +1,71 @@
+# pyright: standard
+"""
+将旧版 pickle 仿真记录转换为列式 .rec 格式；--compact 将单球记录改写为只含恢复系数的紧凑编码
+"""
+import argparse
+from dataclasses import replace
+from pathlib import Path
+from typing import List
+
+import _pre_init
+from rich import print
+
+from src.record import (
+    LEGACY_SUFFIX,
+    RECORD_SUFFIX,
+    convert_pickle,
+    is_compact_record,
+    is_legacy_pickle,
+    load_record_arrays,
+    save_record,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "inputs",
+        type=Path,
+        nargs="*",
+        help="Legacy .pkl records to convert (default: every .pkl under outputs/ and manim-videos/)",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="rewrite single-ball records with bounce steps and restitution coefficients only (default inputs: .rec)",
+    )
+    parser.add_argument("--keep_checkpoints", action="store_true", help="keep the checkpoints in compact records")
+    args = parser.parse_args()
+
+    suffix = RECORD_SUFFIX if args.compact else LEGACY_SUFFIX
+    inputs: List[Path] = args.inputs or [
+        p
+        for root in (_pre_init.PROJECT_ROOT / "outputs", _pre_init.PROJECT_ROOT / "manim-videos")
+        for p in root.rglob(f"*{suffix}")
+    ]
+    for record_file in inputs:
+        if not args.compact:
+            if not is_legacy_pickle(record_file):
+                print(f"[yellow]Skip {record_file}: already a columnar record[/yellow]")
+                continue
+            print(f"Converted {record_file} -> {convert_pickle(record_file)}")
+            continue
+
+        if is_compact_record(record_file):
+            print(f"[yellow]Skip {record_file}: already a compact record[/yellow]")
+            continue
+        arrays = load_record_arrays(record_file, mmap=False)
+        if not args.keep_checkpoints:  # 检查点只用于继续仿真，占了记录的大部分
+            arrays = replace(arrays, checkpoints=None)
+        output = record_file.with_suffix(RECORD_SUFFIX)
+        size = record_file.stat().st_size
+        try:
+            save_record(arrays, output, compact=True)
+        except ValueError as e:
+            print(f"[yellow]Skip {record_file}: {e}[/yellow]")
+            continue
+        print(f"Compacted {record_file} -> {output} ({size / 1024:.1f} KiB -> {output.stat().st_size / 1024:.1f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
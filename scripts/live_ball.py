@@ -0,0 +1,136 @@
+# pyright: standard
+"""
+实时模式：音符由实时回放的 MIDI 文件或 MIDI 输入端口驱动，窗口按固定帧率显示，剩余参数作为 Hydra 覆盖项，例如：
+
+    python scripts/live_ball.py --lookahead 0.5 boundary=default_hexagon ball=ball_polygon
+    python scripts/live_ball.py --port "Virtual Keyboard" --lookahead 0.3
+    SDL_VIDEODRIVER=dummy python scripts/live_ball.py --duration 10  # 无窗口环境下回放测试
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import cast
+
+import _pre_init
+from hydra import compose, initialize_config_dir
+from rich import print
+
+from src.live import FileReplayFeed, LivePlanner, NoteFeed, PortFeed
+from src.onset import load_notes
+from src.models import Config  # 导入时注册 Hydra 配置模式
+from src.models.manim import MetaData
+from src.planner import build_ball, build_boundary
+from src.simulator import Simulator
+
+HUD_COLOR = (200, 200, 200)
+
+
+def init_display():
+    """优先使用默认的视频驱动打开窗口，没有显示设备时退回 dummy 驱动"""
+    import pygame
+
+    try:
+        pygame.display.init()
+    except pygame.error:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.display.init()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=str, default=None, help="MIDI input port name, replay music.midi if omitted")
+    parser.add_argument("--channel", type=int, default=None, help="Only use notes from this MIDI channel (port mode)")
+    parser.add_argument("--lookahead", type=float, default=0.5, help="Delay from note arrival to impact (s)")
+    parser.add_argument("--size", type=int, default=720, help="Window size (px)")
+    parser.add_argument("--fps", type=int, default=60, help="Display frame rate")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--metrics", type=Path, default=None, help="Write latency metrics to this JSON file")
+    args, overrides = parser.parse_known_args()
+
+    with initialize_config_dir(version_base=None, config_dir=(_pre_init.ASSETS_PATH / "conf").as_posix()):
+        cfg = cast(Config, compose(config_name="config", overrides=overrides))
+
+    ball = build_ball(cfg.ball)
+    boundary = build_boundary(cfg.boundary)
+    midi_file = ""
+    if args.port is None:
+        midi_path = _pre_init.ASSETS_PATH / "midi" / cfg.music.midi
+        feed: NoteFeed = FileReplayFeed(load_notes(midi_path).notes[cfg.music.inst_idx])
+        midi_file = midi_path.as_posix()
+        print(f"Replaying track {cfg.music.inst_idx} of {midi_path.name}")
+    else:
+        feed = PortFeed(args.port, args.channel)
+        print(f"Listening on MIDI port {args.port!r}")
+    meta = MetaData(
+        ball=ball.to_manim_meta(),
+        boundary=boundary.to_manim_meta(),
+        dt=cfg.simulation.dt,
+        midi_file=midi_file,
+        inst_idx=cfg.music.inst_idx,
+        music_total_time=0.0,
+    )
+
+    init_display()
+    # 渲染器导入时会将未设置的视频驱动默认为 dummy，因此在打开显示之后导入
+    import pygame
+
+    from src.pygame_renderer import Renderer, outline_from_meta, world_size_from_meta
+
+    world_w, world_h = world_size_from_meta(meta)
+    renderer = Renderer(args.size, args.size, world_w, world_h, outline=outline_from_meta(meta))
+    screen = pygame.display.set_mode((args.size, args.size))
+    pygame.display.set_caption("bounce-music live")
+    font = pygame.font.Font(None, max(14, args.size // 40))
+
+    t_start = time.perf_counter()
+
+    def clock() -> float:
+        return time.perf_counter() - t_start
+
+    planner = LivePlanner(Simulator(ball, boundary), cfg.simulation.dt, args.lookahead, clock)
+    stats = planner.stats
+    frame_clock = pygame.time.Clock()
+    running = True
+    try:
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+
+            now = clock()
+            planner.push(feed.poll(now), now)
+            planner.advance()
+            x, y = planner.position_at(now)
+            renderer.draw_frame((x, y), ball.radius)
+            screen.blit(renderer.surface, (0, 0))
+            hud = [
+                f"t {now:6.2f} s  lookahead {args.lookahead * 1e3:.0f} ms  fps {frame_clock.get_fps():5.1f}",
+                f"notes {stats.hits}/{stats.notes}  missed {stats.missed}  unplanned {stats.unplanned}",
+                f"slack min {stats.slack.min * 1e3:6.1f} ms  mean {stats.slack.mean * 1e3:6.1f} ms",
+            ]
+            for k, line in enumerate(hud):
+                screen.blit(font.render(line, True, HUD_COLOR), (8, 8 + k * font.get_linesize()))
+            pygame.display.flip()
+            stats.present.update(clock() - now)
+
+            if args.duration is not None and now >= args.duration:
+                running = False
+            # 回放结束且最后一个音符已经显示后退出
+            if feed.finished and planner.idle and now > planner.last_note_time + 1.0:
+                running = False
+            stats.frame.update(frame_clock.tick(args.fps) / 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.close()
+        pygame.quit()
+
+    summary = stats.summary()
+    for key, value in summary.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.metrics is not None:
+        args.metrics.parent.mkdir(parents=True, exist_ok=True)
+        args.metrics.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        print(f"Metrics saved to {args.metrics}")
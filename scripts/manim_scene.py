@@ -1,6 +1,6 @@
 # pyright: standard
 import json
-import pickle
+from bisect import bisect_right
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List, cast
@@ -8,16 +8,20 @@ from typing import List, cast
 import _pre_init
 from manim import *  # pyright: ignore[reportWildcardImportFromLibrary]
 
-from src.boundary import EllipseBoundary
-from src.models.manim import CollisionEvent, MetaData, MetaEllipse, SimulationRecord
+from src.boundary import EllipseBoundary, PolygonBoundary, SDFBoundary
+from src.models.manim import CollisionEvent, MetaData, MetaEllipse, MetaPolygon, MetaSDF
+from src.particles import ParticleSystem, emit_shatter
+from src.record import load_record_arrays
 from src.utils.usable_class import Vec2
 
 
 @dataclass
 class Config:
-    pkl_file: str
+    record_file: str
     ball_color: str
     border_color: str
+    still_tail: bool = False  # 跳过末尾的静止等待，由 render_ball.py 在编码端补齐
+    markers: bool = False  # 草稿模式：在碰撞处短暂显示标记，音符碰撞与非音符碰撞颜色不同
 
     @classmethod
     def from_json(cls, path: Path) -> "Config":
@@ -29,12 +33,17 @@ class Config:
         return cls(**filtered)
 
 
+MARKER_TIME = 0.25  # 碰撞标记的显示时长 (s)，与 pygame 渲染器一致
+NOTE_MARKER_COLOR = GREEN
+BOUNCE_MARKER_COLOR = RED
+
 record_config = Config.from_json(_pre_init.PROJECT_ROOT / "scripts/config.tmp.json")
-with open(record_config.pkl_file, "rb") as f:
-    record: SimulationRecord = pickle.load(f)
+record_arrays = load_record_arrays(Path(record_config.record_file))
+# 多球记录按小球拆分，每个小球的元数据与碰撞流与单球记录相同
+records = [record_arrays.select_ball(k).to_record() for k in range(record_arrays.n_balls)]
 
-meta = record.meta
-collisions = record.collisions
+meta = records[0].meta
+collisions = records[0].collisions
 
 match meta.boundary.type:
     case "ellipse":
@@ -43,6 +52,18 @@ match meta.boundary.type:
         w, h = boundary.calc_manim_wh()
         config.frame_height = h
         config.frame_width = w
+    case "polygon":
+        meta.boundary = cast(MetaPolygon, meta.boundary)
+        boundary = PolygonBoundary.from_manim_meta(meta.boundary)
+        w, h = boundary.calc_manim_wh()
+        config.frame_height = h
+        config.frame_width = w
+    case "sdf":
+        meta.boundary = cast(MetaSDF, meta.boundary)
+        boundary = SDFBoundary.from_manim_meta(meta.boundary)
+        w, h = boundary.calc_manim_wh()
+        config.frame_height = h
+        config.frame_width = w
     case _:
         raise ValueError(f"Unknown boundary type: {meta.boundary.type}")
 
@@ -55,10 +76,32 @@ def vec2_to_point(v):
 
 class BouncingBallScene(Scene):
     def construct(self):
-        system = BallSystem(meta, record_config, collisions, self)
-        system.play()
-        system.close()
-        self.wait(meta.music_total_time + meta.prefix_free_time - collisions[-1].time)
+        if len(records) == 1:
+            system = BallSystem(meta, record_config, collisions, self)
+            system.play()
+            system.close()
+            self.wait_tail(collisions[-1].time)
+            return
+
+        # 边界只添加一次；各小球的运动一起播放，先结束的小球停在最后一次碰撞的位置，最后一起分裂
+        systems = [
+            BallSystem(r.meta, record_config, r.collisions, self, with_boundary=k == 0) for k, r in enumerate(records)
+        ]
+        end_time = max(system.collisions[-1].time for system in systems)
+        self.play(
+            *[
+                BallMotionAnimation(system.ball, system.trajectory, run_time=end_time, marker=system.marker)
+                for system in systems
+            ]
+        )
+        run_time = 2
+        self.play(*[system.shatter_animation(run_time) for system in systems], run_time=run_time)
+        self.wait_tail(end_time)
+
+    def wait_tail(self, end_time: float):
+        """分裂之后画面不再变化，逐帧渲染这段尾音没有意义，开启 still_tail 时交给编码端延长最后一帧"""
+        if not record_config.still_tail:
+            self.wait(meta.music_total_time + meta.prefix_free_time - end_time)
 
 
 @dataclass
@@ -112,25 +155,58 @@ class PiecewiseTrajectory:
 
 
 class BallMotionAnimation(Animation):
-    def __init__(self, ball: Mobject, trajectory: PiecewiseTrajectory, **kwargs):
+    def __init__(
+        self,
+        ball: Mobject,
+        trajectory: PiecewiseTrajectory,
+        run_time: float | None = None,
+        marker: Mobject | None = None,
+        **kwargs,
+    ):
+        self.ball = ball
         self.trajectory = trajectory
-        self.total_time = trajectory.collisions[-1].time
-        super().__init__(ball, run_time=self.total_time, **kwargs)
+        self.marker = marker
+        self.collision_times = [c.time for c in trajectory.collisions]
+        # run_time 长于轨迹时，小球停在最后一次碰撞的位置
+        self.total_time = trajectory.collisions[-1].time if run_time is None else run_time
+        # 只有动画的对象会逐帧重绘，标记需要与小球一起作为动画对象
+        super().__init__(ball if marker is None else Group(ball, marker), run_time=self.total_time, **kwargs)
 
     def interpolate(self, alpha: float):
         t = alpha * self.total_time
         pos = self.trajectory.position_at(t)
-        self.mobject.move_to(pos)
+        self.ball.move_to(pos)
+        if self.marker is not None:
+            self._update_marker(self.marker, t)
+
+    def _update_marker(self, marker: Mobject, t: float):
+        """标记最近一次碰撞，随时间淡出"""
+        k = bisect_right(self.collision_times, t) - 1
+        if k < 0 or t - self.collision_times[k] >= MARKER_TIME:
+            marker.set_stroke(opacity=0.0)
+            return
+        collision = self.trajectory.collisions[k]
+        color = NOTE_MARKER_COLOR if collision.is_note_event else BOUNCE_MARKER_COLOR
+        marker.move_to(vec2_to_point(collision.position))
+        marker.set_stroke(color=color, opacity=1.0 - (t - self.collision_times[k]) / MARKER_TIME)
 
 
 class BallSystem:
-    def __init__(self, meta: MetaData, record_config: Config, collisions: List[CollisionEvent], scene: Scene):
+    def __init__(
+        self,
+        meta: MetaData,
+        record_config: Config,
+        collisions: List[CollisionEvent],
+        scene: Scene,
+        with_boundary: bool = True,
+    ):
         self.meta = meta
         self.config = record_config
         self.collisions = collisions
         self.scene = scene
 
-        self._build_boundary()
+        if with_boundary:
+            self._build_boundary()
         self._build_ball()
         self.trajectory = PiecewiseTrajectory(
             Vec2.from_tuple(self.meta.ball.initial_pos),
@@ -154,18 +230,20 @@ class BallSystem:
         self.ball.move_to(vec2_to_point(self.meta.ball.initial_pos))
         self.scene.add(self.ball)
 
+        self.marker: Mobject | None = None
+        if self.config.markers:
+            self.marker = Circle(radius=self.meta.ball.radius * 1.6, stroke_width=3, stroke_opacity=0.0)
+            self.scene.add(self.marker)
+
     def play(self):
-        self.scene.play(BallMotionAnimation(self.ball, self.trajectory))
+        self.scene.play(BallMotionAnimation(self.ball, self.trajectory, marker=self.marker))
 
     def close(self, run_time: float = 2):
         """让主球分裂成多个小球并逐渐消失"""
+        self.scene.play(self.shatter_animation(run_time), run_time=run_time)
 
-        def sample_in_disc(radius: float) -> np.ndarray:
-            u = np.random.rand()
-            v = np.random.rand()
-            r = radius * np.sqrt(u)
-            theta = 2 * np.pi * v
-            return np.array([r * np.cos(theta), r * np.sin(theta), 0.0])
+    def shatter_animation(self, run_time: float = 2) -> Animation:
+        """分裂的动画，碎片在调用时即加入场景，便于与其他小球的分裂一起播放"""
 
         def tanh_cap(v, vmax):
             s = np.linalg.norm(v)
@@ -173,34 +251,33 @@ class BallSystem:
                 return v
             return v / s * vmax * np.tanh(s / vmax)
 
-        # 生成分裂小球
-        pieces: List[Mobject] = []
-        n_pieces = 8
-        R = self.ball.radius
-        piece_radius = R / (n_pieces**0.5)
+        # 碎片的状态保存在粒子系统的数组中，由一个动画统一推进
+        particles = ParticleSystem(capacity=8)
+        vel_ball = tanh_cap(vec2_to_point(self.meta.ball.final_vel), min(config.frame_height, config.frame_width) / 3)
+        center = self.ball.get_center()[:2]
+        # 碎片颜色由下面的 mobject 决定，粒子系统中的颜色不使用
+        idx = emit_shatter(particles, center, vel_ball[:2], self.ball.radius, (0, 0, 0), run_time=run_time)
 
-        for _ in range(n_pieces):
-            offset = sample_in_disc(R - piece_radius)
-            piece = Circle(radius=piece_radius, color=self.ball.get_color(), fill_opacity=1.0)
-            piece.move_to(self.ball.get_center() + offset)
-            self.scene.add(piece)
-            pieces.append(piece)
+        pieces = VGroup(
+            *[Circle(radius=particles.radius[i], color=self.ball.get_color(), fill_opacity=1.0) for i in idx]
+        )
+        for piece, i in zip(pieces, idx):
+            piece.move_to(vec2_to_point(particles.pos[i]))
+        self.scene.add(pieces)
 
-        # 隐藏原球
+        # 隐藏原球与最后一次碰撞的标记
         self.ball.set_opacity(0.0)
+        if self.marker is not None:
+            self.marker.set_stroke(opacity=0.0)
 
-        # 随机方向和速度
-        vel_ball = vec2_to_point(self.meta.ball.final_vel)
-        vel_ball = tanh_cap(vel_ball, min(config.frame_height, config.frame_width) / 3)
-        angles = np.random.uniform(0, 2 * np.pi, n_pieces)
-        speeds = np.random.uniform(0.5, 1.5, n_pieces)
-        velocities = [vel_ball + np.array([np.cos(a), np.sin(a), 0]) * s for a, s in zip(angles, speeds)]
+        last_alpha = 0.0
 
-        # 播放动画
-        self.scene.play(
-            *[
-                piece.animate.move_to(piece.get_center() + vel).set_opacity(0.0)
-                for piece, vel in zip(pieces, velocities)
-            ],
-            run_time=run_time,
-        )
+        def update_pieces(group: VGroup, alpha: float):
+            nonlocal last_alpha
+            particles.update((alpha - last_alpha) * run_time)
+            last_alpha = alpha
+            opacity = 1.0 - alpha
+            for piece, p in zip(group, particles.pos[idx]):
+                piece.move_to(vec2_to_point(p)).set_opacity(opacity)
+
+        return UpdateFromAlphaFunc(pieces, update_pieces, run_time=run_time)
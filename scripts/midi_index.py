@@ -0,0 +1,37 @@
+# pyright: standard
+"""
+更新并查询曲库索引，例如：
+
+    python scripts/midi_index.py "n_onsets >= 200 and min_gap >= 0.12" --sort min_gap --desc
+"""
+import argparse
+
+import _pre_init
+from rich import print
+from rich.table import Table
+
+from src.midi_index import IOI_QUANTILES, MidiIndex
+
+SHOWN_COLUMNS = ["midi", "track", "name", "program", "n_onsets", "duration", "min_gap", "ioi_p50"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "query", nargs="?", default=None, help='Conditions joined by "and", e.g. "n_onsets >= 200 and min_gap >= 0.12"'
+    )
+    parser.add_argument("--sort", type=str, default=None, help="Column to sort by")
+    parser.add_argument("--desc", action="store_true", help="Sort in descending order")
+    parser.add_argument("--limit", type=int, default=None, help="Show at most this many tracks")
+    parser.add_argument("--no-update", action="store_true", help="Query the index as it is, without rescanning")
+    args = parser.parse_args()
+
+    index = MidiIndex.load()
+    if not args.no_update:
+        index.update(verbose=True).save()
+    result = index.query(args.query, sort=args.sort, descending=args.desc)
+
+    table = Table(*SHOWN_COLUMNS)
+    for row in result.rows()[: args.limit]:
+        table.add_row(*[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in SHOWN_COLUMNS])
+    print(table)
+    print(f"{len(result)}/{len(index)} tracks, IOI quantiles: {', '.join(f'ioi_p{q}' for q in IOI_QUANTILES)}")
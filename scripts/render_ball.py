@@ -3,75 +3,178 @@
 调用 Manim 进行视频渲染，内存占用方面可能表现不佳
 """
 import argparse
+import inspect
 import json
-import pickle
+import math
 import shutil
-import subprocess
 import sys
+from itertools import product
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 import _pre_init
 from rich import print
 
-from src.models.manim import SimulationRecord
+from src.manifest import Manifest, hash_json
+from src.pipeline import DRAFT_DIR, DRAFT_FPS, DRAFT_SIZE, mux_cached_audio
+from src.record import (
+    RECORD_SUFFIX,
+    find_latest_record,
+    is_legacy_pickle,
+    load_record_arrays,
+    save_record,
+    video_stem,
+)
+from src.still import append_still, last_frame
+from src.supervisor import Stage, run_stage
 
 SCENE_SCRIPT = _pre_init.PROJECT_ROOT / "scripts/manim_scene.py"
+# 与 Manim 输出一致的编码参数，静止片段据此编码后直接拼接
+MANIM_WRITER_KWARGS = {"codec": "libx264", "quality": None, "output_params": ["-crf", "23"], "macro_block_size": 1}
 
 
-def find_latest_pkl() -> Path:
-    outputs = _pre_init.PROJECT_ROOT / "outputs"
+def build_variants_command(source: Path, variants: List[Tuple[Path, int, int]]) -> List[str]:
+    """
+    构建从一个渲染结果一次性导出多个 (size, fps) 版本的 ffmpeg 命令
 
-    pkl_files = list(outputs.rglob("bounce_history.pkl"))
+    源视频只解码一次，经 split 分给各版本分别缩放、按各自的时间点取帧，各版本的编码器并行执行
 
-    if not pkl_files:
-        raise FileNotFoundError(f"No .pkl files found in {outputs}")
-
-    # 按修改时间排序，取最新
-    return max(pkl_files, key=lambda p: p.stat().st_mtime)
+    Args:
+        source (Path): 尺寸与帧率都不低于各版本的源视频
+        variants (List[Tuple[Path, int, int]]): 各版本的 (输出路径, 边长, 帧率)
+    """
+    labels = [f"v{k}" for k in range(len(variants))]
+    filters = [f"[0:v]split={len(variants)}" + "".join(f"[s{k}]" for k in range(len(variants)))]
+    for k, (_, size, fps) in enumerate(variants):
+        filters.append(f"[s{k}]scale={size}:{size}:flags=area,fps={fps}[{labels[k]}]")
+    cmd = ["ffmpeg", "-i", source.as_posix(), "-filter_complex", ";".join(filters)]
+    for label, (path, _, _) in zip(labels, variants):
+        cmd += ["-map", f"[{label}]", "-c:v", "libx264", "-crf", "23", "-pix_fmt", "yuv420p", path.as_posix()]
+    return cmd + ["-y"]
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", type=Path, help="Path to the input pkl file")
+    parser.add_argument("-i", "--input", type=Path, help="Path to the input record file (.rec, or legacy .pkl)")
     parser.add_argument("--ball_color", type=str, default="BLUE")
     parser.add_argument("--border_color", type=str, default="GREY")
-    parser.add_argument("--size", type=int, default=960, help="Pixel size of the rendered video")
-    parser.add_argument("--fps", "--frame_rate", type=int, default=30, help="Frame rate of the rendered video")
+    parser.add_argument("--size", type=int, nargs="+", help="Pixel size(s) of the rendered video (default: 960)")
+    parser.add_argument("--fps", "--frame_rate", type=int, nargs="+", help="Frame rate(s) of the video (default: 30)")
+    parser.add_argument("--force", action="store_true", help="Render even if the video is up to date")
+    parser.add_argument(
+        "--full_tail", action="store_true", help="Render the static tail after the last collision frame by frame"
+    )
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help=f"Quick preview: {DRAFT_SIZE}p{DRAFT_FPS} by default, collision markers, stored under {DRAFT_DIR}/",
+    )
+    parser.add_argument("--audio", action="store_true", help="Mux the already synthesized WAV into the draft")
+    parser.add_argument("--timeout", type=float, default=None, help="Give up the Manim render after this many seconds")
     args, unknown = parser.parse_known_args()
+    if args.audio and not args.draft:
+        parser.error("--audio is only available for --draft renders, use combine_video.py otherwise")
+    args.size = args.size or [DRAFT_SIZE if args.draft else 960]
+    args.fps = args.fps or [DRAFT_FPS if args.draft else 30]
 
-    pkl_file = find_latest_pkl() if args.input is None else args.input
+    record_file = find_latest_record(_pre_init.PROJECT_ROOT / "outputs") if args.input is None else args.input
     config_data = {
         "_comment": "This is a dynamic configuration file generated by `scripts/render_ball.py`",
-        "pkl_file": pkl_file.as_posix(),
+        "record_file": record_file.as_posix(),
         "ball_color": args.ball_color,
         "border_color": args.border_color,
+        "still_tail": not args.full_tail,
+        "markers": args.draft,
     }
     with open(_pre_init.PROJECT_ROOT / "scripts/config.tmp.json", "w", encoding="utf-8") as f:
         json.dump(config_data, f, indent=2)
 
-    with open(pkl_file, "rb") as f:
-        record: SimulationRecord = pickle.load(f)
+    record = load_record_arrays(record_file)
 
     sys.argv = [sys.argv[0]] + unknown
-    output_file = (
-        _pre_init.PROJECT_ROOT
-        / f"manim-videos"
-        / f"{Path(record.meta.midi_file).stem}-{record.meta.inst_idx}"
-        / f"{args.size}p{args.fps}.mp4"
-    )
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    if pkl_file.resolve() == output_file.with_suffix(".pkl").resolve():
-        pass
-    else:
-        shutil.copy2(pkl_file, output_file.with_suffix(".pkl"))
-
-    manim_cmd = (
-        ["manim"]
-        + [SCENE_SCRIPT.as_posix(), "BouncingBallScene"]
-        + unknown
-        + ["--resolution", f"{args.size},{args.size}"]
-        + ["--fps", str(args.fps)]
-        + ["--output_file", output_file.as_posix()]
-    )
-    print(f"Running command: '{" ".join(manim_cmd)}'")
-    subprocess.run(manim_cmd)
+    video_dir = _pre_init.PROJECT_ROOT / "manim-videos" / video_stem(record.meta)
+    if args.draft:  # 草稿单独存放，不会被 combine_video.py 当作正式渲染
+        video_dir = video_dir / DRAFT_DIR
+    video_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = Manifest()
+    record_hash = manifest.hash_file(record_file)
+    scene_hash = manifest.hash_file(SCENE_SCRIPT)
+    still_hash = manifest.hash_file(Path(inspect.getfile(append_still)))  # 分裂之后的静止尾段由 still.py 生成
+
+    def render_inputs(size: int, fps: int) -> Dict[str, str]:
+        settings = {
+            "renderer": "manim",
+            "size": size,
+            "fps": fps,
+            "ball_color": args.ball_color,
+            "border_color": args.border_color,
+            "full_tail": args.full_tail,
+            "draft": args.draft,
+            "audio": args.audio,
+            "extra_args": unknown,
+        }
+        return {"record": record_hash, "scene": scene_hash, "still": still_hash, "settings": hash_json(settings)}
+
+    # Manim 只渲染最大尺寸、最高帧率的一版，其余版本由它缩放、抽帧得到
+    sizes, fps_list = list(dict.fromkeys(args.size)), list(dict.fromkeys(args.fps))
+    source_size, source_fps = max(sizes), max(fps_list)
+    output_file = video_dir / f"{source_size}p{source_fps}.mp4"
+    outdated: List[Tuple[Path, int, int]] = []
+    for size, fps in product(sizes, fps_list):
+        video_file = video_dir / f"{size}p{fps}.mp4"
+        if not args.force and manifest.lookup("render", render_inputs(size, fps)) == video_file:
+            print(f"Video is up to date: {video_file}")
+        else:
+            outdated.append((video_file, size, fps))
+    if not outdated:
+        sys.exit(0)
+
+    for video_file, _, _ in outdated:
+        if record_file.resolve() == video_file.with_suffix(RECORD_SUFFIX).resolve():
+            pass
+        elif record_file.suffix == RECORD_SUFFIX and not is_legacy_pickle(record_file):
+            shutil.copy2(record_file, video_file.with_suffix(RECORD_SUFFIX))
+        else:  # 旧版记录或中断仿真留下的 .part 文件顺带转换为列式格式
+            save_record(record, video_file.with_suffix(RECORD_SUFFIX))
+
+    first_time = float(record.time[0]) if len(record) else 0.0
+
+    def finish(videos: List[Tuple[Path, int, int]]) -> None:
+        if args.audio and mux_cached_audio([v for v, _, _ in videos], record.meta, first_time) is None:
+            print("[yellow]No synthesized WAV found under assets/wav, run combine_video.py once to create it[/yellow]")
+        for video_file, size, fps in videos:
+            manifest.record("render", render_inputs(size, fps), video_file)
+
+    source_inputs = render_inputs(source_size, source_fps)
+    if args.force or manifest.lookup("render", source_inputs) != output_file:
+        manim_cmd = (
+            ["manim"]
+            + [SCENE_SCRIPT.as_posix(), "BouncingBallScene"]
+            + unknown
+            + ["--resolution", f"{source_size},{source_size}"]
+            + ["--fps", str(source_fps)]
+            + ["--output_file", output_file.as_posix()]
+        )
+        print(f"Running command: '{" ".join(manim_cmd)}'")
+        manim_stage = Stage(
+            "manim", manim_cmd, kind="manim", timeout=args.timeout, tags={"output": output_file.as_posix()}
+        )
+        if run_stage(manim_stage, check=False).status != "ok" or not output_file.exists():
+            sys.exit(1)
+        if not args.full_tail:
+            # 场景在分裂结束后停止，剩余的尾音用最后一帧补齐，时长与逐帧渲染时相同
+            meta = record.meta
+            tail = meta.music_total_time + meta.prefix_free_time - float(record.time.max(initial=0.0))
+            n_frames = math.ceil(tail * source_fps - 1e-9)
+            append_still(output_file, last_frame(output_file), n_frames, source_fps, **MANIM_WRITER_KWARGS)
+        finish([(output_file, source_size, source_fps)])
+
+    variants = [v for v in outdated if v[0] != output_file]
+    if variants:
+        ffmpeg_cmd = build_variants_command(output_file, variants)
+        print(f"Running command: '{' '.join(ffmpeg_cmd)}'")
+        variants_stage = Stage("variants", ffmpeg_cmd, kind="ffmpeg", tags={"output": output_file.as_posix()})
+        if run_stage(variants_stage, check=False).status != "ok":
+            sys.exit(1)
+        finish(variants)
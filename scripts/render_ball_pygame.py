@@ -2,118 +2,119 @@
 from __future__ import annotations
 
 import argparse
-import pickle
+import shutil
+from itertools import product
 from pathlib import Path
 
 import _pre_init
-import imageio
-import numpy as np
-import tqdm
 from rich import print
 
-from scripts.pygame_renderer import Renderer
-from src.models.manim import SimulationRecord
-from src.utils.usable_class import Vec2
-
-
-def find_latest_pkl() -> Path:
-    outputs = _pre_init.PROJECT_ROOT / "outputs"
-    pkl_files = list(outputs.rglob("bounce_history.pkl"))
-    if not pkl_files:
-        raise FileNotFoundError("No .pkl files found in outputs")
-    return max(pkl_files, key=lambda p: p.stat().st_mtime)
+from src import particles, pygame_renderer, render_cache, still, trajectory
+from src.manifest import Manifest, hash_json
+from src.pipeline import DRAFT_DIR, DRAFT_FPS, DRAFT_PRESET, DRAFT_SIZE, mux_cached_audio
+from src.pygame_renderer import VideoOutput, render_videos
+from src.record import (
+    RECORD_SUFFIX,
+    find_latest_record,
+    is_legacy_pickle,
+    load_record_arrays,
+    save_record,
+    video_stem,
+)
+from src.render_cache import ChunkCache
+from src.supervisor import measure
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", type=Path, help="path to pkl file")
-    parser.add_argument("--size", type=int, default=960)
-    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("-i", "--input", type=Path, help="path to record file (.rec, or legacy .pkl)")
+    parser.add_argument("--size", type=int, nargs="+", help="one or more sizes, rendered in one pass (default: 960)")
+    parser.add_argument("--fps", type=int, nargs="+", help="one or more frame rates (default: 30)")
+    parser.add_argument("--sparks", action="store_true", help="emit a spark burst at every collision")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the particle effects")
+    parser.add_argument("--force", action="store_true", help="render even if the video is up to date")
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help=f"quick preview: {DRAFT_SIZE}p{DRAFT_FPS} by default, {DRAFT_PRESET} encoding, collision markers",
+    )
+    parser.add_argument("--audio", action="store_true", help="mux the already synthesized WAV into the draft")
+    parser.add_argument(
+        "--no_chunk_cache", action="store_true", help="render in one pass without the chunk cache in .cache/render"
+    )
     args = parser.parse_args()
+    if args.audio and not args.draft:
+        parser.error("--audio is only available for --draft renders, use combine_video.py otherwise")
+    sizes = args.size or [DRAFT_SIZE if args.draft else 960]
+    fps_list = args.fps or [DRAFT_FPS if args.draft else 30]
 
-    pkl_path = find_latest_pkl() if args.input is None else args.input
-    with open(pkl_path, "rb") as f:
-        record: SimulationRecord = pickle.load(f)
+    record_path = find_latest_record(_pre_init.PROJECT_ROOT / "outputs") if args.input is None else args.input
+    record = load_record_arrays(record_path)
 
     meta = record.meta
-    # The pickle stores Q = [[Q11,Q12],[Q21,Q22]] describing the region the
-    # ball center is allowed to move in. We only support circles here.
-    try:
-        meta_b = meta.boundary
-        Q11 = float(getattr(meta_b, "Q11"))
-        Q12 = float(getattr(meta_b, "Q12"))
-        Q21 = float(getattr(meta_b, "Q21"))
-        Q22 = float(getattr(meta_b, "Q22"))
-
-        # require axis-aligned (Q12/Q21 ~= 0) and equal radii (circle)
-        eps = 1e-6
-        a = 1.0 / (Q11**0.5)
-        b = 1.0 / (Q22**0.5)
-        if abs(a - b) > eps or abs(Q12) > eps or abs(Q21) > eps:
-            raise NotImplementedError("Only circular boundaries are supported; found an ellipse")
-
-        # pkl stores center-restricted radius a; visual boundary should add the ball radius
-        ball_r = float(meta.ball.radius)
-        outer_r = a + ball_r
-        world_w = world_h = 2.0 * outer_r
-    except NotImplementedError:
-        raise
-    except Exception:
-        # fallback conservative size
-        world_w, world_h = 6.0, 6.0
-
-    renderer = Renderer(args.size, args.size, world_w, world_h)
-
-    duration = meta.music_total_time + meta.prefix_free_time
-    fps = args.fps
-    n_frames = max(1, int(duration * fps))
-
-    out_dir = _pre_init.PROJECT_ROOT / "manim-videos" / f"{Path(meta.midi_file).stem}-{meta.inst_idx}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_file = out_dir / f"{args.size}p{fps}.mp4"
-
-    writer = imageio.get_writer(out_file.as_posix(), fps=fps, codec="libx264", quality=8)
-
-    collisions = record.collisions
-
-    def ball_pos_at(t: float):
-        if not collisions:
-            p0 = Vec2.from_tuple(meta.ball.initial_pos)
-            v0 = Vec2.from_tuple(meta.ball.initial_vel)
-            acc = Vec2.from_tuple(meta.ball.acc)
-            pos = p0 + v0 * t + acc * (0.5 * t * t)
-            return np.array([pos.x, pos.y])
-
-        segs = []
-        segs.append(
-            (0.0, collisions[0].time, Vec2.from_tuple(meta.ball.initial_pos), Vec2.from_tuple(meta.ball.initial_vel))
+    out_dir = _pre_init.PROJECT_ROOT / "manim-videos" / video_stem(meta)
+    if args.draft:  # 草稿单独存放，不会被 combine_video.py 当作正式渲染
+        out_dir = out_dir / DRAFT_DIR
+
+    manifest = Manifest()
+    record_hash = manifest.hash_file(record_path)
+    renderer_hash = hash_json(
+        [
+            manifest.hash_file(Path(m.__file__))  # type: ignore
+            for m in (pygame_renderer, particles, trajectory, still, render_cache)
+        ]
+    )
+    # 每个 (size, fps) 组合单独登记，只重新渲染过期的那些
+    pending = []
+    for size, fps in product(dict.fromkeys(sizes), dict.fromkeys(fps_list)):
+        out_file = out_dir / f"{size}p{fps}.mp4"
+        inputs = {
+            "record": record_hash,
+            "renderer": renderer_hash,
+            "settings": hash_json(
+                {
+                    "renderer": "pygame",
+                    "size": size,
+                    "fps": fps,
+                    "sparks": args.sparks,
+                    "seed": args.seed,
+                    "draft": args.draft,
+                    "audio": args.audio,
+                }
+            ),
+        }
+        if not args.force and manifest.lookup("render", inputs) == out_file:
+            print(f"Video is up to date: {out_file}")
+            continue
+        pending.append((VideoOutput(out_file, size, fps), inputs))
+    if not pending:
+        return
+
+    with measure("render", {"outputs": [output.path.as_posix() for output, _ in pending]}):
+        render_videos(
+            record,
+            [output for output, _ in pending],
+            sparks=args.sparks,
+            seed=args.seed,
+            markers=args.draft,
+            preset=DRAFT_PRESET if args.draft else None,
+            cache=None if args.no_chunk_cache else ChunkCache(),
         )
-        for c in collisions:
-            segs[-1] = (segs[-1][0], c.time, segs[-1][2], segs[-1][3])
-            segs.append((c.time, float("inf"), Vec2.from_tuple(c.position), Vec2.from_tuple(c.velocity_after)))
-
-        for t0, t1, p0, v0 in segs:
-            if t0 <= t <= t1:
-                dt = t - t0
-                pos = p0 + v0 * dt + Vec2(0.5 * meta.ball.acc[0] * dt * dt, 0.5 * meta.ball.acc[1] * dt * dt)
-                return np.array([pos.x, pos.y])
-
-        last = segs[-1]
-        dt = last[1] - last[0]
-        p0, v0 = last[2], last[3]
-        pos = p0 + v0 * dt + Vec2(0.5 * meta.ball.acc[0] * dt * dt, 0.5 * meta.ball.acc[1] * dt * dt)
-        return np.array([pos.x, pos.y])
-
-    try:
-        for i in tqdm.tqdm(range(n_frames), desc="Rendering frames"):
-            t = i / fps
-            pos = ball_pos_at(t)
-            img = renderer.render_frame((float(pos[0]), float(pos[1])), meta.ball.radius, pieces=[])
-            writer.append_data(img)
-    finally:
-        writer.close()
-
-    print(f"Wrote {out_file}")
+    for output, _ in pending:
+        # 与 render_ball.py 一致，在视频旁保存记录，combine_video.py 据此对齐音频
+        record_copy = output.path.with_suffix(RECORD_SUFFIX)
+        if record_path.resolve() == record_copy.resolve():
+            pass
+        elif record_path.suffix == RECORD_SUFFIX and not is_legacy_pickle(record_path):
+            shutil.copy2(record_path, record_copy)
+        else:  # 旧版记录或中断仿真留下的 .part 文件顺带转换为列式格式
+            save_record(record, record_copy)
+    first_time = float(record.time[0]) if len(record) else 0.0
+    if args.audio and mux_cached_audio([output.path for output, _ in pending], meta, first_time) is None:
+        print("[yellow]No synthesized WAV found under assets/wav, run combine_video.py once to create it[/yellow]")
+    for output, inputs in pending:
+        manifest.record("render", inputs, output.path)
+        print(f"Wrote {output.path}")
 
 
 if __name__ == "__main__":
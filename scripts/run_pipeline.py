@@ -0,0 +1,35 @@
+# pyright: standard
+"""
+以 Hydra 为前端调用进程内的完整流程，剩余参数作为 Hydra 覆盖项，例如：
+
+    python scripts/run_pipeline.py --size 480 boundary=default_ellipse music.inst_idx=1
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import cast
+
+import _pre_init
+from hydra import compose, initialize_config_dir
+from rich import print
+
+from src.models import Config  # 导入时注册 Hydra 配置模式，compose 才能找到 *_schema
+from src.pipeline import AUDIO_BACKENDS, run_pipeline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=960, help="Pixel size of the rendered video")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of the rendered video")
+    parser.add_argument("-s", "--soundfont", type=Path, default=None, help="SoundFont file path")
+    parser.add_argument(
+        "--audio", choices=AUDIO_BACKENDS, default="fluidsynth", help="Synthesize the MIDI, or an impact per bounce"
+    )
+    args, overrides = parser.parse_known_args()
+
+    with initialize_config_dir(version_base=None, config_dir=(_pre_init.ASSETS_PATH / "conf").as_posix()):
+        cfg = compose(config_name="config", overrides=overrides)
+
+    result = run_pipeline(
+        cast(Config, cfg), size=args.size, fps=args.fps, soundfont_path=args.soundfont, audio=args.audio
+    )
+    print(json.dumps({k: round(v, 3) for k, v in result.timings.items()}, indent=2))
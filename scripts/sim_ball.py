@@ -1,151 +1,180 @@
-import pickle
+import shutil
 from pathlib import Path
-from typing import List, cast
+from typing import Any, Dict, cast
 
 import _pre_init
 import hydra
 import numpy as np
 from hydra.core.hydra_config import HydraConfig
-from jaxtyping import Float
+from omegaconf import OmegaConf
 from rich import print
 
-from src.body import Ball
-from src.boundary import CircleBoundary, EllipseBoundary
-from src.midi import NoteRecord
-from src.models import CollisionEvent, Config, MetaData, SimulationRecord
-from src.models.hydra import CircleConfig, EllipseConfig
-from src.simulator import Simulator
-from src.utils.usable_class import OnlineStats, PeekableIterator, Vec2
+import src.body
+import src.boundary
+import src.checkpoint
+import src.midi
+import src.onset
+import src.planner
+import src.polyphony
+import src.record
+import src.simulator
+import src.utils.broadphase
+import src.utils.bvh
+import src.utils.sdf
+import src.utils.usable_class
+from src.manifest import Manifest, hash_json
+from src.models import Config
+from src.planner import new_checkpoint_log, prepare_resume, prepare_simulation, run_simulation
+from src.polyphony import polyphony_enabled, prepare_polyphonic_simulation, run_polyphonic_simulation
+from src.profiler import PROFILE_FILENAME, Profiler
+from src.record import RECORD_FILENAME, RecordWriter, find_latest_record, load_record_arrays
+from src.supervisor import measure
+from src.telemetry import TELEMETRY_FILENAME, TelemetryMode, TelemetryRecorder
+from src.utils.sdf import resolve_shape_path
+from src.utils.usable_class import OnlineStats
 
 stats_vel = OnlineStats()
 stats_err = OnlineStats()
 
+# 决定仿真结果的源码：仿真器、规划器、边界与音符提取等改动后，旧记录不再复用
+SIM_MODULES = (
+    src.body,
+    src.boundary,
+    src.checkpoint,
+    src.midi,
+    src.onset,
+    src.planner,
+    src.polyphony,
+    src.record,
+    src.simulator,
+    src.utils.broadphase,
+    src.utils.bvh,
+    src.utils.sdf,
+    src.utils.usable_class,
+)
+
+
+def sim_inputs(manifest: Manifest, midi_path: Path, cfg: Config) -> Dict[str, str]:
+    """仿真阶段的输入：MIDI 内容、解析后的完整配置、仿真相关的源码，以及距离场边界的形状文件"""
+    resolved = cast(Dict[str, Any], OmegaConf.to_container(cfg, resolve=True))
+    # 这些选项不影响仿真结果
+    resolved["simulation"].pop("force", None)
+    resolved["simulation"].pop("profile", None)
+    resolved["simulation"].pop("telemetry", None)
+    resolved["simulation"].pop("resume_from", None)  # 从检查点继续的结果与从头仿真一致
+    inputs = {
+        "midi": manifest.hash_file(midi_path),
+        "config": hash_json(resolved),
+        "simulator": hash_json([manifest.hash_file(Path(m.__file__)) for m in SIM_MODULES]),  # type: ignore
+    }
+    if cfg.boundary.type == "sdf":
+        inputs["shape"] = manifest.hash_file(resolve_shape_path(resolved["boundary"]["source"]))
+    return inputs
+
+
+def simulate_polyphony(cfg: Config, midi_path: Path, output_path: Path, manifest: Manifest, inputs: Dict[str, str]):
+    """多球仿真：检查点、断点续算与遥测只支持单球，此处忽略"""
+    if cfg.simulation.resume_from is not None:
+        print("[yellow]Resuming is not supported for polyphonic scenes, simulating from scratch.[/yellow]")
+    if cfg.simulation.telemetry.enabled:
+        print("[yellow]Telemetry is not supported for polyphonic scenes, skipping.[/yellow]")
+    simulator, midi, res, voices = prepare_polyphonic_simulation(cfg, midi_path)
+    print(f"Simulating {len(voices)} balls, notes per ball: {[len(v) for v in voices]}")
+    writer = RecordWriter(output_path, res.meta)
+    profiler = None
+    if cfg.simulation.profile:
+        profiler = Profiler()
+        profiler.instrument(simulator)
+
+    completed = False
+    try:
+        with measure("simulate", {"midi": cfg.music.midi}):
+            completed = run_polyphonic_simulation(simulator, midi, voices, res, stats_vel, stats_err, profiler, writer)
+        print("Simulation completed.")
+    finally:
+        print("Ball velocity statistics (m/s):", end=" ")
+        stats_vel.print_stats()
+        print("Collision error statistics (s):", end=" ")
+        stats_err.print_stats()
+        writer.finalize(res.meta, None)
+        arrays = load_record_arrays(output_path)
+        print(f"Non-note collision: {np.count_nonzero(~arrays.is_note_event)}/{len(arrays.is_note_event)}")
+        print(f"Bounce history saved to {output_path}")
+        if profiler is not None:
+            print(f"Profile saved to {profiler.save(output_path.with_name(PROFILE_FILENAME))}")
+        if completed:
+            manifest.record("sim", inputs, output_path)
+
 
 @hydra.main(version_base=None, config_path=(_pre_init.ASSETS_PATH / "conf").as_posix(), config_name="config")
 def main(cfg: Config):
-    ball = Ball(
-        pos=Vec2.from_hydra(cfg.ball.pos),
-        vel=Vec2.from_hydra(cfg.ball.vel),
-        acc=Vec2.from_hydra(cfg.ball.acc),
-        radius=cfg.ball.radius,
-    )
-    match cfg.boundary.type:
-        case "circle":
-            cfg.boundary = cast(CircleConfig, cfg.boundary)
-            boundary = CircleBoundary(
-                center=Vec2(0, 0),
-                radius=cfg.boundary.radius,
-                restitution=cfg.boundary.restitution,
-            )
-        case "ellipse":
-            print(
-                "[bold yellow][WARN][/bold yellow]",
-                "[yellow]The results of elliptical boundary may not be optimal.[/yellow]",
-            )
-            cfg.boundary = cast(EllipseConfig, cfg.boundary)
-            boundary = EllipseBoundary.from_ab(
-                center=Vec2(0, 0),
-                a=cfg.boundary.a,
-                b=cfg.boundary.b,
-                restitution=cfg.boundary.restitution,
-            )
-        case _:
-            raise ValueError(f"Unknown boundary type: {cfg.boundary.type}")
-
-    simulator = Simulator(ball, boundary)
-    dt = cfg.simulation.dt
-
-    midi = NoteRecord(_pre_init.ASSETS_PATH / "midi" / cfg.music.midi)
-    iter_notes = PeekableIterator(midi.notes[cfg.music.inst_idx])
-    res = SimulationRecord(
-        meta=MetaData(
-            ball=ball.to_manim_meta(),
-            boundary=boundary.to_manim_meta(),
-            dt=dt,
-            midi_file=midi.path.as_posix(),
-            inst_idx=cfg.music.inst_idx,
+    midi_path = _pre_init.ASSETS_PATH / "midi" / cfg.music.midi
+    output_path = Path(HydraConfig.get().runtime.output_dir) / RECORD_FILENAME
+    manifest = Manifest()
+    inputs = sim_inputs(manifest, midi_path, cfg)
+    cached = manifest.lookup("sim", inputs)
+    telemetry_cfg = cfg.simulation.telemetry
+    if cached is not None and not cfg.simulation.force and not cfg.simulation.profile and not telemetry_cfg.enabled:
+        # 复制而非保留原修改时间，使其仍是 outputs/ 下最新的记录；指定 hydra.run.dir 时可能就是同一个文件
+        if cached.resolve() != output_path.resolve():
+            shutil.copyfile(cached, output_path)
+        print(f"Simulation is up to date, reusing {cached}")
+        return
+
+    if polyphony_enabled(cfg.polyphony):
+        simulate_polyphony(cfg, midi_path, output_path, manifest, inputs)
+        return
+
+    simulator, midi, res = prepare_simulation(cfg, midi_path)
+    previous = None
+    if cfg.simulation.resume_from is not None:
+        resume_path = (
+            find_latest_record(_pre_init.PROJECT_ROOT / "outputs")
+            if cfg.simulation.resume_from == "latest"
+            else Path(cfg.simulation.resume_from)
+        )
+        print(f"Checking {resume_path} for reusable checkpoints")
+        previous = load_record_arrays(resume_path)
+    # 碰撞与检查点边仿真边写入 .part 行文件，内存占用与输入长度无关，被强制终止时也能留下可用的部分记录
+    writer = RecordWriter(output_path, res.meta)
+    if previous is None:
+        checkpoints = new_checkpoint_log(writer) if cfg.simulation.checkpoints else None
+    else:
+        checkpoints = prepare_resume(previous, midi, res, writer)
+    profiler = None
+    if cfg.simulation.profile:
+        profiler = Profiler()
+        profiler.instrument(simulator)
+    telemetry = None
+    if telemetry_cfg.enabled:
+        telemetry = TelemetryRecorder(
+            capacity=telemetry_cfg.capacity,
+            decimation=telemetry_cfg.decimation,
+            mode=cast(TelemetryMode, telemetry_cfg.mode),
         )
-    )
 
+    completed = False
     try:
-        generate_bounce_record(simulator, dt, iter_notes, res)
-    except StopIteration:
+        with measure("simulate", {"midi": cfg.music.midi}):
+            completed = run_simulation(
+                simulator, midi, res, stats_vel, stats_err, profiler, telemetry, checkpoints, writer
+            )
         print("Simulation completed.")
     finally:
-        res.meta.ball.final_vel = simulator.ball_vel_before_collision.as_tuple
-        res.meta.music_total_time = midi.duration
-        res.meta.prefix_free_time = res.collisions[0].time if res.collisions else 0.0
         print("Ball velocity statistics (m/s):", end=" ")
         stats_vel.print_stats()
         print("Collision error statistics (s):", end=" ")
         stats_err.print_stats()
-        print(f"Non-note collision: {len([c for c in res.collisions if not c.is_note_event])}/{len(res.collisions)}")
-        output_path = Path(HydraConfig.get().runtime.output_dir) / "bounce_history.pkl"
-        with open(output_path, "wb") as f:
-            pickle.dump(res, f)
-            print(f"Bounce history saved to {output_path}")
-
-
-def generate_bounce_record(
-    simulator: Simulator,
-    dt: float,
-    iter_notes: PeekableIterator[float],
-    res: SimulationRecord,
-):
-    e_history: List[Float[np.ndarray, "n"]] = []
-    is_init = False
-    running = True
-    free_time = 0
-    has_note = False
-    last_note_time = 0.0
-    while running:
-        if simulator.step(dt):
-            if not is_init:  # 将自由下落后第一次碰撞视作时间起点
-                free_time = simulator.time
-                simulator.reset_time()
-                is_init = True
-
-            desired_duration = iter_notes.peek() - simulator.time
-
-            last_has_note = has_note
-            if last_has_note:
-                stats_err.update(simulator.time - last_note_time)
-
-            has_note = True
-            while True:
-                desired_e = simulator.boundary.calc_desired_restitution(
-                    desired_duration,
-                    simulator.ball.pos,
-                    simulator.ball.vel,
-                    simulator.ball.acc,
-                )
-                if desired_e is not None:
-                    break
-                elif desired_duration > 0.1:
-                    has_note = False
-                    desired_duration /= 2
-                else:
-                    assert False, "Cannot find suitable restitution coefficient"
-
-            desired_e_another = np.abs(np.log(desired_e))
-            desired_e = desired_e[desired_e_another.argsort()]
-            e_history.append(desired_e)
-
-            simulator.resolve_collision(override_e=desired_e[0].item())
-            res.collisions.append(
-                CollisionEvent(
-                    time=simulator.time + free_time,
-                    position=simulator.ball.pos.as_tuple,
-                    velocity_after=simulator.ball.vel.as_tuple,
-                    is_note_event=last_has_note,
-                )
-            )
-
-            if has_note:
-                last_note_time = iter_notes.peek()
-                iter_notes.consume()
-
-        stats_vel.update(simulator.ball.vel.vec_len())
+        writer.finalize(res.meta, checkpoints)
+        is_note_event = load_record_arrays(output_path).is_note_event
+        print(f"Non-note collision: {np.count_nonzero(~is_note_event)}/{len(is_note_event)}")
+        print(f"Bounce history saved to {output_path}")
+        if profiler is not None:
+            print(f"Profile saved to {profiler.save(output_path.with_name(PROFILE_FILENAME))}")
+        if telemetry is not None:  # 中断时同样导出，便于排查出错前的轨迹
+            print(f"Telemetry saved to {telemetry.dump(output_path.with_name(TELEMETRY_FILENAME))}")
+        if completed:  # 中断的仿真不登记，下次仍会重新运行
+            manifest.record("sim", inputs, output_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,363 @@
+"""
+批量任务：对整个曲库依次执行 仿真 → 渲染 → 合成
+
+每个任务（一个 MIDI 文件、若干音轨与 Hydra 覆盖项）展开为每条音轨的 sim / render 步骤以及一个 combine 步骤，
+每个步骤在子进程中调用 scripts/ 下对应的脚本，与手动执行完全相同，产物是否过期仍由构建清单判断。
+各阶段有各自的并发上限（仿真是单线程、渲染吃满 CPU、合成主要是 I/O），
+步骤状态保存在 SQLite 文件中：中断后再次运行同一批任务即从未完成的步骤继续，失败的步骤最多执行 max_attempts 次
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from rich import print
+from rich.table import Table
+
+from .manifest import hash_json
+from .midi_index import MidiIndex
+from .record import RECORD_FILENAME
+from .supervisor import METRICS_TAGS_ENV
+from .utils import CACHE_PATH, PROJECT_ROOT
+
+BATCH_DB_PATH = CACHE_PATH / "batch.sqlite"
+BATCH_LOG_PATH = CACHE_PATH / "batch"
+BATCH_OUTPUT_PATH = PROJECT_ROOT / "outputs" / "batch"
+SCRIPTS_PATH = PROJECT_ROOT / "scripts"
+
+STAGES = ("sim", "render", "combine")
+COMBINE_TRACK = -1  # combine 步骤不属于某条音轨
+DEFAULT_LIMITS = {"sim": os.cpu_count() or 1, "render": max(1, (os.cpu_count() or 1) // 2), "combine": 2}
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    spec TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    job_id TEXT NOT NULL REFERENCES jobs(job_id),
+    stage TEXT NOT NULL,
+    track INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending / running / done / failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (job_id, stage, track)
+);
+"""
+
+
+@dataclass
+class BatchJob:
+    midi: str  # assets/midi 下的文件名
+    tracks: List[int] = field(default_factory=lambda: [0])
+    overrides: List[str] = field(default_factory=lambda: [])  # sim_ball.py 的 Hydra 覆盖项
+    renderer: str = "pygame"  # pygame / manim
+    size: int = 960
+    fps: int = 30
+    audio: str = "fluidsynth"  # 见 pipeline.AUDIO_BACKENDS
+
+    @property
+    def job_id(self) -> str:
+        """由任务内容决定，同一任务再次提交时对应同一组步骤"""
+        return hash_json(asdict(self))[:12]
+
+    @property
+    def stem(self) -> str:
+        return Path(self.midi).stem
+
+
+@dataclass(frozen=True)
+class Step:
+    job_id: str
+    stage: str
+    track: int
+
+    @property
+    def name(self) -> str:
+        return self.stage if self.track == COMBINE_TRACK else f"{self.stage}[{self.track}]"
+
+
+def load_jobs(path: Path) -> List[BatchJob]:
+    """
+    从 JSON 文件读取任务列表，每项的字段同 BatchJob，例如
+    [{"midi": "song.mid", "tracks": [0, 1], "overrides": ["boundary=default_hexagon"]}]
+
+    音轨也可以由曲库索引自动挑选：tracks 写作查询条件（见 MidiIndex.mask），midi 可以是 glob 模式，
+    每个有满足条件的音轨的文件成为一个任务，可选的 max_tracks 只保留起音最多的几条，例如
+    [{"midi": "*.mid", "tracks": "n_onsets >= 200 and min_gap >= 0.12", "max_tracks": 1}]
+
+    各任务的视频按 MIDI 文件名与音轨存放，同一 (MIDI, 音轨) 不能出现在多个任务中
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    jobs: List[BatchJob] = []
+    index: MidiIndex | None = None
+    for k, entry in enumerate(raw):
+        entry: Dict[str, Any] = dict(entry)
+        max_tracks = entry.pop("max_tracks", None)
+        try:
+            if not isinstance(entry.get("tracks"), str) and not glob.has_magic(entry["midi"]):
+                jobs.append(BatchJob(**entry))
+                continue
+            if index is None:
+                index = MidiIndex.load().update()
+                index.save()
+            for midi in index.files(entry["midi"]) if glob.has_magic(entry["midi"]) else [entry["midi"]]:
+                tracks = entry.get("tracks", [0])
+                if isinstance(tracks, str):
+                    selected = index.query(tracks, sort="n_onsets", descending=True)
+                    tracks = selected.tracks(midi)[:max_tracks]
+                if tracks:
+                    expanded: Dict[str, Any] = {**entry, "midi": midi, "tracks": sorted(tracks)}
+                    jobs.append(BatchJob(**expanded))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid job #{k} in {path}: {e}") from e
+
+    owners: Dict[Tuple[str, int], int] = {}
+    for k, job in enumerate(jobs):
+        if job.renderer not in ("pygame", "manim"):
+            raise ValueError(f"Unknown renderer of job #{k}: {job.renderer}")
+        for t in job.tracks:
+            if (job.stem, t) in owners:
+                raise ValueError(f"Jobs #{owners[job.stem, t]} and #{k} both render track {t} of {job.midi}")
+            owners[job.stem, t] = k
+    return jobs
+
+
+class JobStore:
+    """SQLite 中的任务与步骤状态，只在调度线程中访问"""
+
+    def __init__(self, path: Path = BATCH_DB_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def add(self, job: BatchJob) -> List[Step]:
+        """登记任务及其步骤，已登记的保持原有状态"""
+        steps = [Step(job.job_id, stage, t) for t in job.tracks for stage in ("sim", "render")]
+        steps.append(Step(job.job_id, "combine", COMBINE_TRACK))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?)",
+                (job.job_id, json.dumps(asdict(job), ensure_ascii=False), time.time()),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO steps (job_id, stage, track) VALUES (?, ?, ?)",
+                [(s.job_id, s.stage, s.track) for s in steps],
+            )
+        return steps
+
+    def recover(self, retry_failed: bool = False) -> None:
+        """上次运行被中断时仍处于 running 的步骤重新排队，不计入执行次数；retry_failed 时已放弃的步骤也重新计数"""
+        with self.conn:
+            self.conn.execute("UPDATE steps SET status = 'pending', attempts = attempts - 1 WHERE status = 'running'")
+            if retry_failed:
+                self.conn.execute("UPDATE steps SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+
+    def state(self, step: Step) -> Tuple[str, int, str | None]:
+        """(状态, 已执行次数, 产物路径)"""
+        return self.conn.execute(
+            "SELECT status, attempts, output FROM steps WHERE job_id = ? AND stage = ? AND track = ?",
+            (step.job_id, step.stage, step.track),
+        ).fetchone()
+
+    def update(self, step: Step, status: str, output: str | None = None, error: str | None = None) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE steps SET status = ?, output = COALESCE(?, output), error = ?, updated = ?,"
+                " attempts = attempts + (? = 'running') WHERE job_id = ? AND stage = ? AND track = ?",
+                (status, output, error, time.time(), status, step.job_id, step.stage, step.track),
+            )
+
+    def summary(self, jobs: List[BatchJob]) -> Table:
+        table = Table("job", "midi", "tracks", *STAGES)
+        for job in jobs:
+            cells: Dict[str, List[str]] = {stage: [] for stage in STAGES}
+            rows = self.conn.execute(
+                "SELECT stage, track, status, attempts FROM steps WHERE job_id = ? ORDER BY track", (job.job_id,)
+            )
+            for stage, track, status, attempts in rows:
+                prefix = "" if track == COMBINE_TRACK else f"{track}:"
+                retries = f" ({attempts}x)" if attempts > 1 else ""
+                cells[stage].append(f"{prefix}{status}{retries}")
+            table.add_row(job.job_id, job.midi, str(job.tracks), *[" ".join(cells[stage]) for stage in STAGES])
+        return table
+
+
+def step_command(job: BatchJob, step: Step, record_path: Path | None) -> List[str]:
+    """步骤对应的脚本调用，render 需要 sim 产出的记录路径"""
+    match step.stage:
+        case "sim":
+            run_dir = BATCH_OUTPUT_PATH / job.job_id / f"track{step.track}"
+            return [
+                sys.executable,
+                (SCRIPTS_PATH / "sim_ball.py").as_posix(),
+                f"music.midi='{job.midi}'",
+                f"music.inst_idx={step.track}",
+                f"hydra.run.dir='{run_dir.as_posix()}'",
+                *job.overrides,
+            ]
+        case "render":
+            assert record_path is not None
+            script = "render_ball_pygame.py" if job.renderer == "pygame" else "render_ball.py"
+            return [
+                sys.executable,
+                (SCRIPTS_PATH / script).as_posix(),
+                *["-i", record_path.as_posix(), "--size", str(job.size), "--fps", str(job.fps)],
+            ]
+        case "combine":
+            return [
+                sys.executable,
+                (SCRIPTS_PATH / "combine_video.py").as_posix(),
+                *["-m", job.stem, "-t", *[str(t) for t in job.tracks], "--audio", job.audio],
+            ]
+        case _:
+            raise ValueError(f"Unknown stage: {step.stage}")
+
+
+def step_output(job: BatchJob, step: Step) -> str | None:
+    """后续步骤需要的产物：sim 的记录路径"""
+    if step.stage == "sim":
+        return (BATCH_OUTPUT_PATH / job.job_id / f"track{step.track}" / RECORD_FILENAME).as_posix()
+    return None
+
+
+def run_command(
+    cmd: List[str], log_path: Path, running: Set[subprocess.Popen[bytes]], tags: Dict[str, str] | None = None
+) -> int:
+    """
+    在子进程中执行一个步骤，输出写入日志文件，返回退出码；执行期间子进程登记在 running 中
+
+    tags 经环境变量传给脚本，写入其各阶段的指标（见 src/supervisor.py），便于按任务汇总
+    """
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    env = {**os.environ, METRICS_TAGS_ENV: json.dumps(tags or {})}
+    with open(log_path, "a", encoding="utf-8") as log:
+        log.write(f"\n$ {' '.join(cmd)}\n")
+        log.flush()
+        proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=log, stderr=subprocess.STDOUT, env=env)
+        running.add(proc)
+        try:
+            return proc.wait()
+        finally:
+            running.discard(proc)
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    store: JobStore,
+    limits: Dict[str, int] | None = None,
+    max_attempts: int = MAX_ATTEMPTS,
+    log_path: Path = BATCH_LOG_PATH,
+) -> bool:
+    """
+    执行一批任务，已完成的步骤直接跳过
+
+    Args:
+        jobs (List[BatchJob]): 任务列表
+        store (JobStore): 步骤状态
+        limits (Dict[str, int] | None): 各阶段的并发上限，缺省的阶段使用 DEFAULT_LIMITS
+        max_attempts (int): 每个步骤最多执行的次数（跨多次运行累计）
+        log_path (Path): 各步骤的日志目录
+
+    Returns:
+        bool: 是否所有任务都已合成完毕
+    """
+    limits = {**DEFAULT_LIMITS, **(limits or {})}
+    if limits["render"] > 1 and any(job.renderer == "manim" for job in jobs):
+        # render_ball.py 通过同一个 scripts/config.tmp.json 向 Manim 场景传递参数，不能同时运行
+        print("[yellow]Manim renders share scripts/config.tmp.json, running them one at a time[/yellow]")
+        limits["render"] = 1
+    by_id = {job.job_id: job for job in jobs}
+    executors = {stage: ThreadPoolExecutor(max_workers=limits[stage]) for stage in STAGES}
+    futures: Dict[Future[int], Step] = {}
+    running: Set[subprocess.Popen[bytes]] = set()
+
+    def submit(step: Step) -> None:
+        job = by_id[step.job_id]
+        record_path = None
+        if step.stage == "render":  # 只在仿真完成后提交，此时记录路径已登记
+            sim_output = store.state(Step(step.job_id, "sim", step.track))[2]
+            assert sim_output is not None
+            record_path = Path(sim_output)
+        cmd = step_command(job, step, record_path)
+        store.update(step, "running")
+        print(f"[cyan]{job.stem} {step.name}[/cyan]: started")
+        log_file = log_path / f"{job.job_id}-{step.stage}{'' if step.track == COMBINE_TRACK else step.track}.log"
+        tags = {"job": job.job_id, "step": step.name}
+        futures[executors[step.stage].submit(run_command, cmd, log_file, running, tags)] = step
+
+    def schedule(step: Step) -> None:
+        """完成的步骤直接推进到后续步骤（产物已被删除的重新执行），已放弃的步骤阻塞其后续步骤"""
+        status, attempts, output = store.state(step)
+        if status == "done" and (output is None or Path(output).exists()):
+            advance(step)
+        elif status == "failed" or attempts >= max_attempts:
+            store.update(step, "failed", error=f"gave up after {attempts} attempts")
+        else:
+            submit(step)
+
+    def advance(step: Step) -> None:
+        job = by_id[step.job_id]
+        if step.stage == "sim":
+            schedule(Step(step.job_id, "render", step.track))
+        elif step.stage == "render":
+            renders = [store.state(Step(step.job_id, "render", t))[0] for t in job.tracks]
+            combine = Step(step.job_id, "combine", COMBINE_TRACK)
+            # 最后一条音轨渲染完成时才合成；combine 已在运行或排队时不重复提交
+            if all(s == "done" for s in renders) and combine not in futures.values():
+                schedule(combine)
+
+    try:
+        for job in jobs:
+            for t in job.tracks:
+                schedule(Step(job.job_id, "sim", t))
+
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                step = futures.pop(future)
+                job = by_id[step.job_id]
+                try:
+                    returncode = future.result()
+                    error = None if returncode == 0 else f"exit code {returncode}"
+                except OSError as e:
+                    error = str(e)
+                if error is None:
+                    store.update(step, "done", output=step_output(job, step))
+                    print(f"[green]{job.stem} {step.name}[/green]: done")
+                    advance(step)
+                    continue
+                attempts = store.state(step)[1]
+                if attempts < max_attempts:
+                    print(f"[yellow]{job.stem} {step.name}[/yellow]: {error}, retrying ({attempts}/{max_attempts})")
+                    store.update(step, "pending", error=error)
+                    submit(step)
+                else:
+                    print(f"[red]{job.stem} {step.name}[/red]: {error}, giving up, see {log_path}")
+                    store.update(step, "failed", error=error)
+    except BaseException:
+        # 被中断时结束正在执行的步骤，它们在数据库中仍是 running，下次运行时重新排队
+        for proc in list(running):
+            proc.terminate()
+        raise
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    print(store.summary(jobs))
+    return all(store.state(Step(job.job_id, "combine", COMBINE_TRACK))[0] == "done" for job in jobs)
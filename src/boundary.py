@@ -1,17 +1,28 @@
+from __future__ import annotations
+
+import warnings
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Any, List, Tuple
 
 import numpy as np
-from jaxtyping import Float
-from manim import VMobject
-
-from src.utils.shape import (
-    ellipse_boundary_to_manim,  # pyright: ignore[reportUnknownVariableType]
-)
 
 from .body import Ball
-from .models.manim import MetaEllipse
-from .utils.usable_class import Mat2, Vec2
+from .models.manim import MetaEllipse, MetaPolygon, MetaSDF
+from .utils.bvh import SegmentBVH
+from .utils.sdf import SDFGrid, load_sdf, resolve_shape_path
+from .utils.usable_class import Vec2
+
+# 渲染相关的依赖（manim、scipy、scikit-image）以及 jaxtyping 只在类型检查或渲染时导入，
+# 使仿真核心只依赖 numpy
+if TYPE_CHECKING:
+    from jaxtyping import Float
+    from manim import VMobject
+
+    from .utils.usable_class import Mat2
+
+VALIDATION_SAMPLES = 300  # 验证恢复系数时沿反弹后路径的采样数
+CONSTRAINT_TOLERANCE = 2e-1  #! 约束值的容限不能太小，因为数值递推就是会稍微超出
+PATH_EPS = 1e-6  # 按距离验证路径时的舍入容限
 
 """
 由于只有极少数圆、矩形等边界能够在处理小球自身半径的同时不影响形状，
@@ -22,15 +33,38 @@ from .utils.usable_class import Mat2, Vec2
 
 class Boundary(ABC):
     restitution: float
+    center: Vec2
 
     @abstractmethod
     def get_normal(self, pos: Vec2) -> Vec2:
         """获取单位外法向量"""
 
+    def get_normals(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m 2"]:
+        """批量获取单位外法向量，默认逐点调用 get_normal"""
+        normals = [self.get_normal(Vec2.from_numpy(p)).as_tuple for p in np.asarray(points, dtype=np.float64)]
+        return np.array(normals, dtype=np.float64).reshape(-1, 2)
+
     @abstractmethod
     def is_colliding(self, ball: Ball) -> bool:
         """判断小球是否与边界碰撞"""
 
+    @abstractmethod
+    def constraint_value(self, pos: Vec2) -> float:
+        """边界约束函数值，内部小于 1，边界上等于 1，用于遥测与调试"""
+
+    @abstractmethod
+    def constraint_values(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m"]:
+        """批量计算约束函数值"""
+
+    @abstractmethod
+    def to_manim_meta(self) -> MetaEllipse | MetaPolygon | MetaSDF:
+        """记录与渲染使用的边界元数据"""
+
+    @classmethod
+    @abstractmethod
+    def from_manim_meta(cls, meta: Any) -> Boundary:
+        """由对应类型的边界元数据重建边界"""
+
     @abstractmethod
     def calc_desired_restitution(self, t_f: float, pos: Vec2, vel: Vec2, acc: Vec2) -> Float[np.ndarray, "n"] | None:
         """
@@ -46,6 +80,46 @@ class Boundary(ABC):
             float | None: 解析求解得到的期望恢复系数
         """
 
+    def _validate_roots(self, t_f: float, pos: Vec2, vel: Vec2, acc: Vec2, k: Float[np.ndarray, "n"]) -> List[float]:
+        """筛选出反弹后全程不越过边界的恢复系数：沿反弹后的抛物线采样，由 _path_inside 判断"""
+        valid_k: List[float] = []
+        ball_tmp = Ball(pos=pos, vel=vel, acc=acc)
+        t_samples = np.linspace(0, t_f, VALIDATION_SAMPLES)[:, None]
+        for e in k:
+            vel_after = self.reflect(ball_tmp, override_e=e.item())
+            p_samples = np.asarray(pos) + np.asarray(vel_after) * t_samples + 0.5 * np.asarray(acc) * t_samples**2
+            if self._path_inside(p_samples):
+                valid_k.append(e)
+        return valid_k
+
+    def _path_inside(self, points: Float[np.ndarray, "m 2"]) -> bool:
+        """采样路径是否全程在边界内，默认按约束值判断"""
+        return bool(np.all(self.constraint_values(points) <= 1 + CONSTRAINT_TOLERANCE))
+
+    @staticmethod
+    def _excursion_ok(excursion: Float[np.ndarray, "m"]) -> int | None:
+        """
+        按各采样点越出边界的距离（内部为负）判断路径：起点即碰撞时已越过边界的那一步，越界量约为 v·dt，
+        离开边界的过程中不能更远；此后直到落点前都须在边界内，落点本身由求根得到，不参与判断
+
+        Returns:
+            int | None: 第一个在边界内的采样点下标，路径越界时为 None
+        """
+        inside = np.flatnonzero(excursion[:-1] <= PATH_EPS)
+        if not len(inside):
+            return None
+        first = int(inside[0])
+        if np.any(excursion[:first] > max(float(excursion[0]), 0.0) + PATH_EPS):
+            return None
+        return first if np.all(excursion[first:-1] <= PATH_EPS) else None
+
+    def clamp(self, pos: Vec2) -> Vec2:
+        """将边界外的点拉回边界上，默认沿径向按约束值缩放（对椭圆与多边形恰好落在边界上），边界内的点不变"""
+        value = self.constraint_value(pos)
+        if value <= 1:
+            return pos
+        return self.center + (pos - self.center) * (1 / value**0.5)
+
     def reflect(self, ball: Ball, override_e: float | None = None) -> Vec2:
         """返回小球碰撞后的速度向量，不修改小球成员"""
         # 反射逻辑：速度沿法线反弹
@@ -72,10 +146,24 @@ class EllipseBoundary(Boundary):
         n_unnormalized = self.Q @ p_rel
         return Vec2.from_numpy(n_unnormalized).normalized()
 
+    def get_normals(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m 2"]:
+        n = (np.asarray(points, dtype=np.float64) - np.asarray(self.center)) @ self.Q.T
+        return n / np.linalg.norm(n, axis=-1, keepdims=True)
+
     def is_colliding(self, ball: Ball) -> bool:
         p_rel = ball.pos - self.center
         return (p_rel @ self.Q @ p_rel >= 1).item()
 
+    def constraint_value(self, pos: Vec2) -> float:
+        # 展开 x^T Q x，避免逐步调用时创建临时数组
+        dx, dy = pos.x - self.center.x, pos.y - self.center.y
+        Q = self.Q
+        return float(Q[0, 0] * dx * dx + (Q[0, 1] + Q[1, 0]) * dx * dy + Q[1, 1] * dy * dy)
+
+    def constraint_values(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m"]:
+        rel = np.asarray(points, dtype=np.float64) - np.asarray(self.center)
+        return np.einsum("ni,ij,nj->n", rel, self.Q, rel)
+
     def calc_desired_restitution(self, t_f: float, pos: Vec2, vel: Vec2, acc: Vec2) -> Float[np.ndarray, "n"] | None:
         norm = self.get_normal(pos)  # 碰撞点外法向方向
 
@@ -92,21 +180,7 @@ class EllipseBoundary(Boundary):
 
         # * 验证环节
         k = k[k > 0]  # 只保留正值
-        valid_k: List[float] = []  # 用列表收集合法恢复系数
-        # 运动过程需满足不等式约束
-        ball_tmp = Ball(pos=pos, vel=vel, acc=acc)
-        t_samples = np.linspace(0, t_f, 300)
-        for e in k:
-            vel_after = self.reflect(ball_tmp, override_e=e.item())
-            p_samples = (
-                np.asarray(pos)
-                + np.asarray(vel_after) * t_samples[:, None]
-                + 0.5 * np.asarray(acc) * t_samples[:, None] ** 2
-            )
-            constraint_vals = np.einsum("ni,ij,nj->n", p_samples, self.Q, p_samples)
-            if np.all(constraint_vals <= 1 + 2e-1):  #! 容限不能太小，因为数值递推就是会稍微超出
-                valid_k.append(e)  # 只保留满足全程约束的 e
-
+        valid_k = self._validate_roots(t_f, pos, vel, acc, k)
         return np.array(valid_k) if valid_k else None
 
     def to_manim_meta(self) -> MetaEllipse:
@@ -118,6 +192,8 @@ class EllipseBoundary(Boundary):
         )
 
     def to_manim_object(self, ball_r: float, color: str, grid_res: int = 400) -> VMobject:
+        from .utils.shape import ellipse_boundary_to_manim
+
         return ellipse_boundary_to_manim(self.Q, self.center, ball_r, grid_res, color=color)
 
     def calc_manim_wh(self) -> Tuple[float, float]:
@@ -155,5 +231,373 @@ class CircleBoundary(EllipseBoundary):
     def get_normal(self, pos: Vec2) -> Vec2:
         return (pos - self.center).normalized()
 
+    def get_normals(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m 2"]:
+        rel = np.asarray(points, dtype=np.float64) - np.asarray(self.center)
+        return rel / np.linalg.norm(rel, axis=-1, keepdims=True)
+
     def is_colliding(self, ball: Ball) -> bool:
         return (ball.pos - self.center).vec_len() >= self.radius
+
+
+def _cross2(a: Float[np.ndarray, "... 2"], b: Float[np.ndarray, "... 2"]) -> Float[np.ndarray, "..."]:
+    """二维叉积（z 分量）"""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+class PolygonBoundary(Boundary):
+    """
+    简单多边形边界，顶点描述圆心限制区域，边保存在 BVH 中，单次查询的代价随边数对数增长
+
+    约束函数取星形多边形规范函数（|p| 与同方向上到边界距离之比）的平方，与椭圆的 x^T Q x 含义一致，
+    因此要求多边形关于 center 星形：凸多边形、正多边形与星形等均满足
+    """
+
+    def __init__(
+        self,
+        vertices: Float[np.ndarray, "n 2"],
+        center: Vec2 = Vec2(0.0, 0.0),
+        restitution: float = 1.0,
+    ):
+        v = np.asarray(vertices, dtype=np.float64)
+        rel = v - np.asarray(center)
+        if np.sum(_cross2(rel, np.roll(rel, -1, axis=0))) < 0:  # 统一为逆时针
+            v, rel = v[::-1].copy(), rel[::-1].copy()
+        edges = np.roll(rel, -1, axis=0) - rel
+        if np.any(_cross2(rel, edges) <= 0):
+            raise ValueError("Polygon boundary must be star-shaped with respect to its center")
+
+        self.vertices = v
+        self.center = center
+        self.restitution = restitution
+        self.bvh = SegmentBVH(rel, rel + edges)
+        self._rel = rel
+        self._edges = edges
+        self.normals: Float[np.ndarray, "n 2"] = np.stack([edges[:, 1], -edges[:, 0]], axis=-1)
+        self.normals /= np.linalg.norm(self.normals, axis=-1, keepdims=True)
+
+        # 逆时针星形多边形的顶点极角单调，按极角二分即可找到某方向对应的边
+        angles = np.arctan2(rel[:, 1], rel[:, 0])
+        self._angle_order = np.argsort(angles)
+        self._sorted_angles = angles[self._angle_order]
+        # 中心到各边的最小距离，更近的点必在内部，绝大多数仿真步无需查询 BVH
+        u = np.clip(-np.einsum("ni,ni->n", rel, edges) / np.einsum("ni,ni->n", edges, edges), 0.0, 1.0)
+        self._inner_r2 = float(np.min(np.sum((rel + u[:, None] * edges) ** 2, axis=-1)))
+
+    def _rel_xy(self, pos: Vec2) -> Tuple[float, float]:
+        return pos.x - self.center.x, pos.y - self.center.y
+
+    def contains(self, pos: Vec2) -> bool:
+        x, y = self._rel_xy(pos)
+        return x * x + y * y < self._inner_r2 or self.bvh.crossings(x, y) % 2 == 1
+
+    def get_normal(self, pos: Vec2) -> Vec2:
+        x, y = self._rel_xy(pos)
+        seg, d2, cx, cy = self.bvh.nearest(x, y)
+        nx, ny = self.normals[seg]
+        # 在外侧时取最近点指向该点的方向，在边的内部与边法向相同，在凸角处平滑过渡
+        if d2 > 0 and (x - cx) * nx + (y - cy) * ny > 0:
+            d = d2**0.5
+            return Vec2((x - cx) / d, (y - cy) / d)
+        return Vec2(float(nx), float(ny))
+
+    def is_colliding(self, ball: Ball) -> bool:
+        return not self.contains(ball.pos)
+
+    def constraint_values(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m"]:
+        """批量计算约束函数值"""
+        rel = np.asarray(points, dtype=np.float64) - np.asarray(self.center)
+        j = np.searchsorted(self._sorted_angles, np.arctan2(rel[:, 1], rel[:, 0]), side="right") - 1
+        i = self._angle_order[j]  # j = -1 时回绕到极角最大的顶点
+        gauge = _cross2(rel, self._edges[i]) / _cross2(self._rel[i], self._edges[i])
+        return gauge**2
+
+    def constraint_value(self, pos: Vec2) -> float:
+        return float(self.constraint_values(np.array([[pos.x, pos.y]]))[0])
+
+    def time_of_impact(self, p0: Vec2, p1: Vec2) -> float | None:
+        """点沿线段 p0 -> p1 运动时首次碰到边界的时刻（占整段的比例），不相交时为 None"""
+        x0, y0 = self._rel_xy(p0)
+        x1, y1 = self._rel_xy(p1)
+        hit = self.bvh.first_hit(x0, y0, x1, y1)
+        return None if hit is None else hit[0]
+
+    def calc_desired_restitution(self, t_f: float, pos: Vec2, vel: Vec2, acc: Vec2) -> Float[np.ndarray, "n"] | None:
+        norm = self.get_normal(pos)  # 碰撞点外法向方向
+
+        # 反弹后 t_f 时刻的位置为 r_f + s·t_f·norm，s 为沿法向的速度增量，落在边界上即射线与各边的交点
+        r_f = pos + vel * t_f + 0.5 * acc * t_f**2
+        x, y = self._rel_xy(r_f)
+        hits = self.bvh.line_intersections(x, y, norm.x, norm.y)
+        s = np.array([t for t, _ in hits]) / t_f
+
+        # 理论公式：s = -(1+e)*vel.dot(norm)
+        k = s / (-vel.dot(norm)) - 1
+
+        # * 验证环节
+        k = k[k > 0]  # 只保留正值
+        valid_k = self._validate_roots(t_f, pos, vel, acc, k)
+        return np.array(valid_k) if valid_k else None
+
+    def _path_inside(self, points: Float[np.ndarray, "m 2"]) -> bool:
+        """
+        采样点按沿径向越出边界的距离判断（见 _excursion_ok），此后直到落点前的每一段弦
+        都用扫掠检测排除从边或尖角之间穿出又穿回的轨迹
+        """
+        rel = points - np.asarray(self.center)
+        gauge = np.sqrt(self.constraint_values(points))
+        # 点 p 沿径向的边界点为 p / gauge，越界距离 |p|(1 - 1/gauge)，内部为负
+        excursion = np.linalg.norm(rel, axis=-1) * (1 - 1 / np.maximum(gauge, 1e-12))
+        first = self._excursion_ok(excursion)
+        if first is None:
+            return False
+        first += int(excursion[first] > -PATH_EPS)  # 从恰在边上的点出发的弦必然与该边相交，从下一个点开始扫掠
+        return all(
+            self.time_of_impact(Vec2.from_numpy(points[i]), Vec2.from_numpy(points[i + 1])) is None
+            for i in range(first, len(points) - 2)
+        )
+
+    def outline(self, ball_r: float, arc_step: float = np.pi / 24) -> Float[np.ndarray, "m 2"]:
+        """
+        渲染用的轮廓：圆心限制区域向外膨胀 ball_r，凸角处为圆弧，凹角处为两条偏移边的交点
+        """
+        n = len(self._rel)
+        prev_normals = np.roll(self.normals, 1, axis=0)
+        points: List[Float[np.ndarray, "2"]] = []
+        for i in range(n):
+            v, n0, n1 = self.vertices[i], prev_normals[i], self.normals[i]
+            if _cross2(self._edges[i - 1], self._edges[i]) > 0:  # 凸角
+                a0, a1 = float(np.arctan2(n0[1], n0[0])), float(np.arctan2(n1[1], n1[0]))
+                a1 = a0 + (a1 - a0) % (2 * np.pi)
+                arc: List[float] = np.linspace(a0, a1, max(2, int(np.ceil((a1 - a0) / arc_step)) + 1)).tolist()
+                for a in arc:
+                    points.append(v + ball_r * np.array([np.cos(a), np.sin(a)]))
+            else:
+                points.append(v + ball_r * (n0 + n1) / (1 + n0 @ n1))
+        return np.array(points)
+
+    def to_manim_meta(self) -> MetaPolygon:
+        return MetaPolygon(vertices=[(float(x), float(y)) for x, y in self.vertices])
+
+    def to_manim_object(self, ball_r: float, color: str) -> VMobject:
+        from .utils.shape import outline_to_manim
+
+        return outline_to_manim(self.outline(ball_r), color=color)
+
+    def calc_manim_wh(self) -> Tuple[float, float]:
+        half = np.max(np.abs(self._rel), axis=0)
+        return half[0] * 2.4, half[1] * 2.4
+
+    @classmethod
+    def from_manim_meta(cls, meta: MetaPolygon) -> "PolygonBoundary":
+        return cls(vertices=np.array(meta.vertices))
+
+    @classmethod
+    def regular(
+        cls,
+        sides: int,
+        radius: float,
+        inner_radius: float | None = None,
+        rotation: float = 90.0,
+        center: Vec2 = Vec2(0.0, 0.0),
+        restitution: float = 1.0,
+    ) -> "PolygonBoundary":
+        """
+        正多边形，给定 inner_radius 时为 sides 个角的星形
+
+        Args:
+            radius (float): 顶点（星形的外角）到中心的距离
+            inner_radius (float | None): 星形内角到中心的距离
+            rotation (float): 第一个顶点的极角（度）
+        """
+        n = sides if inner_radius is None else 2 * sides
+        angles = np.deg2rad(rotation) + 2 * np.pi * np.arange(n) / n
+        radii = np.full(n, radius, dtype=np.float64)
+        if inner_radius is not None:
+            radii[1::2] = inner_radius
+        vertices = np.stack([radii * np.cos(angles), radii * np.sin(angles)], axis=-1) + np.asarray(center)
+        return cls(vertices=vertices, center=center, restitution=restitution)
+
+
+class SDFBoundary(Boundary):
+    """
+    任意形状边界，圆心限制区域由规则网格上的有符号距离场描述（内部为负），双线性插值查询，
+    单次查询的代价与形状复杂度无关
+
+    约束函数取 (1 + d / depth)^2，depth 为区域内的最大内切距离：对圆形与 x^T Q x 完全一致；
+    验证恢复系数时则直接使用距离
+    """
+
+    def __init__(self, grid: SDFGrid, center: Vec2 = Vec2(0.0, 0.0), restitution: float = 1.0):
+        self.grid = grid
+        self.center = center
+        self.restitution = restitution
+        self.meta: MetaSDF | None = None  # 由文件构建时记录来源，用于写入记录
+
+        values = np.asarray(grid.values, dtype=np.float64)
+        self._ny, self._nx = values.shape
+        self._x0, self._y0, self._h = grid.x0, grid.y0, grid.h
+        self._x1 = self._x0 + (self._nx - 1) * self._h
+        self._y1 = self._y0 + (self._ny - 1) * self._h
+        # 单点查询逐步调用，网格转为 Python 列表，避免 numpy 标量索引的开销
+        self._rows: List[List[float]] = values.tolist()
+        self._depth = float(-values.min())
+        if self._depth <= 0:
+            raise ValueError("SDF boundary has no interior")
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int, float, float, float]:
+        """所在网格单元与单元内坐标；网格外的点投影到网格边缘，并返回投影距离"""
+        cx = self._x0 if x < self._x0 else (self._x1 if x > self._x1 else x)
+        cy = self._y0 if y < self._y0 else (self._y1 if y > self._y1 else y)
+        out = ((x - cx) ** 2 + (y - cy) ** 2) ** 0.5 if (cx != x or cy != y) else 0.0
+        fx, fy = (cx - self._x0) / self._h, (cy - self._y0) / self._h
+        i, j = min(int(fx), self._nx - 2), min(int(fy), self._ny - 2)
+        return i, j, fx - i, fy - j, out
+
+    def distance(self, pos: Vec2) -> float:
+        """有符号距离，网格外为网格边缘的值加上到网格的距离"""
+        i, j, tx, ty, out = self._cell(pos.x - self.center.x, pos.y - self.center.y)
+        r0, r1 = self._rows[j], self._rows[j + 1]
+        return (r0[i] * (1 - tx) + r0[i + 1] * tx) * (1 - ty) + (r1[i] * (1 - tx) + r1[i + 1] * tx) * ty + out
+
+    def distances(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m"]:
+        """批量计算有符号距离"""
+        rel = np.asarray(points, dtype=np.float64) - np.asarray(self.center)
+        clamped = np.clip(rel, (self._x0, self._y0), (self._x1, self._y1))
+        out = np.linalg.norm(rel - clamped, axis=-1)
+        f = (clamped - (self._x0, self._y0)) / self._h
+        i = np.minimum(f[:, 0].astype(np.int64), self._nx - 2)
+        j = np.minimum(f[:, 1].astype(np.int64), self._ny - 2)
+        tx, ty = f[:, 0] - i, f[:, 1] - j
+        v = self.grid.values
+        bottom = v[j, i] * (1 - tx) + v[j, i + 1] * tx
+        top = v[j + 1, i] * (1 - tx) + v[j + 1, i + 1] * tx
+        return bottom * (1 - ty) + top * ty + out
+
+    def get_normal(self, pos: Vec2) -> Vec2:
+        # 双线性插值的梯度
+        i, j, tx, ty, _ = self._cell(pos.x - self.center.x, pos.y - self.center.y)
+        r0, r1 = self._rows[j], self._rows[j + 1]
+        gx = (r0[i + 1] - r0[i]) * (1 - ty) + (r1[i + 1] - r1[i]) * ty
+        gy = (r1[i] - r0[i]) * (1 - tx) + (r1[i + 1] - r0[i + 1]) * tx
+        norm = (gx * gx + gy * gy) ** 0.5
+        if norm == 0:  # 距离场的脊线上梯度退化，退回到径向
+            return (pos - self.center).normalized()
+        return Vec2(gx / norm, gy / norm)
+
+    def is_colliding(self, ball: Ball) -> bool:
+        return self.distance(ball.pos) >= 0
+
+    def clamp(self, pos: Vec2) -> Vec2:
+        """沿距离场的梯度退回边界上"""
+        d = self.distance(pos)
+        return pos - self.get_normal(pos) * d if d > 0 else pos
+
+    def constraint_values(self, points: Float[np.ndarray, "m 2"]) -> Float[np.ndarray, "m"]:
+        """批量计算约束函数值"""
+        return (1 + self.distances(points) / self._depth) ** 2
+
+    def constraint_value(self, pos: Vec2) -> float:
+        return (1 + self.distance(pos) / self._depth) ** 2
+
+    def calc_desired_restitution(self, t_f: float, pos: Vec2, vel: Vec2, acc: Vec2) -> Float[np.ndarray, "n"] | None:
+        norm = self.get_normal(pos)  # 碰撞点外法向方向
+
+        # 反弹后 t_f 时刻的位置为 r_f + λ·norm（λ = s·t_f），沿这条直线采样距离场，变号处即落在边界上
+        r_f = pos + vel * t_f + 0.5 * acc * t_f**2
+        lam = self._line_span(r_f, norm)
+        if lam is None:
+            return None
+        d = self.distances(np.asarray(r_f)[None] + lam[:, None] * np.asarray(norm)[None])
+        idx = np.flatnonzero((d[:-1] < 0) != (d[1:] < 0))
+        roots = lam[idx] - d[idx] * (lam[idx + 1] - lam[idx]) / (d[idx + 1] - d[idx])
+        s = roots / t_f
+
+        # 理论公式：s = -(1+e)*vel.dot(norm)
+        k = s / (-vel.dot(norm)) - 1
+
+        # * 验证环节
+        k = k[k > 0]  # 只保留正值
+        valid_k = self._validate_roots(t_f, pos, vel, acc, k)
+        return np.array(valid_k) if valid_k else None
+
+    def _line_span(self, origin: Vec2, direction: Vec2) -> Float[np.ndarray, "s"] | None:
+        """直线 origin + λ·direction 穿过网格的参数范围，按半个网格间距采样；网格外距离恒为正，不会有根"""
+        o = np.array([origin.x - self.center.x, origin.y - self.center.y])
+        d = np.array([direction.x, direction.y])
+        lo, hi = -np.inf, np.inf
+        for o_, d_, a, b in ((o[0], d[0], self._x0, self._x1), (o[1], d[1], self._y0, self._y1)):
+            if abs(d_) < 1e-12:
+                if not a <= o_ <= b:
+                    return None
+                continue
+            t0, t1 = sorted(((a - o_) / d_, (b - o_) / d_))
+            lo, hi = max(lo, t0), min(hi, t1)
+        if lo >= hi:
+            return None
+        return np.linspace(lo, hi, max(2, int(np.ceil((hi - lo) / (self._h / 2))) + 1))
+
+    def _path_inside(self, points: Float[np.ndarray, "m 2"]) -> bool:
+        """直接按有符号距离判断（见 _excursion_ok）；距离场 1-Lipschitz，相邻采样点之间最多再越出半个采样步长"""
+        return self._excursion_ok(self.distances(points)) is not None
+
+    def outline(self, ball_r: float) -> Float[np.ndarray, "m 2"]:
+        """
+        渲染用的轮廓：直接取距离场 ball_r 等值线，即圆心限制区域向外膨胀 ball_r；有多条时取最长的一条
+        """
+        from skimage import measure
+
+        # skimage 没有完整的类型标注
+        contours: List[Float[np.ndarray, "k 2"]] = measure.find_contours(  # pyright: ignore[reportUnknownMemberType]
+            self.grid.values, ball_r
+        )
+        if not contours:
+            raise RuntimeError("No outline found in the distance field; ball_r may exceed the grid margin")
+        contour = max(contours, key=len)  # (行, 列) 坐标
+        xy = np.stack([self._x0 + contour[:, 1] * self._h, self._y0 + contour[:, 0] * self._h], axis=-1)
+        return xy + np.asarray(self.center)
+
+    def to_manim_meta(self) -> MetaSDF:
+        if self.meta is None:
+            raise ValueError("SDF boundary not built from a file cannot be saved to a record")
+        return self.meta
+
+    def to_manim_object(self, ball_r: float, color: str) -> VMobject:
+        from .utils.shape import outline_to_manim
+
+        return outline_to_manim(self.outline(ball_r), color=color)
+
+    def calc_manim_wh(self) -> Tuple[float, float]:
+        j, i = np.nonzero(self.grid.values <= 0)
+        half_w = np.max(np.abs(self._x0 + i * self._h))
+        half_h = np.max(np.abs(self._y0 + j * self._h))
+        return half_w * 2.4, half_h * 2.4
+
+    @classmethod
+    def from_file(
+        cls,
+        source: str,
+        size: float,
+        resolution: int = 256,
+        invert: bool = False,
+        restitution: float = 1.0,
+    ) -> "SDFBoundary":
+        """
+        由 SVG 或位图遮罩构建，距离场按内容哈希缓存在 .cache/sdf 下
+
+        Args:
+            source (str): 文件路径，相对路径相对于 assets/
+            size (float): 形状最长边缩放到的长度（圆心限制区域）
+            resolution (int): 最长边上的网格数
+            invert (bool): 位图遮罩中暗色为内部
+        """
+        grid, digest = load_sdf(resolve_shape_path(source), size, resolution, invert)
+        boundary = cls(grid, restitution=restitution)
+        boundary.meta = MetaSDF(source=source, size=size, resolution=resolution, invert=invert, digest=digest)
+        return boundary
+
+    @classmethod
+    def from_manim_meta(cls, meta: MetaSDF) -> "SDFBoundary":
+        boundary = cls.from_file(meta.source, meta.size, meta.resolution, meta.invert)
+        if meta.digest and boundary.meta is not None and boundary.meta.digest != meta.digest:
+            warnings.warn(f"{meta.source} changed since the record was made, the outline may not match", stacklevel=2)
+        return boundary
@@ -0,0 +1,299 @@
+"""
+仿真检查点：每消耗一个音符记录一次恢复仿真所需的全部状态，随记录一起保存
+
+检查点 k 之前的轨迹只取决于前 note_index[k] 个音符，因此修改音符后可以从第一处改动之前的
+最后一个检查点继续仿真，并将新的碰撞拼接在未改动的前缀之后；中断的仿真同样可以从最后一个检查点继续
+
+统计量的分位数草图桶数不定，不放进定长的检查点行：每个检查点记录自上一个检查点以来各个桶计数的变化，
+按 (统计量, 符号, 桶, 计数变化) 追加到单独的条目序列中，检查点行只保存此时的条目总数 sketch_end，
+前 sketch_end 个条目按桶求和即为该检查点的草图
+
+检查点总是在刚处理完一次碰撞时记录，此时小球的位置与速度就是第 n_collisions 次碰撞的记录，
+自由下落时长就是第一次碰撞的时刻，这些状态不保存在检查点中，恢复时由同一记录的碰撞取得
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .stream import RowStreamWriter, read_row_stream
+from .utils.usable_class import OnlineStats, QuantileSketch, Vec2
+
+if TYPE_CHECKING:
+    from jaxtyping import Float, Int
+
+    from .record import RecordArrays
+    from .simulator import Simulator
+
+COLUMN_PREFIX = "ckpt_"
+
+# 单个检查点的行结构，字段与 Checkpoints 一一对应
+CHECKPOINT_DTYPE = np.dtype(
+    [
+        ("note_index", "<i8"),
+        ("n_collisions", "<i8"),
+        ("time", "<f8"),
+        ("last_note_time", "<f8"),
+        ("vel_before", "<f8", (2,)),
+        ("stats_vel", "<f8", (5,)),
+        ("stats_err", "<f8", (5,)),
+        ("sketch_end", "<i8"),
+    ]
+)
+ROW_FIELDS: Tuple[str, ...] = CHECKPOINT_DTYPE.names or ()
+
+# 草图条目的行结构（紧凑排列，每条 10 字节），统计量 0 为速率、1 为时间误差，符号 0 表示零桶
+SKETCH_DTYPE = np.dtype([("which", "u1"), ("sign", "i1"), ("bucket", "<i4"), ("delta", "<i4")])
+SKETCH_FIELDS: Tuple[str, ...] = SKETCH_DTYPE.names or ()
+SKETCH_VEL, SKETCH_ERR = 0, 1
+
+Bucket = Tuple[int, int, int]  # (统计量, 符号, 桶)
+BallState = Tuple[Tuple[float, float], Tuple[float, float], float]  # 碰撞后的位置、速度与自由下落时长
+
+
+def _stats_state(stats: OnlineStats) -> List[float]:
+    return [stats.n, stats.mean, stats.m2, stats.min, stats.max]
+
+
+def _restore_stats(stats: OnlineStats, state: Float[np.ndarray, "5"], buckets: Dict[Bucket, int], which: int) -> None:
+    """恢复矩统计量与分位数草图"""
+    stats.n = int(state[0])
+    stats.mean, stats.m2, stats.min, stats.max = (float(v) for v in state[1:])
+    sketch = stats.sketch
+    sketch.pos = {k: c for (w, sign, k), c in buckets.items() if w == which and sign > 0}
+    sketch.neg = {k: c for (w, sign, k), c in buckets.items() if w == which and sign < 0}
+    sketch.zero = buckets.get((which, 0, 0), 0)
+    sketch.n = sketch.zero + sum(sketch.pos.values()) + sum(sketch.neg.values())
+
+
+def _sketch_buckets(sketch: QuantileSketch, which: int) -> Dict[Bucket, int]:
+    buckets = {(which, 1, k): c for k, c in sketch.pos.items()}
+    buckets.update({(which, -1, k): c for k, c in sketch.neg.items()})
+    if sketch.zero:
+        buckets[(which, 0, 0)] = sketch.zero
+    return buckets
+
+
+def _sum_entries(entries: np.ndarray) -> Dict[Bucket, int]:
+    """将草图条目按桶求和，计数归零的桶被删除"""
+    buckets: Dict[Bucket, int] = {}
+    for which, sign, k, c in zip(*(entries[name].tolist() for name in SKETCH_FIELDS)):
+        count = buckets.get((which, sign, k), 0) + c
+        if count:
+            buckets[(which, sign, k)] = count
+        else:
+            buckets.pop((which, sign, k), None)
+    return buckets
+
+
+def ball_state(collisions: RecordArrays, n_collisions: int) -> BallState:
+    """前 n_collisions 次碰撞之后的小球状态，即该时刻检查点不保存的部分"""
+    pos = collisions.position[n_collisions - 1]
+    vel = collisions.velocity_after[n_collisions - 1]
+    return (float(pos[0]), float(pos[1])), (float(vel[0]), float(vel[1])), float(collisions.time[0])
+
+
+def sketch_stream_path(stream_path: Path) -> Path:
+    """检查点行文件对应的草图条目行文件，<name>.ckpt.part -> <name>.ckpt.sketch.part"""
+    return stream_path.with_suffix(".sketch" + stream_path.suffix)
+
+
+@dataclass
+class Checkpoints:
+    """列式的检查点序列，第 k 个检查点在第 note_index[k] 个音符被消耗后记录"""
+
+    note_index: Int[np.ndarray, "k"]  # 已消耗的音符数
+    n_collisions: Int[np.ndarray, "k"]  # 已记录的碰撞数
+    time: Float[np.ndarray, "k"]  # 仿真器时间（以自由下落后第一次碰撞为起点）
+    last_note_time: Float[np.ndarray, "k"]  # 刚消耗的音符时刻，按顺序即为已消耗的音符序列
+    vel_before: Float[np.ndarray, "k 2"]  # 碰撞前速度
+    stats_vel: Float[np.ndarray, "k 5"]  # (n, mean, m2, min, max)
+    stats_err: Float[np.ndarray, "k 5"]
+    sketch_end: Int[np.ndarray, "k"]  # 已记录的草图条目数
+    sketch: np.ndarray  # SKETCH_DTYPE 的草图条目，见模块说明
+
+    def __len__(self) -> int:
+        return len(self.note_index)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """记录中的列，草图条目按字段拆成 ckpt_sketch_<字段> 列"""
+        columns = {COLUMN_PREFIX + name: getattr(self, name) for name in ROW_FIELDS}
+        columns.update({f"{COLUMN_PREFIX}sketch_{name}": self.sketch[name] for name in SKETCH_FIELDS})
+        return columns
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray, sketch: np.ndarray) -> "Checkpoints":
+        return cls(**{name: rows[name] for name in ROW_FIELDS}, sketch=sketch)
+
+    def to_rows(self) -> np.ndarray:
+        rows = np.empty(len(self), dtype=CHECKPOINT_DTYPE)
+        for name in ROW_FIELDS:
+            rows[name] = getattr(self, name)
+        return rows
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "Checkpoints | None":
+        """从记录的列中取出检查点，记录没有检查点时返回 None"""
+        names = [COLUMN_PREFIX + name for name in ROW_FIELDS]
+        sketch_names = [f"{COLUMN_PREFIX}sketch_{name}" for name in SKETCH_FIELDS]
+        if not all(name in columns for name in names + sketch_names):
+            return None
+        sketch = np.empty(len(columns[sketch_names[0]]), dtype=SKETCH_DTYPE)
+        for name, column in zip(SKETCH_FIELDS, sketch_names):
+            sketch[name] = columns[column]
+        return cls(**{name: columns[COLUMN_PREFIX + name] for name in ROW_FIELDS}, sketch=sketch)
+
+    def resume_index(self, notes: Sequence[float]) -> int | None:
+        """
+        与新的音符序列比较，找出可以继续仿真的最后一个检查点
+
+        Returns:
+            int | None: 检查点下标，第一个音符就不同时返回 None
+        """
+        consumed = np.asarray(self.last_note_time)
+        new = np.asarray(notes[: len(consumed)], dtype=np.float64)
+        diff = np.flatnonzero(consumed[: len(new)] != new)
+        n_same = int(diff[0]) if len(diff) else len(new)
+        # 检查点 k 只依赖前 note_index[k] 个音符
+        k = int(np.searchsorted(self.note_index, n_same, side="right")) - 1
+        return k if k >= 0 else None
+
+
+class CheckpointLog:
+    """
+    仿真过程中逐个追加检查点，可由已有记录的前缀初始化
+
+    Args:
+        prefix (Checkpoints | None): 复用的检查点
+        n (int | None): 只复用 prefix 的前 n 个
+        stream_path (Path | None): 给定时检查点边产生边写入该文件，草图条目写入 sketch_stream_path(stream_path)，
+            内存中只保留最后一个检查点与此时的草图
+        collisions (RecordArrays | None): prefix 所在记录的碰撞，用于取得最后一个复用的检查点处的小球状态
+    """
+
+    def __init__(
+        self,
+        prefix: Checkpoints | None = None,
+        n: int | None = None,
+        stream_path: Path | None = None,
+        collisions: RecordArrays | None = None,
+    ):
+        self._rows: List[Tuple[Any, ...]] = []
+        self._entries: List[Tuple[int, int, int, int]] = []
+        self._last: Tuple[Any, ...] | None = None
+        self._ball: BallState | None = None  # 最后一个检查点处的小球状态
+        self._buckets: Dict[Bucket, int] = {}  # 最后一个检查点的草图
+        self._n_entries = 0
+        self._stream = None if stream_path is None else RowStreamWriter(stream_path, CHECKPOINT_DTYPE, {}, 64)
+        self._sketch_stream = (
+            None if stream_path is None else RowStreamWriter(sketch_stream_path(stream_path), SKETCH_DTYPE, {}, 1024)
+        )
+        if prefix is not None:
+            rows = prefix.to_rows()[: len(prefix) if n is None else n]
+            entries = prefix.sketch[: rows["sketch_end"][-1] if len(rows) else 0]
+            if self._stream is not None and self._sketch_stream is not None:
+                self._sketch_stream.append_rows(entries)
+                self._stream.append_rows(rows)
+            else:
+                self._entries.extend(entries.tolist())
+                self._rows.extend(rows.tolist())
+            if len(rows):
+                assert collisions is not None, "Resuming from checkpoints needs the collisions of their record"
+                self._last = rows[-1].item()
+                self._ball = ball_state(collisions, int(rows["n_collisions"][-1]))
+            self._buckets = _sum_entries(entries)
+            self._n_entries = len(entries)
+
+    def __len__(self) -> int:
+        return len(self._stream) if self._stream is not None else len(self._rows)
+
+    def append(
+        self,
+        simulator: Simulator,
+        free_time: float,
+        note_index: int,
+        n_collisions: int,
+        last_note_time: float,
+        stats_vel: OnlineStats,
+        stats_err: OnlineStats,
+    ) -> None:
+        buckets = _sketch_buckets(stats_vel.sketch, SKETCH_VEL) | _sketch_buckets(stats_err.sketch, SKETCH_ERR)
+        # 相邻检查点之间只有少数桶的计数变化；桶被合并时计数变化可以为负
+        entries = [(*b, c - self._buckets.get(b, 0)) for b, c in buckets.items() if c != self._buckets.get(b, 0)]
+        entries += [(*b, -c) for b, c in self._buckets.items() if b not in buckets]
+        self._buckets = buckets
+        self._n_entries += len(entries)
+        row = (
+            note_index,
+            n_collisions,
+            simulator.time,
+            last_note_time,
+            simulator.ball_vel_before_collision.as_tuple,
+            _stats_state(stats_vel),
+            _stats_state(stats_err),
+            self._n_entries,
+        )
+        self._last = row
+        self._ball = (simulator.ball.pos.as_tuple, simulator.ball.vel.as_tuple, free_time)
+        if self._stream is not None and self._sketch_stream is not None:
+            for entry in entries:
+                self._sketch_stream.append(entry)
+            self._stream.append(row)
+        else:
+            self._entries.extend(entries)
+            self._rows.append(row)
+
+    def restore(self, simulator: Simulator, stats_vel: OnlineStats, stats_err: OnlineStats) -> Tuple[float, float, int]:
+        """
+        将仿真器与统计量恢复到最后一个检查点
+
+        Returns:
+            Tuple[float, float, int]: 反弹循环的局部状态 (free_time, last_note_time, note_index)
+        """
+        assert self._last is not None and self._ball is not None, "No checkpoint to restore"
+        last = np.array(self._last, dtype=CHECKPOINT_DTYPE)
+        pos, vel, free_time = self._ball
+        simulator.time = float(last["time"])
+        simulator.ball.pos = Vec2(*pos)
+        simulator.ball.vel = Vec2(*vel)
+        simulator.ball_vel_before_collision = Vec2.from_numpy(last["vel_before"])
+        simulator.bounce_flag = True  # 检查点总是在刚处理完一次碰撞时记录
+        _restore_stats(stats_vel, last["stats_vel"], self._buckets, SKETCH_VEL)
+        _restore_stats(stats_err, last["stats_err"], self._buckets, SKETCH_ERR)
+        return free_time, float(last["last_note_time"]), int(last["note_index"])
+
+    def to_arrays(self) -> Checkpoints:
+        """流式写入时返回文件的内存映射，不把全部检查点读入内存"""
+        if self._stream is not None and self._sketch_stream is not None:
+            self._sketch_stream.flush()
+            self._stream.flush()
+            return load_checkpoint_stream(self._stream.path)
+        return Checkpoints.from_rows(
+            np.array(self._rows, dtype=CHECKPOINT_DTYPE), np.array(self._entries, dtype=SKETCH_DTYPE)
+        )
+
+    def close(self) -> None:
+        if self._stream is not None and self._sketch_stream is not None:
+            self._sketch_stream.close()
+            self._stream.close()
+
+
+def load_checkpoint_stream(path: Path, n_collisions: int | None = None) -> Checkpoints:
+    """
+    读取（可能被中断的）检查点行文件与对应的草图条目行文件
+
+    Args:
+        n_collisions (int | None): 已落盘的碰撞数，碰撞与检查点分别刷新，只保留碰撞前缀完整的检查点
+    """
+    rows = read_row_stream(path)[1]
+    sketch_path = sketch_stream_path(path)
+    entries = read_row_stream(sketch_path)[1] if sketch_path.exists() else np.empty(0, dtype=SKETCH_DTYPE)
+    if n_collisions is not None:
+        rows = rows[: np.searchsorted(rows["n_collisions"], n_collisions, side="right")]
+    # 草图条目与检查点同样分别刷新，条目不完整的检查点也舍去
+    rows = rows[: np.searchsorted(rows["sketch_end"], len(entries), side="right")]
+    return Checkpoints.from_rows(rows, entries)
@@ -0,0 +1,264 @@
+"""
+只保存恢复系数的紧凑记录编码，以及由它重建碰撞位置与速度的重放
+
+仿真以固定步长的显式欧拉法推进，两次碰撞之间的 m 步有闭式解
+    v = v0 + m·a·dt,    p = p0 + m·dt·v0 + m(m+1)/2·a·dt²
+碰撞时刻是步长的整数倍（与仿真中逐步累加的时钟逐位一致），碰撞后的速度由碰撞点的法向与恢复系数决定，
+因此每次碰撞只需保存距上次碰撞的步数 (uint32)、恢复系数 (float64) 与是否为音符，约为完整记录的 1/3
+
+每次碰撞的法向取决于上一次碰撞的结果，这个递推本身是顺序的，舍入误差还会随碰撞次数指数放大；
+因此每隔 ANCHOR_INTERVAL 次碰撞（以及最后一次碰撞）保存一次完整状态作为锚点，各锚点之间的窗口互不依赖，
+重放时所有窗口同步推进，每一步都是对全部窗口的批量运算。
+重放到下一个锚点时的偏差、每次碰撞前一步仍在边界内而碰撞时已越过边界，两者一并批量检查，用作完整性校验。
+恢复系数不能降为 float32：擦边碰撞的恢复系数可达数百，float32 的舍入在下一次碰撞就放大到 1e-5 量级
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import numpy as np
+
+from .boundary import Boundary, EllipseBoundary, PolygonBoundary, SDFBoundary
+from .checkpoint import Checkpoints
+from .models.manim import MetaData, MetaEllipse, MetaPolygon
+from .record import RecordArrays
+
+if TYPE_CHECKING:
+    from jaxtyping import Bool, Float, Int, UInt32
+
+ENCODING = "restitution"
+ANCHOR_INTERVAL = 32  # 锚点间隔（碰撞数），窗口内的舍入误差放大到 1e-9 量级以内
+REPLAY_TOLERANCE = 1e-6  # 重放位置与锚点的最大偏差，以及判断越过边界时的容差
+
+
+def boundary_from_meta(meta: MetaData) -> Boundary:
+    """由记录的边界元数据重建边界，只用于求法向与约束值"""
+    boundary = meta.boundary
+    if isinstance(boundary, MetaEllipse):
+        return EllipseBoundary.from_manim_meta(boundary)
+    if isinstance(boundary, MetaPolygon):
+        return PolygonBoundary.from_manim_meta(boundary)
+    return SDFBoundary.from_manim_meta(boundary)
+
+
+def times_from_steps(steps: UInt32[np.ndarray, "n"], dt: float) -> Float[np.ndarray, "n"]:
+    """
+    由步数还原碰撞时刻：仿真逐步累加 dt，在第一次碰撞时清零并加上此前的自由下落时间，
+    这里按同样的顺序累加（np.add.accumulate 逐项累加），结果与仿真记录的时刻逐位相同
+    """
+    if not len(steps):
+        return np.empty(0, dtype=np.float64)
+    total = np.cumsum(steps, dtype=np.int64)
+    m0 = int(total[0])
+    clock = np.zeros(max(m0, int(total[-1]) - m0) + 1, dtype=np.float64)
+    np.add.accumulate(np.full(len(clock) - 1, dt), out=clock[1:])
+    return clock[total - m0] + clock[m0]
+
+
+def anchor_indices(n: int, interval: int) -> Int[np.ndarray, "w"]:
+    """锚点所在的碰撞下标：每 interval 次碰撞一个，最后一次碰撞也是锚点"""
+    return np.unique(np.append(np.arange(0, n, interval), n - 1)) if n else np.empty(0, dtype=np.int64)
+
+
+def _segment_ends(
+    p0: Float[np.ndarray, "m 2"],
+    v0: Float[np.ndarray, "m 2"],
+    acc: Float[np.ndarray, "2"],
+    dt: float,
+    steps: Int[np.ndarray, "m"],
+) -> Tuple[Float[np.ndarray, "m 2"], Float[np.ndarray, "m 2"]]:
+    """显式欧拉法推进 steps 步后的位置与速度（闭式解）"""
+    m = np.asarray(steps, dtype=np.float64)[:, None]
+    return p0 + m * dt * v0 + 0.5 * m * (m + 1) * dt * dt * acc, v0 + m * dt * acc
+
+
+def _reflect(
+    vel: Float[np.ndarray, "m 2"], normal: Float[np.ndarray, "m 2"], e: Float[np.ndarray, "m"]
+) -> Float[np.ndarray, "m 2"]:
+    """反射公式 v' = v - (1 + e)(v·n)n，与 Boundary.reflect 相同"""
+    return vel - ((1 + e) * np.einsum("ij,ij->i", vel, normal))[:, None] * normal
+
+
+@dataclass
+class CompactRecord:
+    """
+    仅含恢复系数的仿真记录
+
+    Attributes:
+        steps: 每次碰撞距上一次碰撞（第一次为距仿真开始）的步数
+        restitution: 每次碰撞的恢复系数
+        anchor_position / anchor_velocity: 第 0, K, 2K, ... 次与最后一次碰撞的位置与碰撞后速度 (K = interval)
+    """
+
+    meta: MetaData
+    steps: UInt32[np.ndarray, "n"]
+    restitution: Float[np.ndarray, "n"]
+    is_note_event: Bool[np.ndarray, "n"]
+    anchor_position: Float[np.ndarray, "w 2"]
+    anchor_velocity: Float[np.ndarray, "w 2"]
+    interval: int = ANCHOR_INTERVAL
+    checkpoints: Checkpoints | None = None
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    @classmethod
+    def from_arrays(cls, arrays: RecordArrays, interval: int = ANCHOR_INTERVAL) -> "CompactRecord":
+        """
+        由完整记录编码：碰撞时刻须与步数逐位对应；重放偏差超过 REPLAY_TOLERANCE 时（如多边形的尖角附近）
+        锚点间隔逐次减半，最后再完整重放校验一次，保证写出的记录能够读回
+
+        Raises:
+            ValueError: 多球记录（小球之间的碰撞不在记录中），或记录不是由本仿真器以 meta.dt 生成的
+        """
+        if arrays.ball is not None or arrays.meta.extra_balls:
+            raise ValueError("Only single-ball records can be stored as restitution coefficients")
+        meta = arrays.meta
+        dt = meta.dt
+        time = np.asarray(arrays.time, dtype=np.float64)
+        position = np.asarray(arrays.position, dtype=np.float64)
+        velocity_after = np.asarray(arrays.velocity_after, dtype=np.float64)
+
+        steps = np.rint(np.diff(time, prepend=0.0) / dt)
+        if len(steps) and (steps.min() < 1 or steps.max() > np.iinfo(np.uint32).max):
+            raise ValueError("Collision times are not increasing simulation steps")
+        steps = steps.astype(np.uint32)
+        if not np.array_equal(times_from_steps(steps, dt), time):
+            raise ValueError(f"Collision times are not whole simulation steps of dt={dt}")
+
+        # 碰撞前速度由上一次碰撞后的速度推进得到，恢复系数 e = -(v'·n) / (v·n)
+        p_prev = np.concatenate([np.asarray(meta.ball.initial_pos, dtype=np.float64)[None], position[:-1]])
+        v_prev = np.concatenate([np.asarray(meta.ball.initial_vel, dtype=np.float64)[None], velocity_after[:-1]])
+        _, vel_before = _segment_ends(p_prev, v_prev, np.asarray(meta.ball.acc, dtype=np.float64), dt, steps)
+        normal = boundary_from_meta(meta).get_normals(position)
+        e = -np.einsum("ij,ij->i", velocity_after, normal) / np.einsum("ij,ij->i", vel_before, normal)
+
+        while True:  # 间隔为 1 时每次碰撞都是锚点，重放没有误差
+            anchors = anchor_indices(len(position), interval)
+            compact = cls(
+                meta=meta,
+                steps=steps,
+                restitution=e,
+                is_note_event=np.asarray(arrays.is_note_event, dtype=np.bool_),
+                anchor_position=position[anchors],
+                anchor_velocity=velocity_after[anchors],
+                interval=interval,
+                checkpoints=arrays.checkpoints,
+            )
+            replayed = compact.replay(check=False)
+            error = max(
+                np.abs(replayed.position - position).max(initial=0.0),
+                np.abs(replayed.velocity_after - velocity_after).max(initial=0.0),
+            )
+            if error <= REPLAY_TOLERANCE or interval == 1:
+                break
+            interval = max(1, interval // 2)
+        compact.replay()
+        return compact
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        columns: Dict[str, np.ndarray] = {
+            "steps": self.steps,
+            "restitution": self.restitution,
+            "is_note_event": self.is_note_event,
+            "anchor_position": self.anchor_position,
+            "anchor_velocity": self.anchor_velocity,
+        }
+        if self.checkpoints is not None:
+            columns.update(self.checkpoints.columns())
+        return columns
+
+    @classmethod
+    def from_columns(cls, meta: MetaData, columns: Dict[str, np.ndarray], interval: int) -> "CompactRecord":
+        return cls(
+            meta=meta,
+            steps=columns["steps"],
+            restitution=columns["restitution"],
+            is_note_event=columns["is_note_event"],
+            anchor_position=columns["anchor_position"],
+            anchor_velocity=columns["anchor_velocity"],
+            interval=interval,
+            checkpoints=Checkpoints.from_columns(columns),
+        )
+
+    def replay(self, check: bool = True) -> RecordArrays:
+        """
+        重建完整记录：各锚点窗口同步推进，第 r 步批量计算所有窗口的第 r 次碰撞
+
+        Args:
+            check (bool): 是否进行完整性校验
+
+        Raises:
+            ValueError: 校验失败，即步数、恢复系数或锚点被改动或损坏
+        """
+        meta = self.meta
+        dt, k = meta.dt, self.interval
+        acc = np.asarray(meta.ball.acc, dtype=np.float64)
+        boundary = boundary_from_meta(meta)
+        n = len(self)
+        steps = np.asarray(self.steps)
+        e = np.asarray(self.restitution, dtype=np.float64)
+
+        anchors = anchor_indices(n, k)
+        position = np.empty((n, 2), dtype=np.float64)
+        velocity_after = np.empty((n, 2), dtype=np.float64)
+        position[anchors] = self.anchor_position
+        velocity_after[anchors] = self.anchor_velocity
+        starts, ends = anchors[:-1], anchors[1:]
+        p, v = position[starts], velocity_after[starts]
+        drift = 0.0
+        for r in range(1, k + 1):
+            live = np.flatnonzero(starts + r <= ends)
+            if not len(live):
+                break
+            i = starts[live] + r
+            p_new, vel_before = _segment_ends(p[live], v[live], acc, dt, steps[i])
+            v_new = _reflect(vel_before, boundary.get_normals(p_new), e[i])
+            # 推进到下一个锚点的窗口与保存的完整状态比较，其余写入重建的记录
+            at_anchor = i == ends[live]
+            if at_anchor.any():
+                j = i[at_anchor]
+                drift = max(
+                    drift,
+                    np.abs(p_new[at_anchor] - position[j]).max(),
+                    np.abs(v_new[at_anchor] - velocity_after[j]).max(),
+                )
+            j = i[~at_anchor]
+            position[j], velocity_after[j] = p_new[~at_anchor], v_new[~at_anchor]
+            p[live], v[live] = p_new, v_new
+
+        if check and n:
+            self._check(boundary, position, velocity_after, drift)
+        return RecordArrays(
+            meta=meta,
+            time=times_from_steps(steps, dt),
+            position=position,
+            velocity_after=velocity_after,
+            is_note_event=np.asarray(self.is_note_event, dtype=np.bool_),
+            checkpoints=self.checkpoints,
+        )
+
+    def _check(
+        self,
+        boundary: Boundary,
+        position: Float[np.ndarray, "n 2"],
+        velocity_after: Float[np.ndarray, "n 2"],
+        drift: float,
+    ) -> None:
+        """批量校验：锚点偏差、恢复系数有限且为正，以及每次碰撞恰好发生在第一次越过边界的那一步"""
+        meta = self.meta
+        if drift > REPLAY_TOLERANCE:
+            raise ValueError(f"Replay drifted by {drift:.3g} from the stored anchors, the record is corrupted")
+        e = np.asarray(self.restitution, dtype=np.float64)
+        if not (np.all(np.isfinite(e)) and np.all(e > 0)):
+            raise ValueError("The record has invalid restitution coefficients")
+        # 碰撞前一步的位置：欧拉法 p_m = p_{m-1} + v_m·dt，碰撞后 bounce_flag 使下一次碰撞至少相隔两步
+        v_prev = np.concatenate([np.asarray(meta.ball.initial_vel, dtype=np.float64)[None], velocity_after[:-1]])
+        vel_before = v_prev + np.asarray(self.steps, dtype=np.float64)[:, None] * meta.dt * np.asarray(meta.ball.acc)
+        inside = boundary.constraint_values(position - vel_before * meta.dt) < 1 + REPLAY_TOLERANCE
+        outside = boundary.constraint_values(position) >= 1 - REPLAY_TOLERANCE
+        bad = np.flatnonzero(~(inside & outside))
+        if len(bad):
+            raise ValueError(f"Collision {bad[0]} does not lie on the boundary crossing, the record is corrupted")
@@ -0,0 +1,199 @@
+# pyright: standard
+"""
+内置的撞击音合成：在每次碰撞的时刻放置一段短促的撞击声，不依赖 FluidSynth 与 SoundFont
+
+音符碰撞按对应 MIDI 音符的音高发声（没有 MIDI 时统一使用 DEFAULT_PITCH），非音符碰撞是明显不同的低沉闷响，
+多余的反弹一听便知。同一音高的碰撞共用一段采样，分批用 np.bincount 重叠相加到预先分配的缓冲区中，
+每批的临时数组大小固定，长曲目的内存占用只取决于输出本身。
+
+音频的时间轴与 combine_video.py 使用的 FluidSynth 音频一致：以记录的第一次碰撞为 0，合成时由 ffmpeg 统一延后
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+
+from .midi import NoteRecord, wav_path_for
+from .record import RecordArrays, audio_tracks
+
+if TYPE_CHECKING:
+    from jaxtyping import Float, Int
+
+SAMPLE_RATE = 44100
+IMPACT_DURATION = 0.3  # 音符撞击声的时长 (s)
+THUD_DURATION = 0.12  # 非音符闷响的时长 (s)
+THUD_FREQ = 90.0
+DEFAULT_PITCH = 72  # 没有 MIDI 音高时使用的音高，也是载入的采样被视为的原始音高
+NOTE_GAIN = 0.5
+THUD_GAIN = 0.6
+BATCH = 64  # 每批重叠相加的碰撞数，临时数组约为 BATCH × 采样长度
+
+
+def midi_to_hz(pitch: float) -> float:
+    return 440.0 * 2.0 ** ((pitch - 69) / 12)
+
+
+def synth_impact(freq: float, sr: int = SAMPLE_RATE, duration: float = IMPACT_DURATION) -> Float[np.ndarray, "n"]:
+    """类似木琴的撞击声：几个指数衰减的泛音，高次泛音衰减更快，开头 2 ms 淡入避免爆音"""
+    t = np.arange(int(duration * sr)) / sr
+    out = np.zeros_like(t)
+    for k, (ratio, amp) in enumerate([(1.0, 1.0), (2.0, 0.4), (3.0, 0.2), (4.2, 0.1)]):
+        if freq * ratio < sr / 2:
+            out += amp * np.sin(2 * np.pi * freq * ratio * t) * np.exp(-t * (12.0 + 10.0 * k))
+    out *= np.minimum(1.0, t / 0.002)
+    return (out / np.abs(out).max()).astype(np.float32)
+
+
+def synth_thud(sr: int = SAMPLE_RATE, duration: float = THUD_DURATION) -> Float[np.ndarray, "n"]:
+    """非音符碰撞的闷响：低频正弦加一小段衰减很快的噪声，噪声的随机种子固定，结果可复现"""
+    t = np.arange(int(duration * sr)) / sr
+    noise = np.random.default_rng(0).standard_normal(len(t)) * np.exp(-t * 120.0)
+    out = np.sin(2 * np.pi * THUD_FREQ * t) * np.exp(-t * 35.0) + 0.3 * noise
+    out *= np.minimum(1.0, t / 0.002)
+    return (out / np.abs(out).max()).astype(np.float32)
+
+
+def load_sample(path: Path, sr: int = SAMPLE_RATE) -> Float[np.ndarray, "n"]:
+    """载入撞击采样，混为单声道并线性插值重采样到 sr"""
+    import soundfile as sf
+
+    data, file_sr = sf.read(path.as_posix(), dtype="float32", always_2d=True)
+    sample = data.mean(axis=1)
+    if file_sr != sr:
+        sample = resample(sample, file_sr / sr)
+    peak = np.abs(sample).max()
+    return sample / peak if peak > 0 else sample
+
+
+def resample(sample: Float[np.ndarray, "n"], step: float) -> Float[np.ndarray, "m"]:
+    """以 step 为步长线性插值重新取样，step > 1 时变短、音高升高"""
+    positions = np.arange(0.0, len(sample) - 1, step)
+    return np.interp(positions, np.arange(len(sample)), sample).astype(np.float32)
+
+
+def note_pitches(record: RecordArrays, midi: NoteRecord) -> Int[np.ndarray, "n"]:
+    """
+    各次碰撞对应的 MIDI 音高：在记录所用的各音轨中取时间最近的音符，非音符碰撞同样给出（不会使用）
+
+    碰撞时刻减去第一次碰撞的时刻即为乐曲时刻，与仿真中的约定相同
+    """
+    tracks = audio_tracks(record.meta)
+    times = np.concatenate([np.asarray(midi.notes[k], dtype=np.float64) for k in tracks])
+    pitches = np.concatenate([np.asarray(midi.pitches[k], dtype=np.int64) for k in tracks])
+    if len(times) == 0:
+        return np.full(len(record), DEFAULT_PITCH, dtype=np.int64)
+    order = np.argsort(times, kind="stable")
+    times, pitches = times[order], pitches[order]
+
+    t = np.asarray(record.time, dtype=np.float64) - float(record.time[0])
+    k = np.searchsorted(times, t)  # times[k - 1] < t <= times[k]
+    left = np.clip(k - 1, 0, len(times) - 1)
+    right = np.clip(k, 0, len(times) - 1)
+    return pitches[np.where(np.abs(times[left] - t) <= np.abs(times[right] - t), left, right)]
+
+
+def overlap_add(
+    out: Float[np.ndarray, "m"],
+    starts: Int[np.ndarray, "n"],
+    sample: Float[np.ndarray, "l"],
+    gain: float,
+    batch: int = BATCH,
+) -> None:
+    """
+    将 sample 乘以 gain 后叠加到 out 中各个起始样本处，超出 out 的部分截断
+
+    每批 batch 个起始点构成 (batch, len(sample)) 的索引矩阵，用 np.bincount 在该批覆盖的区间内累加后
+    一次性加回 out，重叠的部分自然相加
+    """
+    if len(starts) == 0 or len(sample) == 0:
+        return
+    starts = np.sort(np.asarray(starts, dtype=np.int64))
+    offsets = np.arange(len(sample), dtype=np.int64)
+    weights = np.broadcast_to(sample * np.float32(gain), (min(batch, len(starts)), len(sample)))
+    for i in range(0, len(starts), batch):
+        chunk = starts[i : i + batch]
+        lo = int(chunk[0])
+        hi = min(int(chunk[-1]) + len(sample), len(out))
+        if lo >= hi:
+            break
+        idx = (chunk[:, None] - lo) + offsets[None, :]
+        mask = idx < hi - lo
+        acc = np.bincount(idx[mask], weights=weights[: len(chunk)][mask], minlength=hi - lo)
+        out[lo:hi] += acc.astype(np.float32)
+
+
+def synthesize_impacts(
+    records: List[RecordArrays],
+    duration: float,
+    midi: NoteRecord | None = None,
+    sample: Float[np.ndarray, "n"] | None = None,
+    sr: int = SAMPLE_RATE,
+) -> Float[np.ndarray, "m"]:
+    """
+    合成若干记录的撞击音并混合为一条单声道音轨
+
+    Args:
+        records (List[RecordArrays]): 各轨的记录，每条记录以自己的第一次碰撞为时间零点，与 build_mux_command 的对齐方式一致
+        duration (float): 乐曲时长 (s)，末尾再留出撞击声的余音
+        midi (NoteRecord | None): 给定时音符碰撞按最近的 MIDI 音符定音高，否则统一使用 DEFAULT_PITCH
+        sample (np.ndarray | None): 撞击采样（视为 DEFAULT_PITCH），按音高重采样；None 时使用合成的撞击声
+        sr (int): 采样率
+
+    Returns:
+        np.ndarray: float32 音频，峰值不超过 1
+    """
+    thud = synth_thud(sr)
+    bank: Dict[int, np.ndarray] = {}  # 音高 -> 采样，每个音高只生成一次
+
+    def note_sample(pitch: int) -> np.ndarray:
+        if pitch not in bank:
+            if sample is None:
+                bank[pitch] = synth_impact(midi_to_hz(pitch), sr)
+            else:
+                bank[pitch] = resample(sample, 2.0 ** ((pitch - DEFAULT_PITCH) / 12))
+        return bank[pitch]
+
+    tail = max(IMPACT_DURATION, THUD_DURATION) if sample is None else len(sample) / sr
+    out = np.zeros(int((duration + tail) * sr) + 1, dtype=np.float32)
+    for record in records:
+        if len(record) == 0:
+            continue
+        starts = np.rint((np.asarray(record.time) - float(record.time[0])) * sr).astype(np.int64)
+        is_note = np.asarray(record.is_note_event, dtype=bool)
+        overlap_add(out, starts[~is_note], thud, THUD_GAIN)
+
+        pitches = note_pitches(record, midi) if midi is not None else np.full(len(record), DEFAULT_PITCH)
+        for pitch in np.unique(pitches[is_note]).tolist():
+            overlap_add(out, starts[is_note & (pitches == pitch)], note_sample(pitch), NOTE_GAIN)
+
+    peak = float(np.abs(out).max(initial=0.0))
+    if peak > 1.0:
+        out /= peak
+    return out
+
+
+def impact_wav_path(midi_path: Path, track_indices: List[int], wav_output_path: Path) -> Path:
+    """撞击音 WAV 的路径，与 FluidSynth 合成的 WAV 放在一起但不会互相覆盖"""
+    wav_path = wav_path_for(midi_path, track_indices, wav_output_path)
+    return wav_path.with_name(wav_path.stem + "-impact.wav")
+
+
+def impacts_to_wav(
+    records: List[RecordArrays],
+    wav_path: Path,
+    duration: float,
+    midi: NoteRecord | None = None,
+    sample_path: Path | None = None,
+    sr: int = SAMPLE_RATE,
+) -> Path:
+    """合成撞击音并写出 WAV，参数见 synthesize_impacts"""
+    import soundfile as sf
+
+    sample = None if sample_path is None else load_sample(sample_path, sr)
+    audio = synthesize_impacts(records, duration, midi=midi, sample=sample, sr=sr)
+    wav_path.parent.mkdir(parents=True, exist_ok=True)
+    sf.write(wav_path.as_posix(), audio, sr)
+    return wav_path
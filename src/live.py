@@ -0,0 +1,220 @@
+# pyright: standard
+"""
+实时模式：音符以带时间戳的事件流到达（实时回放 MIDI 文件，或 mido 输入端口），边到达边规划
+
+每个音符在到达后固定延迟 lookahead 秒落地发声，因此墙钟时刻 w 时已经知道所有落地时刻不晚于 w + lookahead 的音符。
+仿真最多领先墙钟 lookahead / 2，于是在时刻 t 碰撞时，(t, t + lookahead / 2] 内的音符一定已经到达：
+有已知的下一个音符时与离线一样按其规划，否则按 lookahead / 4 规划一次非音符反弹，等待新的音符；
+之后才到达的音符最早在 t + lookahead / 2 落地，因此下一段飞行至少还有 lookahead / 4，不会短到无法规划。
+仿真与墙钟使用同一时间轴（秒，自开始起），显示端按碰撞事件重建任意时刻的位置
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+from math import inf
+from typing import Callable, Deque, Dict, List, Tuple
+
+import numpy as np
+
+from .simulator import Simulator
+from .utils.usable_class import OnlineStats
+
+MIN_LOOKAHEAD = 0.2  # 非音符反弹的时长为 lookahead / 4，过短时难以规划
+
+
+class NoteFeed(ABC):
+    """音符事件源，时间均为自开始起的墙钟秒数"""
+
+    @abstractmethod
+    def poll(self, now: float) -> List[float]:
+        """截至 now 新到达的音符的到达时刻，按时间排序"""
+
+    @property
+    def finished(self) -> bool:
+        """之后不会再有音符到达"""
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+class FileReplayFeed(NoteFeed):
+    """按墙钟实时回放一个音轨（如 NoteRecord.notes[i]），音符在其乐曲时刻到达，与从端口输入时一样"""
+
+    def __init__(self, notes: List[float]):
+        self.notes = notes
+        self._next = 0
+
+    def poll(self, now: float) -> List[float]:
+        k = bisect_right(self.notes, now, self._next)
+        new = self.notes[self._next : k]
+        self._next = k
+        return new
+
+    @property
+    def finished(self) -> bool:
+        return self._next == len(self.notes)
+
+
+class PortFeed(NoteFeed):
+    """
+    mido 输入端口（虚拟端口或硬件，需要 python-rtmidi 等后端），note_on 按轮询时刻打时间戳
+
+    与 NoteRecord 一样，相距不足 0.01 s 的音符合并为一个；同一次轮询取到的音符时间戳相同，自然合并
+    """
+
+    def __init__(self, name: str | None = None, channel: int | None = None):
+        import mido  # 可选依赖，只有从端口输入时需要后端
+
+        # open_input 由后端在运行时提供
+        self.port = mido.open_input(name)  # pyright: ignore[reportAttributeAccessIssue]
+        self.channel = channel
+        self._last = -inf
+
+    def poll(self, now: float) -> List[float]:
+        new: List[float] = []
+        for msg in self.port.iter_pending():
+            if msg.type != "note_on" or msg.velocity == 0:
+                continue
+            if self.channel is not None and msg.channel != self.channel:
+                continue
+            if now - self._last >= 0.01:
+                new.append(now)
+                self._last = now
+        return new
+
+    def close(self) -> None:
+        self.port.close()
+
+
+@dataclass
+class LiveStats:
+    # 规划余量：碰撞时刻减去规划完成时的墙钟时刻，负值表示画面已经越过了这次碰撞
+    slack: OnlineStats = field(default_factory=OnlineStats)
+    error: OnlineStats = field(default_factory=OnlineStats)  # 音符的落地误差
+    frame: OnlineStats = field(default_factory=OnlineStats)  # 帧间隔
+    present: OnlineStats = field(default_factory=OnlineStats)  # 从帧对应的时刻到画面提交的延迟
+    notes: int = 0  # 到达的音符数
+    hits: int = 0  # 按时落地的音符数
+    missed: int = 0  # 来不及规划而跳过的音符数
+    unplanned: int = 0  # 找不到恢复系数而按边界默认恢复系数反弹的次数
+
+    def summary(self) -> Dict[str, float]:
+        """各项统计的均值与分位数，时间单位为 ms"""
+        res: Dict[str, float] = {"notes": self.notes, "hits": self.hits, "missed": self.missed}
+        res["unplanned"] = self.unplanned
+        for name in ("slack", "error", "frame", "present"):
+            stats: OnlineStats = getattr(self, name)
+            if stats.n == 0:
+                continue
+            res[f"{name}_mean_ms"] = stats.mean * 1e3
+            res[f"{name}_min_ms"] = stats.min * 1e3
+            res[f"{name}_max_ms"] = stats.max * 1e3
+            for q in (0.05, 0.5, 0.95):
+                res[f"{name}_p{round(q * 100)}_ms"] = stats.quantile(q) * 1e3
+        return res
+
+
+class LivePlanner:
+    """
+    以有界的前瞻窗口推进单球仿真
+
+    Args:
+        simulator (Simulator): 仿真器，time 应为 0
+        dt (float): 仿真步长
+        lookahead (float): 音符从到达到落地的延迟 (s)，也是输入到发声的延迟
+        clock (Callable[[], float]): 自开始起的墙钟秒数，用于统计规划余量
+    """
+
+    def __init__(self, simulator: Simulator, dt: float, lookahead: float, clock: Callable[[], float]):
+        if lookahead < MIN_LOOKAHEAD:
+            raise ValueError(f"lookahead should be at least {MIN_LOOKAHEAD} s, got {lookahead}")
+        self.simulator = simulator
+        self.dt = dt
+        self.lookahead = lookahead
+        self.clock = clock
+        self.stats = LiveStats()
+        self.pending: Deque[float] = deque()  # 已经到达、尚未规划的音符的落地时刻
+        self.horizon = lookahead  # 已知音符的时间上界
+        self.target: float | None = None  # 当前这段飞行对应的音符
+        self.last_note_time = 0.0  # 最近一次按时落地的音符
+        ball = simulator.ball
+        # 显示端用于重建位置的碰撞事件 (时刻, 碰后位置, 碰后速度)，只保留仍可能被查询的部分
+        self.events: Deque[Tuple[float, Tuple[float, float], Tuple[float, float]]] = deque(
+            [(0.0, ball.pos.as_tuple, ball.vel.as_tuple)]
+        )
+        self._acc = np.asarray(ball.acc)
+
+    def push(self, arrivals: List[float], now: float) -> None:
+        """登记截至 now 到达的音符"""
+        self.pending.extend(t + self.lookahead for t in arrivals)
+        self.stats.notes += len(arrivals)
+        self.horizon = now + self.lookahead
+
+    @property
+    def idle(self) -> bool:
+        """没有待落地的音符"""
+        return not self.pending and self.target is None
+
+    def advance(self) -> None:
+        """将仿真推进到已知音符允许的最远时刻 horizon - lookahead / 2"""
+        until = self.horizon - self.lookahead / 2
+        simulator = self.simulator
+        while simulator.time < until:
+            if simulator.step(self.dt):
+                self._bounce()
+
+    def _bounce(self) -> None:
+        simulator = self.simulator
+        ball = simulator.ball
+        t = simulator.time
+        if self.target is not None:
+            self._hit(t, self.target)
+            self.target = None
+        while self.pending and self.pending[0] <= t + self.dt:
+            note = self.pending.popleft()
+            if note > t - self.dt:  # 非音符反弹恰好落在音符上，同样算作按时落地
+                self._hit(t, note)
+            else:
+                self.stats.missed += 1
+
+        has_note = bool(self.pending)
+        desired_duration = self.pending[0] - t if has_note else self.lookahead / 4
+        while True:
+            desired_e = simulator.boundary.calc_desired_restitution(desired_duration, ball.pos, ball.vel, ball.acc)
+            if desired_e is not None or desired_duration <= 0.1:
+                break
+            has_note = False
+            desired_duration /= 2
+
+        if desired_e is None:
+            has_note = False
+            self.stats.unplanned += 1
+            simulator.resolve_collision()
+        else:
+            simulator.resolve_collision(override_e=desired_e[np.abs(np.log(desired_e)).argmin()].item())
+        if has_note:
+            self.target = self.pending.popleft()
+        self.events.append((t, ball.pos.as_tuple, ball.vel.as_tuple))
+        self.stats.slack.update(t - self.clock())
+
+    def _hit(self, t: float, note: float) -> None:
+        self.stats.error.update(t - note)
+        self.stats.hits += 1
+        self.last_note_time = t
+
+    def position_at(self, t: float) -> Tuple[float, float]:
+        """时刻 t 的小球位置，t 应单调不减；超出已仿真的部分时沿最后一段抛物线外推"""
+        events = self.events
+        while len(events) > 1 and events[1][0] <= t:
+            events.popleft()
+        t0, p0, v0 = events[0]
+        s = t - t0
+        return (
+            p0[0] + v0[0] * s + 0.5 * self._acc[0] * s * s,
+            p0[1] + v0[1] * s + 0.5 * self._acc[1] * s * s,
+        )
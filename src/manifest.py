@@ -0,0 +1,96 @@
+"""
+内容寻址的增量构建清单，覆盖 sim → render → combine 三个阶段
+
+每个产物以 (阶段名, 各输入的内容哈希) 为键登记，
+当同样的输入再次出现且产物未被改动时即可跳过该阶段，效果类似 make 的增量构建
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+from .utils import CACHE_PATH
+
+MANIFEST_PATH = CACHE_PATH / "manifest.json"
+
+
+def hash_json(obj: Any) -> str:
+    """对可 JSON 序列化的对象（如解析后的配置、渲染参数）计算规范化哈希"""
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path: Path = MANIFEST_PATH) -> None:
+        self.path = path
+        self.artifacts: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}  # 文件哈希缓存，以 (size, mtime_ns) 判断是否需要重新计算
+        self._load()
+
+    def _load(self) -> None:
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.artifacts = data.get("artifacts", {})
+            self.files = data.get("files", {})
+
+    def save(self) -> None:
+        """与磁盘上的清单合并后原子写回，允许多个进程交替更新"""
+        mine_artifacts, mine_files = self.artifacts, self.files
+        self._load()
+        self.artifacts.update(mine_artifacts)
+        self.files.update(mine_files)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"artifacts": self.artifacts, "files": self.files}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def hash_file(self, path: Path) -> str:
+        """计算文件内容哈希，未改动的文件直接使用缓存"""
+        stat = path.stat()
+        key = path.resolve().as_posix()
+        cached = self.files.get(key)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    @staticmethod
+    def _key(stage: str, inputs: Dict[str, str]) -> str:
+        return hash_json({"stage": stage, "inputs": inputs})
+
+    def lookup(self, stage: str, inputs: Dict[str, str]) -> Path | None:
+        """
+        查找由同样输入构建出的产物
+
+        Args:
+            stage (str): 阶段名
+            inputs (Dict[str, str]): 输入名到内容哈希的映射
+
+        Returns:
+            Path | None: 产物存在且未被改动时返回其路径，否则返回 None
+        """
+        entry = self.artifacts.get(self._key(stage, inputs))
+        if entry is None:
+            return None
+        output = Path(entry["output"])
+        if not output.exists() or self.hash_file(output) != entry["output_hash"]:
+            return None
+        return output
+
+    def record(self, stage: str, inputs: Dict[str, str], output: Path) -> None:
+        """登记一次构建的产物并写回清单"""
+        self.artifacts[self._key(stage, inputs)] = {
+            "stage": stage,
+            "inputs": inputs,
+            "output": output.resolve().as_posix(),
+            "output_hash": self.hash_file(output),
+        }
+        self.save()
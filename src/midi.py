@@ -1,11 +1,10 @@
 # pyright: standard
 import copy
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 import pretty_midi
-import soundfile as sf
 from rich import print
 
 from .utils import ASSETS_PATH, get_default_sf2_file
@@ -14,27 +13,64 @@ from .utils import ASSETS_PATH, get_default_sf2_file
 class NoteRecord:
     def __init__(self, midi_path: Path) -> None:
         self.pm = pretty_midi.PrettyMIDI(midi_path)
+        self.pitches: List[List[int]] = []  # 与 notes 一一对应，合并的音符取其中最高的音高
         self.notes = self._parse_notes()
         self.path = midi_path
         self.duration: float = self.pm.get_end_time()
 
     def _parse_notes(self) -> List[List[float]]:
         res: List[List[float]] = []
+        self.pitches = []
 
         for inst in self.pm.instruments:
-            start_times = sorted(float(n.start) for n in inst.notes)
-            merged_times = []
+            start_notes = sorted((float(n.start), n.pitch) for n in inst.notes)
+            merged_times: List[float] = []
+            merged_pitches: List[int] = []
 
-            for t in start_times:
+            for t, pitch in start_notes:
                 if t < 0.1:
                     continue
                 if not merged_times or t - merged_times[-1] >= 0.01:
                     merged_times.append(t)
+                    merged_pitches.append(pitch)
+                else:
+                    merged_pitches[-1] = max(merged_pitches[-1], pitch)
 
             res.append(merged_times)
+            self.pitches.append(merged_pitches)
 
         return res
 
+    def split_voices(self, inst_idx: int, n_voices: int) -> List[List[float]]:
+        """
+        按和弦将音轨拆分为 n_voices 个声部，供多球模式使用
+
+        与 _parse_notes 相同，起始时刻相差不足 0.01 s 的音符视为同一和弦；和弦中音高第 k 高的音符归入第 k 个声部，
+        超出声部数的音符并入最后一个声部（即仍然合并）
+        """
+        notes = sorted((float(n.start), n.pitch) for n in self.pm.instruments[inst_idx].notes if n.start >= 0.1)
+        voices: List[List[float]] = [[] for _ in range(n_voices)]
+
+        def flush(chord: List[Tuple[float, int]]) -> None:
+            for k, (t, _) in enumerate(sorted(chord, key=lambda n: -n[1])):
+                voice = voices[min(k, n_voices - 1)]
+                if not voice or t - voice[-1] >= 0.01:
+                    voice.append(t)
+
+        chord: List[Tuple[float, int]] = []
+        for t, pitch in notes:
+            if chord and t - chord[0][0] >= 0.01:
+                flush(chord)
+                chord = []
+            chord.append((t, pitch))
+        flush(chord)
+        return voices
+
+
+def wav_path_for(midi_path: Path, track_indices: List[int], wav_output_path: Path) -> Path:
+    """midi_tracks_to_wav 为指定轨道生成的 WAV 文件路径"""
+    return wav_output_path / (midi_path.stem + "-" + "-".join(str(i) for i in track_indices) + ".wav")
+
 
 def midi_tracks_to_wav(
     midi_path: Path,
@@ -42,6 +78,7 @@ def midi_tracks_to_wav(
     wav_output_path: Path,
     sr: int = 44100,
     soundfont_path: Path | None = None,
+    overwrite: bool = False,
 ) -> Path:
     """
     从 MIDI 文件提取指定轨道，生成 WAV 文件。
@@ -52,11 +89,14 @@ def midi_tracks_to_wav(
         wav_output_path (Path): 输出 WAV 文件路径
         fs (int): 采样率，默认 44100
         soundfont_path (Path | None): 可选 SoundFont 文件路径，如果 None 使用默认
+        overwrite (bool): 已存在同名 WAV 时是否重新生成（如 SoundFont 已更换）
     """
+    import soundfile as sf
+
     soundfont_path = get_default_sf2_file() if soundfont_path is None else soundfont_path
-    wav_output_path = wav_output_path / (midi_path.stem + "-" + "-".join(str(i) for i in track_indices) + ".wav")
+    wav_output_path = wav_path_for(midi_path, track_indices, wav_output_path)
     wav_output_path.parent.mkdir(parents=True, exist_ok=True)
-    if wav_output_path.exists():
+    if wav_output_path.exists() and not overwrite:
         return wav_output_path
 
     # 读取 MIDI
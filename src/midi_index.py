@@ -0,0 +1,209 @@
+# pyright: standard
+"""
+曲库索引：预先统计 assets/midi 下每个文件每条音轨的可演奏性指标，用于挑选 music.inst_idx
+
+每条音轨一行，按列保存在 .cache/midi_index.npz 中：乐器、音符数、合并后的起音数、时长、起音间隔的分布与最小间隔。
+起音与仿真使用的 NoteRecord.notes 完全相同（舍弃开头 0.1 s、合并相距不足 0.01 s 的音符），
+音频文件按起音检测的结果计为一条音轨。
+更新时只重新解析内容哈希变化的文件，查询在内存中的列上用 NumPy 布尔掩码完成，例如：
+
+    index = MidiIndex.load().update()
+    index.query("n_onsets >= 200 and min_gap >= 0.12").rows()
+"""
+
+from __future__ import annotations
+
+import operator
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+import numpy as np
+from rich import print
+
+from .manifest import Manifest
+from .midi import NoteRecord
+from .onset import AUDIO_SUFFIXES, load_notes
+from .utils import ASSETS_PATH, CACHE_PATH
+
+if TYPE_CHECKING:
+    from jaxtyping import Bool
+
+INDEX_PATH = CACHE_PATH / "midi_index.npz"
+INDEX_VERSION = 1
+MIDI_SUFFIXES = (".mid", ".midi")
+IOI_QUANTILES = (5, 25, 50, 75, 95)
+
+# 列名 -> dtype；音频文件没有乐器信息，program 为 -1
+COLUMNS: Dict[str, str] = {
+    "midi": "U",  # 相对 assets/midi 的路径，即 music.midi
+    "hash": "U64",
+    "track": "i4",
+    "name": "U",
+    "program": "i2",
+    "is_drum": "?",
+    "n_notes": "i4",  # 原始音符数
+    "n_onsets": "i4",  # 合并后的起音数，即小球需要的碰撞数
+    "duration": "f8",  # 整个文件的时长 (s)
+    "first_onset": "f8",
+    "last_onset": "f8",
+    "min_gap": "f8",  # 最小起音间隔 (s)，起音不足两个时为 nan
+    "ioi_mean": "f8",
+    **{f"ioi_p{q}": "f8" for q in IOI_QUANTILES},
+}
+
+OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+CONDITION_RE = re.compile(r"^\s*(\w+)\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*$")
+
+
+def track_rows(path: Path, relative: str, file_hash: str) -> List[Dict[str, Any]]:
+    """解析一个 MIDI 或音频文件，返回每条音轨的一行指标"""
+    notes = load_notes(path)
+    rows: List[Dict[str, Any]] = []
+    for k, onsets in enumerate(notes.notes):
+        t = np.asarray(onsets, dtype=np.float64)
+        ioi = np.diff(t)
+        row: Dict[str, Any] = {
+            "midi": relative,
+            "hash": file_hash,
+            "track": k,
+            "name": "",
+            "program": -1,
+            "is_drum": False,
+            "n_notes": len(t),
+            "n_onsets": len(t),
+            "duration": notes.duration,
+            "first_onset": t[0] if len(t) else np.nan,
+            "last_onset": t[-1] if len(t) else np.nan,
+            "min_gap": ioi.min() if len(ioi) else np.nan,
+            "ioi_mean": ioi.mean() if len(ioi) else np.nan,
+        }
+        quantiles = np.percentile(ioi, IOI_QUANTILES) if len(ioi) else [np.nan] * len(IOI_QUANTILES)
+        row.update({f"ioi_p{q}": v for q, v in zip(IOI_QUANTILES, quantiles)})
+        if isinstance(notes, NoteRecord):
+            inst = notes.pm.instruments[k]
+            row.update(name=inst.name, program=inst.program, is_drum=inst.is_drum, n_notes=len(inst.notes))
+        rows.append(row)
+    return rows
+
+
+class MidiIndex:
+    def __init__(self, columns: Dict[str, np.ndarray] | None = None, root: Path = ASSETS_PATH / "midi") -> None:
+        self.root = root
+        if columns is None:
+            columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["midi"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH, root: Path = ASSETS_PATH / "midi") -> MidiIndex:
+        """读取索引，不存在或版本不符时返回空索引"""
+        if not path.exists():
+            return cls(root=root)
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["_version"]) != INDEX_VERSION or set(COLUMNS) - set(data.files):
+                return cls(root=root)
+            return cls({name: data[name] for name in COLUMNS}, root)
+
+    def save(self, path: Path = INDEX_PATH) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        data: Dict[str, Any] = {"_version": np.int32(INDEX_VERSION), **self.columns}
+        np.savez_compressed(tmp_path, **data)
+        tmp_path.replace(path)
+        return path
+
+    def update(self, manifest: Manifest | None = None, verbose: bool = False) -> MidiIndex:
+        """
+        扫描 root 下的 MIDI 与音频文件，只重新解析内容哈希变化的文件，已删除文件的行一并去掉
+
+        文件哈希沿用构建清单中以 (size, mtime) 缓存的结果，未改动的文件不会重新读取
+        """
+        manifest = Manifest() if manifest is None else manifest
+        known = dict(zip(self.columns["midi"].tolist(), self.columns["hash"].tolist()))
+        keep = np.zeros(len(self), dtype=bool)
+        new_rows: List[Dict[str, Any]] = []
+        for path in sorted(self.root.rglob("*")):
+            if path.suffix.lower() not in MIDI_SUFFIXES + AUDIO_SUFFIXES or not path.is_file():
+                continue
+            relative = path.relative_to(self.root).as_posix()
+            file_hash = manifest.hash_file(path)
+            if known.get(relative) == file_hash:
+                keep |= self.columns["midi"] == relative
+                continue
+            if verbose:
+                print(f"Indexing {relative}")
+            try:
+                new_rows.extend(track_rows(path, relative, file_hash))
+            except Exception as e:  # 损坏的文件不影响其余文件
+                print(f"Skipping {relative}: {e}")
+        manifest.save()
+
+        columns = {name: col[keep] for name, col in self.columns.items()}
+        if new_rows:
+            for name, dtype in COLUMNS.items():
+                added = np.array([row[name] for row in new_rows], dtype=dtype)
+                columns[name] = np.concatenate([columns[name], added])
+        order = np.lexsort((columns["track"], columns["midi"]))
+        self.columns = {name: col[order] for name, col in columns.items()}
+        return self
+
+    def mask(self, expr: str | None) -> Bool[np.ndarray, "n"]:
+        """
+        解析 "列 运算符 值" 以 and 连接的条件，返回满足条件的行
+
+        数值列的值按数字比较，其余按字符串比较，nan 不满足任何条件
+        """
+        result = np.ones(len(self), dtype=bool)
+        if not expr or not expr.strip():
+            return result
+        for condition in re.split(r"\s+and\s+|,", expr.strip()):
+            m = CONDITION_RE.match(condition)
+            if m is None:
+                raise ValueError(f"Cannot parse condition: {condition!r}")
+            name, op, raw = m.groups()
+            if name not in self.columns:
+                raise ValueError(f"Unknown column {name!r}, available: {', '.join(COLUMNS)}")
+            column = self.columns[name]
+            raw = raw.strip("'\"")
+            if column.dtype.kind == "b":
+                value: Any = raw.lower() in ("1", "true", "yes")
+            elif column.dtype.kind in "iuf":
+                value = float(raw)
+            else:
+                value = raw
+            result &= OPERATORS[op](column, value)
+        return result
+
+    def query(self, expr: str | None = None, sort: str | None = None, descending: bool = False) -> MidiIndex:
+        """满足条件的行组成的子索引，可按某一列排序"""
+        idx = np.flatnonzero(self.mask(expr))
+        if sort is not None:
+            idx = idx[np.argsort(self.columns[sort][idx], kind="stable")]
+            if descending:
+                idx = idx[::-1]
+        return MidiIndex({name: col[idx] for name, col in self.columns.items()}, self.root)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return [{name: col[k].item() for name, col in self.columns.items()} for k in range(len(self))]
+
+    def tracks(self, midi: str, expr: str | None = None) -> List[int]:
+        """某个文件中满足条件的音轨"""
+        m = self.mask(expr) & (self.columns["midi"] == midi)
+        return self.columns["track"][m].tolist()
+
+    def files(self, pattern: str = "*") -> List[str]:
+        """按 glob 模式匹配已索引的文件（相对 root 的路径）"""
+        return [f for f in dict.fromkeys(self.columns["midi"].tolist()) if Path(f).match(pattern)]
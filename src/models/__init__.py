@@ -1,3 +1,16 @@
 # pyright: reportUnusedImport=false
-from .hydra import Config
+from typing import TYPE_CHECKING, Any
+
 from .manim import *
+
+if TYPE_CHECKING:
+    from .hydra import Config
+
+
+def __getattr__(name: str) -> Any:
+    # Hydra 的配置模式只在需要时导入，仿真核心不依赖 Hydra
+    if name == "Config":
+        from .hydra import Config
+
+        return Config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
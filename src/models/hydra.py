@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 from hydra.core.config_store import ConfigStore
 from omegaconf import MISSING
@@ -33,15 +34,58 @@ class EllipseConfig(BoundaryConfig):
     b: float = MISSING
 
 
+@dataclass
+class PolygonConfig(BoundaryConfig):
+    type: str = "polygon"
+    # 显式给出顶点（圆心限制区域），为空时按下面的参数生成正多边形或星形
+    vertices: List[List[float]] = field(default_factory=lambda: [])
+    sides: int = 6
+    radius: float = 5.5
+    inner_radius: Optional[float] = None  # 给定时生成 sides 个角的星形，凹角处规划器可能无解
+    rotation: float = 90.0  # 第一个顶点的极角（度）
+
+
+@dataclass
+class SDFConfig(BoundaryConfig):
+    type: str = "sdf"
+    source: str = MISSING  # SVG 路径或位图遮罩，相对路径相对于 assets/
+    size: float = 11.0  # 形状最长边缩放到的长度（圆心限制区域）
+    resolution: int = 256  # 最长边上的距离场网格数
+    invert: bool = False  # 位图遮罩中暗色为内部
+
+
 @dataclass
 class MusicConfig:
     midi: str
     inst_idx: int
 
 
+@dataclass
+class TelemetryConfig:
+    enabled: bool = False  # 逐步记录时间、位置、速度与约束值，保存在记录旁的 telemetry.npz
+    mode: str = "ring"  # ring: 只保留最近 capacity 个样本；full: 完整轨迹
+    capacity: int = 100_000
+    decimation: int = 1  # 每隔多少步记录一次
+
+
 @dataclass
 class SimulationConfig:
     dt: float
+    force: bool = False  # 忽略构建清单，强制重新仿真
+    profile: bool = False  # 插桩统计各阶段耗时，报告保存在记录旁的 profile.json
+    telemetry: TelemetryConfig = field(default_factory=TelemetryConfig)
+    # 每消耗一个音符记录一个检查点并随记录保存，用于增量重新仿真与中断后继续；设置 resume_from 时总是记录
+    checkpoints: bool = False
+    # 从已有记录的检查点继续仿真：记录路径，或 latest 表示 outputs/ 下最新的记录
+    resume_from: Optional[str] = None
+
+
+@dataclass
+class PolyphonyConfig:
+    voices: int = 1  # 大于 1 时按和弦将 music.inst_idx 拆分为多个声部，每个声部一个小球
+    tracks: List[int] = field(default_factory=lambda: [])  # 非空时每条音轨一个小球，优先于 voices
+    spacing: float = 1.5  # 各小球初始位置沿 x 方向的间距，以 ball.pos 为中心排开
+    ball_restitution: float = 1.0  # 小球之间碰撞的恢复系数
 
 
 @dataclass
@@ -50,6 +94,7 @@ class Config:
     boundary: BoundaryConfig
     music: MusicConfig
     simulation: SimulationConfig
+    polyphony: PolyphonyConfig = field(default_factory=PolyphonyConfig)
 
 
 cs = ConfigStore.instance()
@@ -57,4 +102,6 @@ cs.store(name="base_config", node=Config)
 cs.store(group="ball", name="ball_schema", node=BallConfig)
 cs.store(group="boundary", name="circle_schema", node=CircleConfig)
 cs.store(group="boundary", name="ellipse_schema", node=EllipseConfig)
+cs.store(group="boundary", name="polygon_schema", node=PolygonConfig)
+cs.store(group="boundary", name="sdf_schema", node=SDFConfig)
 cs.store(group="music", name="music_schema", node=MusicConfig)
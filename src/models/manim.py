@@ -1,9 +1,20 @@
-from dataclasses import dataclass, field
-from typing import List, Tuple
+from dataclasses import MISSING, dataclass, field, fields
+from typing import Any, Dict, List, Tuple
 
 Vec2 = Tuple[float, float]
 
 
+def _fill_defaults(obj: Any, state: Dict[str, Any]) -> None:
+    """反序列化旧版 pickle 时补上之后新增字段的默认值"""
+    for f in fields(obj):
+        if f.name not in state:
+            if f.default is not MISSING:
+                state[f.name] = f.default
+            elif f.default_factory is not MISSING:
+                state[f.name] = f.default_factory()
+    obj.__dict__.update(state)
+
+
 @dataclass
 class MetaBall:
     radius: float
@@ -24,15 +35,41 @@ class MetaEllipse:
         self.type = "ellipse"
 
 
+@dataclass
+class MetaPolygon:
+    vertices: List[Vec2]  # 逆时针顺序的圆心限制区域顶点
+
+    def __post_init__(self):
+        self.type = "polygon"
+        self.vertices = [(float(v[0]), float(v[1])) for v in self.vertices]
+
+
+@dataclass
+class MetaSDF:
+    source: str  # SVG 或位图文件，相对路径相对于 assets/
+    size: float
+    resolution: int
+    invert: bool = False
+    digest: str = ""  # 源文件内容与构建参数的哈希，用于发现源文件被修改
+
+    def __post_init__(self):
+        self.type = "sdf"
+
+
 @dataclass
 class MetaData:
     ball: MetaBall
-    boundary: MetaEllipse
+    boundary: MetaEllipse | MetaPolygon | MetaSDF
     dt: float
     midi_file: str
     inst_idx: int
     prefix_free_time: float = 0.0
     music_total_time: float = 0.0
+    extra_balls: List[MetaBall] = field(default_factory=lambda: [])  # 多球模式下的其余小球，编号从 1 开始
+    tracks: List[int] = field(default_factory=lambda: [])  # 多球模式下发声的音轨，为空时即 inst_idx
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        _fill_defaults(self, state)
 
 
 # --------------------
@@ -44,6 +81,10 @@ class CollisionEvent:
     position: Vec2  # 碰撞点坐标
     velocity_after: Vec2  # 碰撞后速度
     is_note_event: bool = False  # 是否对应音符
+    ball: int = 0  # 多球模式下的小球编号
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        _fill_defaults(self, state)
 
 
 # --------------------
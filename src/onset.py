@@ -0,0 +1,138 @@
+"""
+音频起音检测：让 WAV/FLAC 等音频文件像 MIDI 一样驱动仿真
+
+AudioOnsetRecord 与 NoteRecord 的接口相同（notes / duration / path），音频只有一条音轨。
+音频经 soundfile 分块读取，每块内用 NumPy 一次性计算所有 STFT 帧的对数幅度谱，逐帧的正向谱通量即起音包络，
+跨块时只保留不足一帧的尾部样本与上一帧的幅度谱，内存占用与音频长度无关（包络本身只有音频的 1/HOP 大小）。
+包络的局部极大值且高于局部均值一定阈值处即为起音，再按与 NoteRecord 相同的规则舍弃开头 0.1 s 内的起音、
+合并相距不足 0.01 s 的起音
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, List
+
+import numpy as np
+
+from .midi import NoteRecord
+
+if TYPE_CHECKING:
+    from jaxtyping import Float
+
+AUDIO_SUFFIXES = (".wav", ".flac", ".ogg", ".aiff", ".aif", ".mp3")
+
+BLOCK_SIZE = 1 << 16  # 每次读取的样本数
+N_FFT_TIME = 0.023  # STFT 窗长 (s)，取最接近的 2 的幂个样本；窗越长，检测到的起音越提前
+HOP_TIME = 0.005  # 帧移 (s)
+LOG_GAIN = 10.0  # 对数压缩 log(1 + LOG_GAIN * |X|)，|X| 以窗函数之和归一化，满幅正弦约为 0.5
+PEAK_WINDOW = 0.03  # 起音须是前后 PEAK_WINDOW 内包络的最大值
+MEAN_WINDOW = 0.1  # 自适应阈值取前后 MEAN_WINDOW 内包络的均值
+DEFAULT_THRESHOLD = 0.1  # 起音须高出局部均值的量，包络已归一化到 [0, 1]
+
+# 与 NoteRecord 一致
+LEAD_IN = 0.1
+MERGE_GAP = 0.01
+
+
+def is_audio_file(path: Path) -> bool:
+    return path.suffix.lower() in AUDIO_SUFFIXES
+
+
+class AudioOnsetRecord:
+    def __init__(self, audio_path: Path, threshold: float = DEFAULT_THRESHOLD) -> None:
+        import soundfile as sf
+
+        info = sf.info(audio_path.as_posix())
+        self.path = audio_path
+        self.sr: int = info.samplerate
+        self.duration: float = info.frames / info.samplerate
+        self.hop = max(1, round(self.sr * HOP_TIME))
+        self.n_fft = 1 << round(np.log2(self.sr * N_FFT_TIME))
+        self.threshold = threshold
+        self.notes = [self._detect_onsets()]
+
+    def _detect_onsets(self) -> List[float]:
+        envelope = self.onset_envelope()
+        peaks = pick_peaks(envelope, self.hop / self.sr, self.threshold)
+        return merge_onsets(peaks)
+
+    def onset_envelope(self) -> Float[np.ndarray, "n"]:
+        """
+        逐帧的正向谱通量，第 k 帧以第 k * hop 个样本为中心
+
+        音频开头与结尾各补半帧零，使每个样本都落在某一帧的中心附近
+        """
+        import soundfile as sf
+
+        window = np.hanning(self.n_fft).astype(np.float32)
+        chunks: List[np.ndarray] = []
+        pending = np.zeros(self.n_fft // 2, dtype=np.float32)  # 尚未构成完整一帧的样本
+        prev: np.ndarray | None = None  # 上一帧的对数幅度谱
+
+        def consume(samples: np.ndarray) -> np.ndarray:
+            nonlocal prev
+            n_frames = (len(samples) - self.n_fft) // self.hop + 1
+            if n_frames <= 0:
+                return samples
+            frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[:: self.hop][:n_frames]
+            spectrum = np.log1p(LOG_GAIN / window.sum() * np.abs(np.fft.rfft(frames * window, axis=1)))
+            base = spectrum[0] if prev is None else prev  # 第一帧与自身比较，开头的声音不算作起音
+            diff = np.diff(spectrum, axis=0, prepend=base[None, :])
+            chunks.append(np.maximum(diff, 0.0).sum(axis=1, dtype=np.float64))
+            prev = spectrum[-1]
+            return samples[n_frames * self.hop :]
+
+        with sf.SoundFile(self.path.as_posix()) as f:
+            for block in f.blocks(blocksize=BLOCK_SIZE, dtype="float32", always_2d=True):
+                pending = consume(np.concatenate([pending, block.mean(axis=1)]))
+        consume(np.concatenate([pending, np.zeros(self.n_fft // 2, dtype=np.float32)]))
+        return np.concatenate(chunks) if chunks else np.zeros(0)
+
+
+def pick_peaks(envelope: Float[np.ndarray, "n"], frame_time: float, threshold: float) -> Float[np.ndarray, "m"]:
+    """
+    在起音包络中挑选峰值，返回起音时刻 (s)
+
+    峰值须是前后 PEAK_WINDOW 内的最大值，且高出前后 MEAN_WINDOW 内的均值 threshold；
+    时刻由峰值与相邻两帧的抛物线插值细化到帧以下
+    """
+    if len(envelope) < 3 or envelope.max() <= 0:
+        return np.zeros(0)
+    env = envelope / envelope.max()
+
+    w = max(1, round(PEAK_WINDOW / frame_time))
+    padded = np.pad(env, w, constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * w + 1).max(axis=1)
+
+    m = max(1, round(MEAN_WINDOW / frame_time))
+    csum = np.concatenate([[0.0], np.cumsum(env)])
+    lo = np.clip(np.arange(len(env)) - m, 0, len(env))
+    hi = np.clip(np.arange(len(env)) + m + 1, 0, len(env))
+    local_mean = (csum[hi] - csum[lo]) / (hi - lo)
+
+    k = np.flatnonzero((env == local_max) & (env >= local_mean + threshold))
+    k = k[(k > 0) & (k < len(env) - 1)]
+    a, b, c = env[k - 1], env[k], env[k + 1]
+    denom = a - 2 * b + c
+    offset = np.divide(0.5 * (a - c), denom, out=np.zeros_like(b), where=denom < 0)
+    return (k + np.clip(offset, -0.5, 0.5)) * frame_time
+
+
+def merge_onsets(times: Float[np.ndarray, "n"]) -> List[float]:
+    """舍弃开头 LEAD_IN 内的起音，并将与上一个保留的起音相距不足 MERGE_GAP 的起音并入其中"""
+    merged: List[float] = []
+    for t in np.sort(times).tolist():
+        if t < LEAD_IN:
+            continue
+        if not merged or t - merged[-1] >= MERGE_GAP:
+            merged.append(t)
+    return merged
+
+
+NoteSource = NoteRecord | AudioOnsetRecord
+
+
+def load_notes(path: Path) -> NoteSource:
+    """按扩展名读取 MIDI 或音频文件"""
+    return AudioOnsetRecord(path) if is_audio_file(path) else NoteRecord(path)
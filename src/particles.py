@@ -0,0 +1,131 @@
+"""
+基于 NumPy 数组的粒子系统，用于碎裂收尾与碰撞火花效果
+
+位置、速度、颜色与寿命都保存在预分配的数组中，每帧只做一次向量化更新，
+不为单个粒子创建 Python 对象，渲染器按活跃粒子的数组批量绘制
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from jaxtyping import Bool, Float, Int, UInt8
+
+
+class ParticleSystem:
+    def __init__(self, capacity: int, acc: Sequence[float] = (0.0, 0.0)):
+        self.capacity = capacity
+        self.acc = np.asarray(acc, dtype=np.float64)
+
+        self.pos: Float[np.ndarray, "n 2"] = np.zeros((capacity, 2))
+        self.vel: Float[np.ndarray, "n 2"] = np.zeros((capacity, 2))
+        self.color: UInt8[np.ndarray, "n 3"] = np.zeros((capacity, 3), dtype=np.uint8)
+        self.radius: Float[np.ndarray, "n"] = np.zeros(capacity)
+        self.age: Float[np.ndarray, "n"] = np.zeros(capacity)
+        self.lifetime: Float[np.ndarray, "n"] = np.ones(capacity)
+        self.alive: Bool[np.ndarray, "n"] = np.zeros(capacity, dtype=np.bool_)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.alive))
+
+    def emit(
+        self,
+        pos: Float[np.ndarray, "m 2"],
+        vel: Float[np.ndarray, "m 2"],
+        color: Sequence[int],
+        radius: float,
+        lifetime: float,
+    ) -> Int[np.ndarray, "k"]:
+        """
+        向空闲槽位写入一批粒子，粒子池已满时多余的粒子被丢弃
+
+        Returns:
+            Int[np.ndarray, "k"]: 实际写入的槽位索引
+        """
+        pos = np.atleast_2d(pos)
+        free = np.flatnonzero(~self.alive)[: len(pos)]
+        n = len(free)
+        self.pos[free] = pos[:n]
+        self.vel[free] = np.atleast_2d(vel)[:n]
+        self.color[free] = color
+        self.radius[free] = radius
+        self.age[free] = 0.0
+        self.lifetime[free] = lifetime
+        self.alive[free] = True
+        return free
+
+    def update(self, dt: float) -> None:
+        """所有粒子一次性步进 dt，寿命耗尽的粒子回收进粒子池"""
+        alive = self.alive
+        self.vel[alive] += self.acc * dt
+        self.pos[alive] += self.vel[alive] * dt
+        self.age[alive] += dt
+        self.alive &= self.age < self.lifetime
+
+    @property
+    def alpha(self) -> Float[np.ndarray, "n"]:
+        """不透明度随寿命线性衰减"""
+        return np.clip(1.0 - self.age / self.lifetime, 0.0, 1.0)
+
+    def active(self) -> Int[np.ndarray, "k"]:
+        return np.flatnonzero(self.alive)
+
+
+def sample_in_disc(rng: np.random.Generator, n: int, radius: float) -> Float[np.ndarray, "n 2"]:
+    """在圆盘内均匀采样 n 个点"""
+    r = radius * np.sqrt(rng.random(n))
+    theta = 2 * np.pi * rng.random(n)
+    return np.stack([r * np.cos(theta), r * np.sin(theta)], axis=-1)
+
+
+def emit_shatter(
+    system: ParticleSystem,
+    center: Sequence[float],
+    base_vel: Sequence[float],
+    ball_radius: float,
+    color: Sequence[int],
+    n_pieces: int = 8,
+    run_time: float = 2.0,
+    rng: np.random.Generator | None = None,
+) -> Int[np.ndarray, "k"]:
+    """
+    让主球分裂成 n_pieces 个小球，在 run_time 内沿各自方向飞出并逐渐消失
+
+    Args:
+        base_vel: 碎片整体的位移（run_time 内），各碎片在此基础上叠加随机方向的位移
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    piece_radius = ball_radius / (n_pieces**0.5)
+    pos = np.asarray(center, dtype=np.float64) + sample_in_disc(rng, n_pieces, ball_radius - piece_radius)
+
+    # 随机方向和速度
+    angles = rng.uniform(0, 2 * np.pi, n_pieces)
+    speeds = rng.uniform(0.5, 1.5, n_pieces)
+    directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+    offsets = np.asarray(base_vel, dtype=np.float64) + directions * speeds[:, None]
+    return system.emit(pos, offsets / run_time, color, piece_radius, run_time)
+
+
+def emit_sparks(
+    system: ParticleSystem,
+    pos: Sequence[float],
+    normal: Sequence[float],
+    color: Sequence[int],
+    radius: float,
+    n: int = 12,
+    speed: float = 4.0,
+    spread: float = np.pi / 3,
+    lifetime: float = 0.35,
+    rng: np.random.Generator | None = None,
+) -> Int[np.ndarray, "k"]:
+    """在碰撞点沿内法向喷出一簇火花"""
+    rng = np.random.default_rng() if rng is None else rng
+    base = np.arctan2(-normal[1], -normal[0])
+    angles = base + rng.uniform(-spread / 2, spread / 2, n)
+    speeds = speed * rng.uniform(0.5, 1.0, n)
+    vel = np.stack([np.cos(angles), np.sin(angles)], axis=-1) * speeds[:, None]
+    return system.emit(np.broadcast_to(np.asarray(pos, dtype=np.float64), (n, 2)), vel, color, radius, lifetime)
+
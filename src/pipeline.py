@@ -0,0 +1,226 @@
+"""
+进程内的端到端流程：仿真 → 渲染 → 合成
+
+记录直接在内存中交给渲染器，音频合成与视频渲染并行执行，
+Hydra 只是可选的前端（见 scripts/run_pipeline.py），这里只需要一个结构与 Config 相同的配置对象
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from rich import print
+
+from .impact import impact_wav_path, impacts_to_wav
+from .midi import NoteRecord, midi_tracks_to_wav, wav_path_for
+from .models.manim import MetaData, SimulationRecord
+from .onset import is_audio_file
+from .planner import prepare_simulation, run_simulation
+from .polyphony import polyphony_enabled, prepare_polyphonic_simulation, run_polyphonic_simulation
+from .record import RECORD_SUFFIX, RecordArrays, audio_tracks, save_record, video_stem
+from .supervisor import Stage, measure, run_stage, run_stages
+from .utils import ASSETS_PATH, PROJECT_ROOT
+from .utils.usable_class import OnlineStats
+
+if TYPE_CHECKING:
+    from .models.hydra import Config
+
+VIDEO_PATH = PROJECT_ROOT / "manim-videos"
+FINAL_PATH = PROJECT_ROOT / "final-videos"
+
+# 草稿渲染：只用于调参时检查运动，低分辨率、低帧率、最快的编码预设，输出到各视频目录下的 draft/
+DRAFT_SIZE = 240
+DRAFT_FPS = 15
+DRAFT_PRESET = "ultrafast"
+DRAFT_DIR = "draft"
+
+# 音频来源：FluidSynth 按 MIDI 合成，或在每次碰撞处放置撞击声（src/impact.py）
+AUDIO_BACKENDS = ("fluidsynth", "impact")
+
+
+@dataclass
+class PipelineResult:
+    video_path: Path
+    record: SimulationRecord
+    timings: Dict[str, float] = field(default_factory=lambda: {})  # 各阶段耗时 (s)
+
+
+def build_mux_command(videos: List[Path], wav_path: Path, offsets_ms: List[int], output: Path) -> List[str]:
+    """
+    构建将各轨视频与音频合成为最终视频的 ffmpeg 命令
+
+    Args:
+        videos (List[Path]): 各轨渲染视频
+        wav_path (Path): 音频文件
+        offsets_ms (List[int]): 各轨第一次碰撞的时刻 (ms)，音频与其余视频按最大值对齐
+        output (Path): 输出路径
+    """
+    audio_offset_ms = max(offsets_ms)
+    video_delays_sec = [(audio_offset_ms - o) / 1000 for o in offsets_ms]
+
+    match len(videos):
+        case 1:
+            return (
+                ["ffmpeg"]
+                + ["-i", videos[0].as_posix()]
+                + ["-i", wav_path.as_posix()]
+                + ["-filter_complex", f"[1:a]adelay={audio_offset_ms}[aout]"]
+                + ["-map", "0:v", "-map", "[aout]"]
+                + ["-c:v", "copy", "-c:a", "aac"]
+                + ["-strict", "experimental"]
+                + [output.as_posix(), "-y"]
+            )
+        case 2:
+            filter_complex = (  # 没有逗号，隐式拼接
+                f"[0:v]tpad=start_duration={video_delays_sec[0]}[v0];"
+                f"[1:v]tpad=start_duration={video_delays_sec[1]}[v1];"
+                f"[v0][v1]hstack=inputs=2[vout];"
+                f"[2:a]adelay={audio_offset_ms}[aout]"
+            )
+
+            return (
+                ["ffmpeg"]
+                + ["-i", videos[0].as_posix()]
+                + ["-i", videos[1].as_posix()]
+                + ["-i", wav_path.as_posix()]
+                + ["-filter_complex", filter_complex]
+                + ["-map", "[vout]", "-map", "[aout]"]
+                + ["-c:v", "libx264", "-c:a", "aac"]
+                + ["-strict", "experimental"]
+                + [output.as_posix(), "-y"]
+            )
+        case _:
+            raise NotImplementedError(f"Combining {len(videos)} tracks is not implemented yet.")
+
+
+def mux_cached_audio(video_paths: List[Path], meta: MetaData, first_collision_time: float) -> Path | None:
+    """
+    将 assets/wav 中已经合成好的音频混入同一记录的各个视频，原地替换，各视频的合成并发执行；
+    优先使用 FluidSynth 合成的 WAV，其次是 combine_video.py --audio impact 合成的撞击音，
+    不调用 FluidSynth，没有缓存的音频时返回 None
+
+    Args:
+        video_paths (List[Path]): 渲染好的视频
+        meta (MetaData): 记录的元数据，用于确定 MIDI 文件与轨道
+        first_collision_time (float): 第一次碰撞的时刻 (s)，音频按其延后，与 combine_video.py 一致；
+            撞击音同样以第一次碰撞为零点，延后量相同
+    """
+    midi_path = Path(meta.midi_file)
+    if is_audio_file(midi_path):  # 音频来源本身就是配乐
+        wav_paths = [midi_path]
+    else:
+        tracks = audio_tracks(meta)
+        wav_paths = [
+            wav_path_for(midi_path, tracks, ASSETS_PATH / "wav"),
+            impact_wav_path(midi_path, tracks, ASSETS_PATH / "wav"),
+        ]
+    wav_path = next((p for p in wav_paths if p.exists()), None)
+    if wav_path is None:
+        return None
+    stages: List[Stage] = []
+    for video_path in video_paths:
+        muxed = video_path.with_name(video_path.stem + ".audio" + video_path.suffix)
+        ffmpeg_cmd = build_mux_command([video_path], wav_path, [int(first_collision_time * 1000)], muxed)
+        stages.append(Stage("mux", ffmpeg_cmd, kind="ffmpeg", tags={"output": video_path.as_posix()}))
+    run_stages(stages)
+    for video_path in video_paths:
+        video_path.with_name(video_path.stem + ".audio" + video_path.suffix).replace(video_path)
+    return wav_path
+
+
+def _timed_midi_tracks_to_wav(
+    midi_path: Path, track_indices: List[int], soundfont_path: Path | None
+) -> Tuple[Path, float]:
+    """在子进程中执行，返回 WAV 路径与耗时"""
+    with measure("audio") as metrics:
+        wav_path = midi_tracks_to_wav(
+            midi_path, track_indices, wav_output_path=ASSETS_PATH / "wav", soundfont_path=soundfont_path
+        )
+    return wav_path, metrics.wall_time
+
+
+def run_pipeline(
+    config: Config,
+    size: int = 960,
+    fps: int = 30,
+    soundfont_path: Path | None = None,
+    audio: str = "fluidsynth",
+) -> PipelineResult:
+    """
+    在进程内完成仿真、渲染与合成，返回最终视频路径与各阶段耗时
+
+    Args:
+        config (Config): 仿真配置，可由 Hydra 生成，也可直接构造各 dataclass
+        size (int): 视频边长 (px)
+        fps (int): 帧率
+        soundfont_path (Path | None): SoundFont 文件路径，None 时使用 assets/sf2 下的默认文件
+        audio (str): 音频来源，见 AUDIO_BACKENDS；impact 不需要 FluidSynth 与 SoundFont
+
+    Returns:
+        PipelineResult: 最终视频路径、仿真记录与各阶段耗时
+
+    Raises:
+        RuntimeError: 仿真没有记录到任何碰撞
+    """
+    # 渲染器依赖 pygame，只在真正需要渲染时导入
+    from .pygame_renderer import render_video
+    from .render_cache import ChunkCache
+
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    midi_path = ASSETS_PATH / "midi" / config.music.midi
+
+    with measure("simulate") as metrics:
+        if polyphony_enabled(config.polyphony):
+            poly_simulator, midi, record, voices = prepare_polyphonic_simulation(config, midi_path)
+            run_polyphonic_simulation(poly_simulator, midi, voices, record, OnlineStats(), OnlineStats())
+        else:
+            simulator, midi, record = prepare_simulation(config, midi_path)
+            run_simulation(simulator, midi, record, OnlineStats(), OnlineStats())
+    timings["simulate"] = metrics.wall_time
+    arrays = RecordArrays.from_record(record)
+    if len(arrays) == 0:
+        # 没有碰撞时既没有画面也没有撞击音，音画对齐也无从谈起
+        raise RuntimeError(f"The simulation of {config.music.midi} recorded no collisions, nothing to render")
+
+    stem = video_stem(record.meta)
+    video_path = VIDEO_PATH / stem / f"{size}p{fps}.mp4"
+    if audio == "impact" or is_audio_file(midi_path):
+        # 撞击音只需零点几秒即可合成，音频来源则本身就是配乐，都直接在渲染前完成
+        with measure("audio") as metrics:
+            if audio != "impact":
+                wav_path = midi_path
+            else:
+                wav_path = impact_wav_path(midi_path, audio_tracks(record.meta), ASSETS_PATH / "wav")
+                midi_notes = midi if isinstance(midi, NoteRecord) else None
+                impacts_to_wav([arrays], wav_path, midi.duration, midi=midi_notes)
+        timings["audio"] = metrics.wall_time
+        with measure("render") as metrics:
+            render_video(arrays, video_path, size, fps, seed=0, cache=ChunkCache())
+        timings["render"] = metrics.wall_time
+    else:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            # 音频合成在子进程中与渲染并行
+            audio_future = pool.submit(
+                _timed_midi_tracks_to_wav, midi_path, audio_tracks(record.meta), soundfont_path
+            )
+            with measure("render") as metrics:
+                render_video(arrays, video_path, size, fps, seed=0, cache=ChunkCache())
+            timings["render"] = metrics.wall_time
+            wav_path, timings["audio"] = audio_future.result()
+    # 与 render_ball.py 一致，在视频旁保存记录，便于之后用 combine_video.py 合成多轨
+    save_record(arrays, video_path.with_suffix(RECORD_SUFFIX))
+
+    final_video_path = FINAL_PATH / f"{stem}-{size}p{fps}.mp4"
+    final_video_path.parent.mkdir(parents=True, exist_ok=True)
+    ffmpeg_cmd = build_mux_command([video_path], wav_path, [int(arrays.time[0] * 1000)], final_video_path)
+    mux = Stage("mux", ffmpeg_cmd, kind="ffmpeg", tags={"output": final_video_path.as_posix()})
+    timings["mux"] = run_stage(mux).wall_time
+
+    timings["total"] = time.perf_counter() - t_start
+    print(f"Pipeline finished: {final_video_path}")
+    return PipelineResult(video_path=final_video_path, record=record, timings=timings)
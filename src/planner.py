@@ -0,0 +1,343 @@
+"""
+反弹规划：由配置构建仿真对象，并在每次碰撞时求解使小球按音符时刻落地的恢复系数
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Tuple, cast
+
+import numpy as np
+from rich import print
+
+from .body import Ball
+from .boundary import Boundary, CircleBoundary, EllipseBoundary, PolygonBoundary, SDFBoundary
+from .checkpoint import CheckpointLog, Checkpoints
+from .models.manim import CollisionEvent, MetaData, SimulationRecord
+from .onset import NoteSource, load_notes
+from .record import RecordArrays, RecordWriter, meta_to_dict
+from .simulator import Simulator
+from .utils.usable_class import OnlineStats, PeekableIterator, Vec2
+
+# 配置只用于类型标注，仿真本身不依赖 Hydra
+if TYPE_CHECKING:
+    from jaxtyping import Float
+
+    from .models.hydra import BallConfig, BoundaryConfig, CircleConfig, Config, EllipseConfig, PolygonConfig, SDFConfig
+    from .profiler import Profiler
+    from .telemetry import TelemetryRecorder
+
+VEL_BUFFER_SIZE = 4096
+
+
+def build_ball(cfg: BallConfig) -> Ball:
+    return Ball(
+        pos=Vec2.from_hydra(cfg.pos),
+        vel=Vec2.from_hydra(cfg.vel),
+        acc=Vec2.from_hydra(cfg.acc),
+        radius=cfg.radius,
+    )
+
+
+def build_boundary(cfg: BoundaryConfig) -> Boundary:
+    match cfg.type:
+        case "circle":
+            cfg = cast("CircleConfig", cfg)
+            return CircleBoundary(
+                center=Vec2(0, 0),
+                radius=cfg.radius,
+                restitution=cfg.restitution,
+            )
+        case "ellipse":
+            print(
+                "[bold yellow][WARN][/bold yellow]",
+                "[yellow]The results of elliptical boundary may not be optimal.[/yellow]",
+            )
+            cfg = cast("EllipseConfig", cfg)
+            return EllipseBoundary.from_ab(
+                center=Vec2(0, 0),
+                a=cfg.a,
+                b=cfg.b,
+                restitution=cfg.restitution,
+            )
+        case "polygon":
+            print(
+                "[bold yellow][WARN][/bold yellow]",
+                "[yellow]The results of polygonal boundary may not be optimal near sharp corners.[/yellow]",
+            )
+            cfg = cast("PolygonConfig", cfg)
+            if cfg.vertices:
+                return PolygonBoundary(
+                    vertices=np.array(cfg.vertices, dtype=np.float64),
+                    restitution=cfg.restitution,
+                )
+            return PolygonBoundary.regular(
+                sides=cfg.sides,
+                radius=cfg.radius,
+                inner_radius=cfg.inner_radius,
+                rotation=cfg.rotation,
+                restitution=cfg.restitution,
+            )
+        case "sdf":
+            print(
+                "[bold yellow][WARN][/bold yellow]",
+                "[yellow]The results of free-form boundary may not be optimal near sharp corners.[/yellow]",
+            )
+            cfg = cast("SDFConfig", cfg)
+            return SDFBoundary.from_file(
+                source=cfg.source,
+                size=cfg.size,
+                resolution=cfg.resolution,
+                invert=cfg.invert,
+                restitution=cfg.restitution,
+            )
+        case _:
+            raise ValueError(f"Unknown boundary type: {cfg.type}")
+
+
+def prepare_simulation(cfg: Config, midi_path: Path) -> Tuple[Simulator, NoteSource, SimulationRecord]:
+    """由配置构建仿真器、音符记录以及空的仿真记录，音符也可以由音频文件检测起音得到"""
+    ball = build_ball(cfg.ball)
+    boundary = build_boundary(cfg.boundary)
+    midi = load_notes(midi_path)
+    res = SimulationRecord(
+        meta=MetaData(
+            ball=ball.to_manim_meta(),
+            boundary=boundary.to_manim_meta(),
+            dt=cfg.simulation.dt,
+            midi_file=midi.path.as_posix(),
+            inst_idx=cfg.music.inst_idx,
+            music_total_time=midi.duration,
+        )
+    )
+    return Simulator(ball, boundary), midi, res
+
+
+def _setup_dict(meta: MetaData) -> Dict[str, Any]:
+    """影响轨迹的元数据：小球初始状态、边界、步长与音轨，不含 MIDI 路径与仿真结束后才填入的字段"""
+    data = meta_to_dict(meta)
+    for key in ("midi_file", "prefix_free_time", "music_total_time"):
+        data.pop(key)
+    data["ball"].pop("final_vel")
+    for ball in data["extra_balls"]:
+        ball.pop("final_vel")
+    return data
+
+
+def new_checkpoint_log(
+    writer: RecordWriter | None = None,
+    prefix: Checkpoints | None = None,
+    n: int | None = None,
+    collisions: RecordArrays | None = None,
+) -> CheckpointLog:
+    """流式写出记录时检查点也写入行文件，否则保存在内存中"""
+    if writer is None:
+        return CheckpointLog(prefix, n, collisions=collisions)
+    return writer.checkpoint_log(prefix, n, collisions)
+
+
+def prepare_resume(
+    old: RecordArrays, midi: NoteSource, res: SimulationRecord, writer: RecordWriter | None = None
+) -> CheckpointLog:
+    """
+    比较新的音符序列与旧记录，将可复用的碰撞前缀写入 res（或 writer），并返回截断到对应检查点的检查点日志
+
+    旧记录没有检查点、仿真设置不同或第一个音符就不同时，返回空日志，即从头仿真
+    """
+    if old.checkpoints is None or not len(old.checkpoints):
+        print("[yellow]The previous record was saved without checkpoints, simulating from scratch.[/yellow]")
+        return new_checkpoint_log(writer)
+    if _setup_dict(old.meta) != _setup_dict(res.meta):
+        print("[yellow]Simulation settings changed, simulating from scratch.[/yellow]")
+        return new_checkpoint_log(writer)
+
+    k = old.checkpoints.resume_index(midi.notes[res.meta.inst_idx])
+    if k is None:
+        print("[yellow]The first note changed, simulating from scratch.[/yellow]")
+        return new_checkpoint_log(writer)
+
+    n_collisions = int(old.checkpoints.n_collisions[k])
+    note_index = int(old.checkpoints.note_index[k])
+    print(f"Resuming from note {note_index} (t={old.time[n_collisions - 1]:.3f}s), reusing {n_collisions} collisions.")
+    if writer is not None:
+        writer.extend_arrays(old, n_collisions)
+        return writer.checkpoint_log(old.checkpoints, k + 1, old)
+
+    res.collisions.extend(
+        RecordArrays(
+            meta=old.meta,
+            time=old.time[:n_collisions],
+            position=old.position[:n_collisions],
+            velocity_after=old.velocity_after[:n_collisions],
+            is_note_event=old.is_note_event[:n_collisions],
+        )
+        .to_record()
+        .collisions
+    )
+    return CheckpointLog(old.checkpoints, k + 1, collisions=old)
+
+
+def run_simulation(
+    simulator: Simulator,
+    midi: NoteSource,
+    res: SimulationRecord,
+    stats_vel: OnlineStats,
+    stats_err: OnlineStats,
+    profiler: Profiler | None = None,
+    telemetry: TelemetryRecorder | None = None,
+    checkpoints: CheckpointLog | None = None,
+    writer: RecordWriter | None = None,
+) -> bool:
+    """
+    运行仿真直到音符耗尽，无论是否中断都会补全记录的元数据
+
+    Args:
+        profiler (Profiler | None): 可选的插桩工具，需已对 simulator 调用 instrument()
+        telemetry (TelemetryRecorder | None): 可选的逐步遥测记录
+        checkpoints (CheckpointLog | None): 每消耗一个音符追加一个检查点；非空时从其最后一个检查点继续仿真，
+            此时 res 中应已包含对应的碰撞前缀（见 prepare_resume）
+        writer (RecordWriter | None): 给定时碰撞边产生边写入磁盘而不是累积在 res.collisions 中，
+            仿真结束后由调用方 finalize()
+
+    Returns:
+        bool: 仿真是否正常完成
+    """
+    resume = None
+    if checkpoints is not None and len(checkpoints):
+        resume = checkpoints.restore(simulator, stats_vel, stats_err)
+    iter_notes = PeekableIterator(midi.notes[res.meta.inst_idx][resume[2] if resume else 0 :])
+    try:
+        generate_bounce_record(
+            simulator,
+            res.meta.dt,
+            iter_notes,
+            res,
+            stats_vel,
+            stats_err,
+            profiler,
+            telemetry,
+            checkpoints,
+            resume,
+            writer,
+        )
+    except StopIteration:
+        return True
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        res.meta.ball.final_vel = simulator.ball_vel_before_collision.as_tuple
+        res.meta.music_total_time = midi.duration
+        if writer is not None:
+            first_time = writer.first_time
+        else:
+            first_time = res.collisions[0].time if res.collisions else None
+        res.meta.prefix_free_time = first_time if first_time is not None else 0.0
+    return False
+
+
+def generate_bounce_record(
+    simulator: Simulator,
+    dt: float,
+    iter_notes: PeekableIterator[float],
+    res: SimulationRecord,
+    stats_vel: OnlineStats,
+    stats_err: OnlineStats,
+    profiler: Profiler | None = None,
+    telemetry: TelemetryRecorder | None = None,
+    checkpoints: CheckpointLog | None = None,
+    resume: Tuple[float, float, int] | None = None,
+    writer: RecordWriter | None = None,
+):
+    collisions = res.collisions if writer is None else writer  # 碰撞事件的去处
+    is_init = False
+    running = True
+    free_time = 0
+    has_note = False
+    last_note_time = 0.0
+    note_index = 0
+    note_consumed = False
+    if resume is not None:  # 检查点总是在消耗音符后记录，此时已完成初始化且上一次碰撞对应音符
+        free_time, last_note_time, note_index = resume
+        is_init = has_note = True
+    # 每步的速率先写入缓冲区，攒满后批量计入统计，避免每步一次 Python 级更新
+    vel_buf: Float[np.ndarray, "b"] = np.empty(VEL_BUFFER_SIZE)
+    n_buf = 0
+    try:
+        while running:
+            if simulator.step(dt):
+                if not is_init:  # 将自由下落后第一次碰撞视作时间起点
+                    free_time = simulator.time
+                    simulator.reset_time()
+                    is_init = True
+
+                desired_duration = iter_notes.peek() - simulator.time
+
+                last_has_note = has_note
+                if last_has_note:
+                    stats_err.update(simulator.time - last_note_time)
+
+                has_note = True
+                retries = 0
+                while True:
+                    desired_e = simulator.boundary.calc_desired_restitution(
+                        desired_duration,
+                        simulator.ball.pos,
+                        simulator.ball.vel,
+                        simulator.ball.acc,
+                    )
+                    if desired_e is not None:
+                        break
+                    elif desired_duration > 0.1:
+                        has_note = False
+                        desired_duration /= 2
+                        retries += 1
+                    else:
+                        assert False, "Cannot find suitable restitution coefficient"
+
+                desired_e_another = np.abs(np.log(desired_e))
+                desired_e = desired_e[desired_e_another.argsort()]
+                if profiler is not None:
+                    profiler.on_bounce(retries)
+
+                simulator.resolve_collision(override_e=desired_e[0].item())
+                collisions.append(
+                    CollisionEvent(
+                        time=simulator.time + free_time,
+                        position=simulator.ball.pos.as_tuple,
+                        velocity_after=simulator.ball.vel.as_tuple,
+                        is_note_event=last_has_note,
+                    )
+                )
+
+                if has_note:
+                    last_note_time = iter_notes.peek()
+                    iter_notes.consume()
+                    note_index += 1
+                    note_consumed = True
+
+            if telemetry is not None and telemetry.tick():
+                ball = simulator.ball
+                telemetry.record(
+                    simulator.time + free_time,
+                    ball.pos.x,
+                    ball.pos.y,
+                    ball.vel.x,
+                    ball.vel.y,
+                    simulator.boundary.constraint_value(ball.pos),
+                )
+
+            vel_buf[n_buf] = simulator.ball.vel.vec_len()
+            n_buf += 1
+            if n_buf == VEL_BUFFER_SIZE:
+                stats_vel.update_many(vel_buf)
+                n_buf = 0
+
+            if note_consumed and checkpoints is not None:  # 本步的统计量计入之后再记录检查点
+                note_consumed = False
+                stats_vel.update_many(vel_buf[:n_buf])
+                n_buf = 0
+                checkpoints.append(
+                    simulator, free_time, note_index, len(collisions), last_note_time, stats_vel, stats_err
+                )
+    finally:  # 音符耗尽时以 StopIteration 退出，缓冲区中剩余的部分也要计入
+        stats_vel.update_many(vel_buf[:n_buf])
@@ -0,0 +1,310 @@
+"""
+多球（复调）模式：同一边界内每个声部或音轨一个小球，结果保存为一条带 ball 列的记录
+
+每个小球与边界碰撞时，与单球一样求解使其按本声部下一个音符落地的恢复系数；候选解中选择反弹后速率不超过
+MAX_SPEED、且不会撞上其他小球的一个，其他小球按各自当前的抛物线外推，视作运动障碍。没有这样的候选解时
+与找不到恢复系数一样缩短时长重新规划，仍然无解才不按计划自由反弹。
+小球之间的碰撞由 MultiBallSimulator 按弹性碰撞处理，并作为非音符碰撞记入双方的碰撞流，使各自的轨迹仍可由记录重建
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+import numpy as np
+from rich import print
+
+from .body import Ball
+from .boundary import Boundary
+from .midi import NoteRecord
+from .onset import NoteSource, load_notes
+from .models.manim import CollisionEvent, MetaData, SimulationRecord
+from .planner import VEL_BUFFER_SIZE, build_ball, build_boundary
+from .simulator import MultiBallSimulator
+from .utils.usable_class import OnlineStats, PeekableIterator, Vec2
+
+if TYPE_CHECKING:
+    from jaxtyping import Float
+
+    from .models.hydra import Config, PolyphonyConfig
+    from .profiler import Profiler
+    from .record import RecordWriter
+
+OBSTACLE_SAMPLES = 64  # 检查候选解是否会撞上其他小球时，每条轨迹的最少采样数
+OBSTACLE_STEP = 0.005  # 以及采样的最大时间间隔，小球以常见速率在其间移动的距离远小于半径
+FREE_RESTITUTIONS = np.geomspace(0.5, 2.0, 9)  # 找不到按时落地的解时，自由反弹尝试的恢复系数
+MAX_SPEED = 120.0  # 反弹后速率的上限，略高于单球规划实际达到的速率；连续选用 e > 1 的解会使速率不断增长
+
+
+def polyphony_enabled(cfg: PolyphonyConfig) -> bool:
+    return cfg.voices > 1 or len(cfg.tracks) > 0
+
+
+def ball_layout(ball: Ball, n: int, spacing: float) -> List[Ball]:
+    """以 ball 的初始位置为中心，沿 x 方向等距排开 n 个初始状态相同的小球"""
+    return [
+        Ball(
+            pos=Vec2(ball.pos.x + (k - (n - 1) / 2) * spacing, ball.pos.y),
+            vel=ball.vel,
+            acc=ball.acc,
+            radius=ball.radius,
+            mass=ball.mass,
+        )
+        for k in range(n)
+    ]
+
+
+def prepare_polyphonic_simulation(
+    cfg: Config, midi_path: Path
+) -> Tuple[MultiBallSimulator, NoteSource, SimulationRecord, List[List[float]]]:
+    """由配置构建多球仿真器、音符记录、空的仿真记录以及每个小球的音符序列"""
+    poly = cfg.polyphony
+    boundary = build_boundary(cfg.boundary)
+    midi = load_notes(midi_path)
+    if poly.tracks:
+        voices = [midi.notes[t] for t in poly.tracks]
+    else:
+        if not isinstance(midi, NoteRecord):
+            raise ValueError("Splitting chords into voices needs the pitches of a MIDI file, use polyphony.tracks")
+        voices = midi.split_voices(cfg.music.inst_idx, poly.voices)
+    if not all(voices):
+        print(f"[yellow]Dropping {sum(not v for v in voices)} voice(s) without notes.[/yellow]")
+        voices = [v for v in voices if v]
+
+    balls = ball_layout(build_ball(cfg.ball), len(voices), poly.spacing)
+    if any(boundary.is_colliding(ball) for ball in balls):
+        raise ValueError("Some balls start outside the boundary, reduce polyphony.spacing")
+    res = SimulationRecord(
+        meta=MetaData(
+            ball=balls[0].to_manim_meta(),
+            boundary=boundary.to_manim_meta(),
+            dt=cfg.simulation.dt,
+            midi_file=midi.path.as_posix(),
+            inst_idx=cfg.music.inst_idx,
+            music_total_time=midi.duration,
+            extra_balls=[ball.to_manim_meta() for ball in balls[1:]],
+            tracks=list(poly.tracks),
+        )
+    )
+    return MultiBallSimulator(balls, boundary, poly.ball_restitution), midi, res, voices
+
+
+def run_polyphonic_simulation(
+    simulator: MultiBallSimulator,
+    midi: NoteSource,
+    voices: List[List[float]],
+    res: SimulationRecord,
+    stats_vel: OnlineStats,
+    stats_err: OnlineStats,
+    profiler: Profiler | None = None,
+    writer: RecordWriter | None = None,
+) -> bool:
+    """
+    运行多球仿真直到所有声部的音符耗尽，无论是否中断都会补全记录的元数据
+
+    Returns:
+        bool: 仿真是否正常完成
+    """
+    completed = False
+    try:
+        counts = generate_polyphonic_record(
+            simulator, res.meta.dt, [PeekableIterator(v) for v in voices], res, stats_vel, stats_err, profiler, writer
+        )
+        completed = True
+        print(
+            f"Ball contacts: {counts['contacts']}, missed notes: {counts['missed']},",
+            f"unplanned bounces: {counts['unplanned']}",
+        )
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        metas = [res.meta.ball, *res.meta.extra_balls]
+        for meta, vel in zip(metas, simulator.vel_before_collision):
+            meta.final_vel = vel.as_tuple
+        res.meta.music_total_time = midi.duration
+        if writer is not None:
+            first_time = writer.first_time
+        else:
+            first_time = res.collisions[0].time if res.collisions else None
+        res.meta.prefix_free_time = first_time if first_time is not None else 0.0
+    return completed
+
+
+def _choose_restitution(
+    simulator: MultiBallSimulator, i: int, candidates: Float[np.ndarray, "n"], t_f: float, free: bool = False
+) -> float | None:
+    """
+    按 |log e| 从小到大，取第一个反弹后速率不超过 MAX_SPEED、且在 t_f 内不会撞上其他小球的候选解，
+    都不满足时为 None
+
+    free 时候选解为自由反弹，不一定在 t_f 时落地：优先取不相撞、且落地时离 t_f 还来得及规划的一个，
+    都会相撞时取最晚相撞的一个，尽量让对方先落地后再避让
+
+    其他小球的外推只在其下一次碰到边界之前有效；此后它从落点以不超过落地速率的速度离开，
+    在离开落点足够远之前，把落点附近随时间扩大的圆也视作障碍
+    """
+    ball = simulator.balls[i]
+    boundary = simulator.boundary
+    ordered = candidates[np.abs(np.log(candidates)).argsort()]
+    usable = [e for e in ordered if boundary.reflect(ball, override_e=e.item()).vec_len() <= MAX_SPEED]
+    others = [j for j, active in enumerate(simulator.active) if active and j != i]
+    if not others or not usable:
+        return usable[0].item() if usable else None
+
+    obstacles = [simulator.balls[j] for j in others]
+    t = np.linspace(0, t_f, max(OBSTACLE_SAMPLES, int(np.ceil(t_f / OBSTACLE_STEP)) + 1))
+    p0 = np.array([b.pos.as_tuple for b in obstacles])[:, None]
+    v0 = np.array([b.vel.as_tuple for b in obstacles])[:, None]
+    acc = np.array([b.acc.as_tuple for b in obstacles])[:, None]
+    paths = p0 + v0 * t[:, None] + 0.5 * acc * t[:, None] ** 2  # (其他小球, 采样, 2)
+    valid = _until_exit(boundary, paths)
+    reach = (ball.radius + np.array([b.radius for b in obstacles]))[:, None]
+
+    last = np.maximum(valid.sum(axis=1) - 1, 0)
+    rows = np.arange(len(obstacles))
+    landing = paths[rows, last][:, None]
+    t_land = t[last][:, None]
+    land_speed = np.linalg.norm(v0[:, 0] + acc[:, 0] * t_land, axis=-1)[:, None]
+    spread = land_speed * (t - t_land)
+    held = ~valid & (spread <= reach)
+
+    scores: List[Tuple[bool, bool, int]] = []
+    for e in usable:
+        vel_after = boundary.reflect(ball, override_e=e.item())
+        path = np.asarray(ball.pos) + np.asarray(vel_after) * t[:, None] + 0.5 * np.asarray(ball.acc) * t[:, None] ** 2
+        own = _until_exit(boundary, path[None])  # 自由反弹的候选解可能早于 t_f 落地
+        hit = valid & (np.sum((paths - path) ** 2, axis=-1) < reach**2)
+        hit |= held & (np.sum((landing - path) ** 2, axis=-1) < (reach + spread) ** 2)
+        hit_any = np.any(own & hit, axis=0)
+        if not free and not hit_any.any():
+            return e.item()
+        first_hit = int(hit_any.argmax()) if hit_any.any() else len(t)
+        scores.append((first_hit == len(t), bool(t[own[0].sum() - 1] <= t_f - 0.1), first_hit))
+    return usable[max(range(len(scores)), key=scores.__getitem__)].item() if free else None
+
+
+def _until_exit(boundary: Boundary, paths: Float[np.ndarray, "k m 2"]) -> Float[np.ndarray, "k m"]:
+    """每条采样轨迹第一次越出边界之前的采样点为 True；刚反弹的小球可能仍略在边界外，不比起点更远即可"""
+    values = boundary.constraint_values(paths.reshape(-1, 2)).reshape(paths.shape[:2])
+    return np.logical_and.accumulate(values <= np.maximum(values[:, :1], 1.0), axis=1)
+
+
+def _plan_bounce(simulator: MultiBallSimulator, i: int, t_f: float) -> Tuple[float | None, bool, int]:
+    """
+    与单球一样求解第 i 个小球在 t_f 后落地的恢复系数，无解时将时长减半重试，直到不超过 0.1 s
+
+    Returns:
+        Tuple[float | None, bool, int]: 恢复系数（无解时为 None）、是否按原时长落地即对应音符、重试次数
+    """
+    ball = simulator.balls[i]
+    retries = 0
+    while True:
+        candidates = simulator.boundary.calc_desired_restitution(t_f, ball.pos, ball.vel, ball.acc)
+        desired_e = None if candidates is None else _choose_restitution(simulator, i, candidates, t_f)
+        if desired_e is not None or t_f <= 0.1:
+            return desired_e, desired_e is not None and retries == 0, retries
+        t_f /= 2
+        retries += 1
+
+
+def generate_polyphonic_record(
+    simulator: MultiBallSimulator,
+    dt: float,
+    voices: List[PeekableIterator[float]],
+    res: SimulationRecord,
+    stats_vel: OnlineStats,
+    stats_err: OnlineStats,
+    profiler: Profiler | None = None,
+    writer: RecordWriter | None = None,
+) -> Dict[str, int]:
+    """
+    Returns:
+        Dict[str, int]: 小球间碰撞次数 contacts、因落地过晚而跳过的音符数 missed、
+            找不到合适恢复系数而按边界默认恢复系数反弹的次数 unplanned
+    """
+    collisions = res.collisions if writer is None else writer  # 碰撞事件的去处
+    n = len(simulator.balls)
+    is_init = False
+    free_time = 0.0
+    has_note = [False] * n
+    last_note_time = [0.0] * n
+    counts = {"contacts": 0, "missed": 0, "unplanned": 0}
+    vel_buf: Float[np.ndarray, "b"] = np.empty(VEL_BUFFER_SIZE)
+    n_buf = 0
+    try:
+        while any(simulator.active):
+            hits = simulator.step(dt)
+            if hits and not is_init:  # 以任一小球第一次碰到边界为时间起点
+                free_time = simulator.time
+                simulator.reset_time()
+                is_init = True
+
+            for pair in simulator.contacts:
+                counts["contacts"] += 1
+                for k in pair:
+                    ball = simulator.balls[k]
+                    collisions.append(
+                        CollisionEvent(
+                            time=simulator.time + free_time,
+                            position=ball.pos.as_tuple,
+                            velocity_after=ball.vel.as_tuple,
+                            ball=k,
+                        )
+                    )
+                    has_note[k] = False  # 被撞偏后，下一次落地不再对应音符
+
+            for i in hits:
+                ball = simulator.balls[i]
+                voice = voices[i]
+                last_has_note = has_note[i]
+                if last_has_note:
+                    stats_err.update(simulator.time - last_note_time[i])
+
+                try:
+                    # 晚于时间起点才第一次落地、或被撞偏后晚到的小球，跳过已经过去的音符
+                    while voice.peek() <= simulator.time:
+                        voice.consume()
+                        counts["missed"] += 1
+                    desired_duration = voice.peek() - simulator.time
+                except StopIteration:  # 声部结束，与单球一样不记录这次碰撞
+                    simulator.retire(i)
+                    continue
+
+                desired_e, has_note[i], retries = _plan_bounce(simulator, i, desired_duration)
+                if profiler is not None:
+                    profiler.on_bounce(retries)
+
+                if desired_e is None:
+                    # 单球时直接中止；多球时小球可能被撞到难以规划的状态，或者每个解都会撞上其他小球：
+                    # 自由反弹，优先选择不会撞上其他小球的恢复系数，之后继续规划
+                    has_note[i] = False
+                    counts["unplanned"] += 1
+                    free_e = _choose_restitution(simulator, i, FREE_RESTITUTIONS, max(desired_duration, 0.1), free=True)
+                    simulator.resolve_collision(i, free_e)
+                else:
+                    simulator.resolve_collision(i, desired_e)
+                collisions.append(
+                    CollisionEvent(
+                        time=simulator.time + free_time,
+                        position=ball.pos.as_tuple,
+                        velocity_after=ball.vel.as_tuple,
+                        is_note_event=last_has_note,
+                        ball=i,
+                    )
+                )
+
+                if has_note[i]:
+                    last_note_time[i] = voice.peek()
+                    voice.consume()
+
+            for i, ball in enumerate(simulator.balls):
+                if simulator.active[i]:
+                    vel_buf[n_buf] = ball.vel.vec_len()
+                    n_buf += 1
+                    if n_buf == VEL_BUFFER_SIZE:
+                        stats_vel.update_many(vel_buf)
+                        n_buf = 0
+    finally:
+        stats_vel.update_many(vel_buf[:n_buf])
+    return counts
@@ -0,0 +1,123 @@
+"""
+仿真热点路径的可选插桩
+
+Profiler.instrument() 只替换给定仿真器实例（及其边界）上的方法，统计每个阶段的调用次数与累计耗时，
+未调用 instrument() 时仿真代码完全不经过这里，不产生任何开销
+"""
+
+import inspect
+import json
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from .simulator import MultiBallSimulator, Simulator
+
+PROFILE_FILENAME = "profile.json"
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.retries: List[int] = []  # 每次反弹中因无解而将期望时长减半的次数
+        self.root_candidates = 0  # 送入验证环节的正根数
+        self.root_rejected = 0  # 被验证环节拒绝的根数
+        self._t_start = time.perf_counter()
+        self._t_stop: float | None = None
+
+    def _timed(self, phase: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            t0 = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[phase] += clock() - t0
+                calls[phase] += 1
+
+        return wrapper
+
+    def wrap(self, obj: object, method: str, phase: str | None = None) -> None:
+        """以计时包装替换 obj 实例上的方法，不影响同类的其他实例"""
+        setattr(obj, method, self._timed(phase or method, getattr(obj, method)))
+
+    def instrument(self, simulator: Simulator | MultiBallSimulator) -> None:
+        boundary = simulator.boundary
+        self.wrap(simulator, "step")
+        self.wrap(simulator, "resolve_collision")
+        self.wrap(boundary, "is_colliding")
+        if isinstance(simulator, MultiBallSimulator):
+            self.wrap(simulator, "_resolve_contacts", "ball_contacts")
+
+        # 求解失败（返回 None，随后减半重试）的调用单独计时
+        solve = boundary.calc_desired_restitution
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+
+        @wraps(solve)
+        def timed_solve(*args: Any, **kwargs: Any) -> Any:
+            t0 = clock()
+            res = solve(*args, **kwargs)
+            phase = "calc_desired_restitution" if res is not None else "calc_desired_restitution[failed]"
+            seconds[phase] += clock() - t0
+            calls[phase] += 1
+            return res
+
+        setattr(boundary, "calc_desired_restitution", timed_solve)
+
+        validate = getattr(boundary, "_validate_roots", None)
+        if validate is not None:
+            timed_validate = self._timed("validate_roots", validate)
+            signature = inspect.signature(validate)  # 绑定方法，不含 self
+
+            @wraps(validate)
+            def counted_validate(*args: Any, **kwargs: Any) -> Any:
+                k = signature.bind(*args, **kwargs).arguments["k"]
+                valid = timed_validate(*args, **kwargs)
+                self.root_candidates += len(k)
+                self.root_rejected += len(k) - len(valid)
+                return valid
+
+            setattr(boundary, "_validate_roots", counted_validate)
+
+    def on_bounce(self, retries: int) -> None:
+        self.retries.append(retries)
+
+    def stop(self) -> None:
+        self._t_stop = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        wall = (self._t_stop or time.perf_counter()) - self._t_start
+        n_bounces = len(self.retries)
+        return {
+            "wall_time": wall,
+            "phases": {
+                phase: {
+                    "calls": self.calls[phase],
+                    "seconds": self.seconds[phase],
+                    "fraction": self.seconds[phase] / wall if wall > 0 else 0.0,
+                    "us_per_call": self.seconds[phase] / self.calls[phase] * 1e6 if self.calls[phase] else 0.0,
+                }
+                for phase in sorted(self.calls)
+            },
+            "bounces": {
+                "count": n_bounces,
+                "retries_total": sum(self.retries),
+                "retries_max": max(self.retries, default=0),
+                "retries_mean": sum(self.retries) / n_bounces if n_bounces else 0.0,
+                "retries_histogram": {str(k): v for k, v in sorted(Counter(self.retries).items())},
+            },
+            "roots": {
+                "candidates": self.root_candidates,
+                "rejected": self.root_rejected,
+            },
+        }
+
+    def save(self, path: Path) -> Path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
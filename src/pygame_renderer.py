@@ -0,0 +1,725 @@
+"""Simple pygame-based renderer for the bouncing ball scene.
+
+This renderer is intentionally minimal and uses pygame.Surface to draw an ellipse
+(or polygon outline) boundary and a filled ball. It returns numpy RGB images suitable for imageio.
+
+Notes:
+- For headless environments set SDL_VIDEODRIVER=dummy in the environment before importing
+  (the module will set a default if not present).
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import math
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from math import lcm
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import imageio
+import numpy as np
+import tqdm
+
+# allow headless use by defaulting to dummy if not provided
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+from .boundary import PolygonBoundary, SDFBoundary
+from .manifest import hash_json
+from .models.manim import MetaData, MetaPolygon, MetaSDF
+from .particles import ParticleSystem, emit_shatter, emit_sparks
+from .record import RecordArrays
+from .render_cache import ChunkCache, chunk_key, chunk_ranges, segment_digest, source_digest
+from .still import MIN_STILL_FRAMES, append_still, concat_copy
+from .trajectory import Trajectory
+
+BALL_COLOR = (50, 150, 245)
+SPARK_COLOR = (255, 230, 160)
+# collision markers (draft renders): note collisions vs non-note bounces
+NOTE_MARKER_COLOR = (90, 220, 120)
+BOUNCE_MARKER_COLOR = (240, 80, 80)
+MARKER_TIME = 0.25  # seconds a marker stays visible after its collision
+SPARK_LIFETIME = 0.35  # seconds a spark burst stays visible
+# alpha is quantized to this many levels so that translucent sprites can be cached
+ALPHA_LEVELS = 32
+# imageio writer settings; the still tail is encoded with the same settings so that it can be stream-copied
+WRITER_KWARGS = {"codec": "libx264", "quality": 8}
+# frames buffered per encoder thread before rendering waits for it
+ENCODER_QUEUE = 8
+
+
+@dataclass
+class Piece:
+    x: float
+    y: float
+    color: Tuple[int, int, int]
+    alpha: float = 1.0
+
+
+class Renderer:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        world_w: float,
+        world_h: float,
+        outline: np.ndarray | None = None,
+    ):
+        self.width = int(width)
+        self.height = int(height)
+        self.world_w = float(world_w)
+        self.world_h = float(world_h)
+
+        pygame.init()
+        # no display window; use Surface
+        self.surface = pygame.Surface((self.width, self.height))
+
+        # precompute scale: pixels per world unit
+        self.px_per_x = self.width / self.world_w
+        self.px_per_y = self.height / self.world_h
+
+        # optional closed outline in world units, drawn instead of the ellipse
+        self.outline_px = None if outline is None else [self.world_to_px(float(x), float(y)) for x, y in outline]
+
+        # (radius px, color, alpha level) -> pre-drawn SRCALPHA sprite
+        self._sprites: Dict[Tuple[int, Tuple[int, int, int], int], pygame.Surface] = {}
+
+    def world_to_px(self, x: float, y: float) -> Tuple[int, int]:
+        # world coords centered at (0,0). map to pixel coords
+        px = int((x / self.world_w + 0.5) * self.width)
+        py = int((-y / self.world_h + 0.5) * self.height)  # invert y
+        return px, py
+
+    def _sprite(self, r: int, color: Tuple[int, int, int], level: int) -> pygame.Surface:
+        key = (r, color, level)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((r * 2 + 2, r * 2 + 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*color, round(level * 255 / (ALPHA_LEVELS - 1))), (r + 1, r + 1), r)
+            self._sprites[key] = sprite
+        return sprite
+
+    def draw_particles(self, particles: ParticleSystem) -> None:
+        """Draw all live particles with cached alpha sprites in one batched blit."""
+        idx = particles.active()
+        if len(idx) == 0:
+            return
+        pos = particles.pos[idx]
+        xs = ((pos[:, 0] / self.world_w + 0.5) * self.width).astype(np.int64)
+        ys = ((-pos[:, 1] / self.world_h + 0.5) * self.height).astype(np.int64)
+        rs = np.maximum(1, (particles.radius[idx] * self.px_per_x).astype(np.int64))
+        levels = np.rint(particles.alpha[idx] * (ALPHA_LEVELS - 1)).astype(np.int64)
+        colors = particles.color[idx]
+        self.surface.blits(
+            [
+                (self._sprite(r, (int(c[0]), int(c[1]), int(c[2])), lvl), (x - r - 1, y - r - 1))
+                for x, y, r, lvl, c in zip(xs.tolist(), ys.tolist(), rs.tolist(), levels.tolist(), colors)
+                if lvl > 0
+            ],
+            doreturn=False,
+        )
+
+    def render_frame(
+        self,
+        ball_pos: Tuple[float, float],
+        ball_radius: float,
+        pieces: List[Piece] | None = None,
+        particles: ParticleSystem | None = None,
+        ball_visible: bool = True,
+        extra_balls: List[Tuple[float, float]] | None = None,
+        markers: List[Tuple[float, float, bool]] | None = None,
+    ):
+        """Draw a frame and return it as an (h, w, 3) RGB array, see ``draw_frame`` for the arguments."""
+        self.draw_frame(ball_pos, ball_radius, pieces, particles, ball_visible, extra_balls, markers)
+        return surface_to_rgb(self.surface)
+
+    def draw_frame(
+        self,
+        ball_pos: Tuple[float, float],
+        ball_radius: float,
+        pieces: List[Piece] | None = None,
+        particles: ParticleSystem | None = None,
+        ball_visible: bool = True,
+        extra_balls: List[Tuple[float, float]] | None = None,
+        markers: List[Tuple[float, float, bool]] | None = None,
+    ) -> None:
+        """Draw a frame onto ``self.surface`` (e.g. to blit it to a window).
+
+        ``extra_balls`` are the positions of the other balls in a polyphonic scene, drawn with the same radius.
+        ``markers`` are recent collisions ``(x, y, is_note_event)``, drawn as rings around the impact point.
+        """
+        pieces = pieces or []
+        # clear
+        self.surface.fill((0, 0, 0))
+
+        line_w = max(1, int(min(self.width, self.height) * 0.005))
+        if self.outline_px is not None:
+            pygame.draw.polygon(self.surface, (160, 160, 160), self.outline_px, width=line_w)
+        else:
+            # draw boundary as ellipse centered
+            # compute ellipse pixel rect using world_w/world_h
+            a_pix = int(self.px_per_x * (self.world_w / 2.0))
+            b_pix = int(self.px_per_y * (self.world_h / 2.0))
+            rect = pygame.Rect((self.width // 2 - a_pix, self.height // 2 - b_pix, a_pix * 2, b_pix * 2))
+            pygame.draw.ellipse(self.surface, (160, 160, 160), rect, width=line_w)
+
+        # draw ball
+        bx, by = ball_pos
+        px, py = self.world_to_px(bx, by)
+        # radius in pixels: approximate using x-scale
+        r_px = max(1, int(ball_radius * self.px_per_x))
+        if ball_visible:
+            pygame.draw.circle(self.surface, BALL_COLOR, (px, py), r_px)
+        for ex, ey in extra_balls or []:
+            pygame.draw.circle(self.surface, BALL_COLOR, self.world_to_px(ex, ey), r_px)
+        for mx, my, is_note in markers or []:
+            color = NOTE_MARKER_COLOR if is_note else BOUNCE_MARKER_COLOR
+            pygame.draw.circle(self.surface, color, self.world_to_px(mx, my), int(r_px * 1.6) + line_w, width=line_w)
+
+        # draw pieces (simple circles)
+        for p in pieces:
+            pxp, pyp = self.world_to_px(p.x, p.y)
+            red, green, blue = (int(max(0, min(255, c))) for c in p.color)
+            color = (red, green, blue)
+            r = max(1, int(r_px * 0.45))
+            # draw with alpha by using a cached sprite
+            if p.alpha < 1.0:
+                level = round(p.alpha * (ALPHA_LEVELS - 1))
+                self.surface.blit(self._sprite(r, color, level), (pxp - r - 1, pyp - r - 1))
+            else:
+                pygame.draw.circle(self.surface, color, (pxp, pyp), r)
+
+        if particles is not None:
+            self.draw_particles(particles)
+
+
+def surface_to_rgb(surface: pygame.Surface) -> np.ndarray:
+    """Copy a surface into a contiguous (h, w, 3) RGB array.
+
+    ``pygame.image.tobytes`` already produces row-major RGB, which is several times faster
+    than ``pygame.surfarray.array3d`` (column-major) followed by a transpose and a copy.
+    """
+    w, h = surface.get_size()
+    return np.frombuffer(pygame.image.tobytes(surface, "RGB"), dtype=np.uint8).reshape(h, w, 3)
+
+
+def outline_from_meta(meta: MetaData) -> np.ndarray | None:
+    """Visual outline (ball radius included) for polygon and SDF boundaries, None for the ellipse family."""
+    ball_r = float(meta.ball.radius)
+    if isinstance(meta.boundary, MetaPolygon):
+        return PolygonBoundary.from_manim_meta(meta.boundary).outline(ball_r)
+    if isinstance(meta.boundary, MetaSDF):
+        return SDFBoundary.from_manim_meta(meta.boundary).outline(ball_r)
+    return None
+
+
+def world_size_from_meta(meta: MetaData) -> Tuple[float, float]:
+    """World extent (width, height) of the visual boundary described by the record."""
+    outline = outline_from_meta(meta)
+    if outline is not None:
+        # square extent centered on the origin so that the outline is not distorted
+        extent = 2.0 * float(np.abs(outline).max())
+        return extent, extent
+    # The record stores Q = [[Q11,Q12],[Q21,Q22]] describing the region the
+    # ball center is allowed to move in. We only support circles here.
+    try:
+        meta_b = meta.boundary
+        Q11 = float(getattr(meta_b, "Q11"))
+        Q12 = float(getattr(meta_b, "Q12"))
+        Q21 = float(getattr(meta_b, "Q21"))
+        Q22 = float(getattr(meta_b, "Q22"))
+
+        # require axis-aligned (Q12/Q21 ~= 0) and equal radii (circle)
+        eps = 1e-6
+        a = 1.0 / (Q11**0.5)
+        b = 1.0 / (Q22**0.5)
+        if abs(a - b) > eps or abs(Q12) > eps or abs(Q21) > eps:
+            raise NotImplementedError("Only circular boundaries are supported; found an ellipse")
+
+        # record stores center-restricted radius a; visual boundary should add the ball radius
+        ball_r = float(meta.ball.radius)
+        outer_r = a + ball_r
+        return 2.0 * outer_r, 2.0 * outer_r
+    except NotImplementedError:
+        raise
+    except Exception:
+        # fallback conservative size
+        return 6.0, 6.0
+
+
+@dataclass
+class VideoOutput:
+    path: Path
+    size: int
+    fps: int
+
+
+@dataclass
+class _OutputPlan:
+    """Where the frames of one output fall on the common grid, and how many of them are drawn."""
+
+    output: VideoOutput
+    stride: int  # ticks of the common grid per frame
+    n_frames: int
+    n_live: int  # frames drawn; the rest is the still tail
+
+
+@dataclass
+class _Chunk:
+    """Ticks [a, b) of the common grid, drawn from ``ticks[0]`` on, with the frames and cache keys of every output."""
+
+    a: int
+    b: int
+    ticks: np.ndarray  # ticks stepped through, starting with the pre-roll
+    t_prev: float  # time of the grid tick before ``ticks[0]``
+    frames: Dict[int, Tuple[int, int]]  # output index -> frames [fa, fb) in the chunk
+    keys: Dict[int, str]
+    missing: Dict[int, str]  # keys not cached yet
+
+
+class _Encoder:
+    """An imageio writer fed through a bounded queue on its own thread, so that several outputs encode in parallel."""
+
+    def __init__(self, output: VideoOutput, n_frames: int, writer_kwargs: Dict[str, Any]):
+        self.output = output
+        self.n_frames = n_frames
+        self.written = 0
+        self._queue: queue.Queue[np.ndarray | None] = queue.Queue(maxsize=ENCODER_QUEUE)
+        self._error: BaseException | None = None
+        output.path.parent.mkdir(parents=True, exist_ok=True)
+        # imageio's get_writer overloads are only partially annotated
+        self._writer = imageio.get_writer(  # pyright: ignore[reportUnknownMemberType]
+            output.path.as_posix(), fps=output.fps, **writer_kwargs
+        )
+        self._thread = threading.Thread(target=self._run, name=f"encode-{output.path.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while (img := self._queue.get()) is not None:
+                self._writer.append_data(img)
+        except BaseException as e:
+            self._error = e
+            # keep draining so that the render loop never blocks on a dead encoder
+            while self._queue.get() is not None:
+                pass
+        finally:
+            self._writer.close()
+
+    def put(self, img: np.ndarray) -> None:
+        self._queue.put(img)
+        self.written += 1
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def render_video(
+    record: RecordArrays,
+    out_file: Path,
+    size: int,
+    fps: int,
+    sparks: bool = False,
+    shatter_time: float = 2.0,
+    seed: int | None = None,
+    markers: bool = False,
+    preset: str | None = None,
+    cache: ChunkCache | None = None,
+) -> Path:
+    """Render the whole record to a square video of ``size`` pixels at ``fps``, see ``render_videos``."""
+    render_videos(
+        record,
+        [VideoOutput(out_file, size, fps)],
+        sparks=sparks,
+        shatter_time=shatter_time,
+        seed=seed,
+        markers=markers,
+        preset=preset,
+        cache=cache,
+    )
+    return out_file
+
+
+def _event_rng(entropy: int, ball: int, t: float) -> np.random.Generator:
+    """Random numbers of one collision or shatter, seeded by the render seed, the ball and the event time."""
+    return np.random.default_rng([entropy, ball, int(np.float64(t).view(np.uint64))])
+
+
+class _Scene:
+    """Effects and drawing of a record, stepped along increasing frame times.
+
+    Every collision and every shatter draws its random numbers from its own generator, so the
+    effects at a given time do not depend on where stepping started, only on the frame times
+    stepped through: to draw frames from time ``t`` on, it is enough to ``start`` at
+    ``t - effect_warmup``, or before the last shatter whose pieces are still visible at ``t``,
+    and step through the frames in between.
+    """
+
+    def __init__(
+        self,
+        record: RecordArrays,
+        sizes: List[int],
+        sparks: bool,
+        shatter_time: float,
+        entropy: int,
+        markers: bool,
+    ):
+        meta = record.meta
+        self.world_w, self.world_h = world_size_from_meta(meta)
+        self.outline = outline_from_meta(meta)
+        # drawing is cheap compared to scaling a large frame down, so every size gets its own renderer
+        self.renderers = {
+            size: Renderer(size, size, self.world_w, self.world_h, outline=self.outline) for size in sizes
+        }
+        self.balls = [record.select_ball(k) for k in range(record.n_balls)]
+        self.trajectories = [Trajectory.from_arrays(ball) for ball in self.balls]
+        self.normals = [trajectory.impact_normals() for trajectory in self.trajectories] if sparks else None
+        self.ball_r = float(meta.ball.radius)
+        self.shatter_time = shatter_time
+        self.entropy = entropy
+        self.markers = markers
+        # how long anything emitted or marked at a collision stays visible, and with the shatter pieces
+        self.effect_warmup = max(SPARK_LIFETIME if sparks else 0.0, MARKER_TIME if markers else 0.0)
+        self.warmup = max(shatter_time, self.effect_warmup)
+        self.frames: Dict[int, np.ndarray] = {}  # frames of the current step, by size
+        self.set_times(np.zeros(1))
+        self.start(0.0)
+
+    def set_times(self, times: np.ndarray) -> None:
+        """Evaluate the piecewise trajectories for all frame times at once; ``step(i)`` moves to ``times[i]``."""
+        self.times = times
+        self.positions = [trajectory.positions_at(times) for trajectory in self.trajectories]
+
+    def start(self, t_prev: float) -> None:
+        """Reset the effects to their state at ``t_prev``, assuming nothing emitted before ``t_prev - warmup``."""
+        self.particles = ParticleSystem(capacity=256 * len(self.balls))
+        # nothing to shatter without a final collision, or when it shattered before
+        self.shattered = [len(b) == 0 or t.end_time <= t_prev for b, t in zip(self.balls, self.trajectories)]
+        self.t_prev = t_prev
+        self.i = 0
+
+    def still_time(self) -> float:
+        """Time after which every ball has shattered and every effect has faded."""
+        ends = [trajectory.end_time for ball, trajectory in zip(self.balls, self.trajectories) if len(ball)]
+        return max(ends, default=0.0) + self.warmup
+
+    def step(self, i: int) -> None:
+        t = float(self.times[i])
+        dt = t - self.t_prev
+        world_w, world_h, ball_r = self.world_w, self.world_h, self.ball_r
+        for k, (ball, trajectory) in enumerate(zip(self.balls, self.trajectories)):
+            if self.normals is not None:
+                for c in range(*trajectory.collisions_between(self.t_prev, t).indices(len(ball))):
+                    rng = _event_rng(self.entropy, k, float(ball.time[c]))
+                    emit_sparks(
+                        self.particles,
+                        ball.position[c],
+                        self.normals[k][c],
+                        SPARK_COLOR,
+                        ball_r * 0.15,
+                        lifetime=SPARK_LIFETIME,
+                        rng=rng,
+                    )
+            if not self.shattered[k] and t >= trajectory.end_time:
+                self.shattered[k] = True
+                # same displacement cap as the Manim outro
+                vel = np.asarray(ball.meta.ball.final_vel, dtype=np.float64)
+                speed = float(np.linalg.norm(vel))
+                vmax = min(world_w, world_h) / 3
+                if speed > 1e-6:
+                    vel = vel / speed * vmax * np.tanh(speed / vmax)
+                rng = _event_rng(self.entropy, k, trajectory.end_time)
+                base_vel = (float(vel[0]), float(vel[1]))
+                emit_shatter(
+                    self.particles,
+                    self.positions[k][i],
+                    base_vel,
+                    ball_r,
+                    BALL_COLOR,
+                    run_time=self.shatter_time,
+                    rng=rng,
+                )
+        self.particles.update(dt)
+        self.t_prev = t
+        self.i = i
+        self.frames.clear()
+
+    def still(self) -> bool:
+        return all(self.shattered) and len(self.particles.active()) == 0
+
+    def recent_collisions(self, t: float) -> List[Tuple[float, float, bool]]:
+        recent: List[Tuple[float, float, bool]] = []
+        for ball, trajectory in zip(self.balls, self.trajectories):
+            for c in range(*trajectory.collisions_between(t - MARKER_TIME, t).indices(len(ball))):
+                recent.append((float(ball.position[c, 0]), float(ball.position[c, 1]), bool(ball.is_note_event[c])))
+        return recent
+
+    def frame(self, size: int) -> np.ndarray:
+        """The frame of the current step at ``size``, drawn at most once per step."""
+        img = self.frames.get(size)
+        if img is None:
+            i = self.i
+            pos = self.positions[0][i]
+            others = zip(self.positions[1:], self.shattered[1:])
+            extra = [(float(p[i, 0]), float(p[i, 1])) for p, done in others if not done]
+            img = self.frames[size] = self.renderers[size].render_frame(
+                (float(pos[0]), float(pos[1])),
+                self.ball_r,
+                particles=self.particles,
+                ball_visible=not self.shattered[0],
+                extra_balls=extra,
+                markers=self.recent_collisions(float(self.times[i])) if self.markers else None,
+            )
+        return img
+
+    def still_frame(self, size: int) -> np.ndarray:
+        """The empty scene that remains once every ball has shattered and every effect has faded."""
+        return self.renderers[size].render_frame((0.0, 0.0), self.ball_r, ball_visible=False)
+
+
+def render_videos(
+    record: RecordArrays,
+    outputs: List[VideoOutput],
+    sparks: bool = False,
+    shatter_time: float = 2.0,
+    seed: int | None = None,
+    markers: bool = False,
+    preset: str | None = None,
+    cache: ChunkCache | None = None,
+) -> List[Path]:
+    """Render the whole record to several square videos (size, fps) in a single pass.
+
+    After the last collision the ball shatters into fading pieces (like the Manim
+    outro); with ``sparks`` a short burst is emitted at every collision. Polyphonic
+    records draw every ball, each shattering after its own last collision.
+
+    The scene (trajectories, sparks, shatter pieces) is evaluated once on the union of
+    all frame times, a grid at the least common multiple of the frame rates; each output
+    only takes the frames at its own times, drawn once per size, and has its own encoder
+    thread.
+
+    Once every ball has shattered and all particles have faded, nothing changes any
+    more: that frame is drawn once and the rest of the tail is appended as a still
+    segment (see ``src.still``) instead of being drawn and encoded frame by frame.
+
+    ``markers`` rings every collision for ``MARKER_TIME`` seconds, colored by whether it
+    plays a note; ``preset`` is passed to x264 (e.g. ``"ultrafast"`` for draft renders).
+
+    With a ``cache`` and a fixed ``seed``, every output is rendered in chunks of ``CHUNK_TIME``
+    seconds instead, see ``render_chunked``; without a seed the effects differ on every render,
+    so nothing could be reused and the cache is skipped.
+    """
+    if not outputs:
+        return []
+    writer_kwargs: Dict[str, Any] = dict(WRITER_KWARGS)
+    if preset is not None:
+        writer_kwargs["output_params"] = ["-preset", preset]
+    meta = record.meta
+    entropy = np.random.SeedSequence(seed).entropy  # a fresh random seed when None
+    assert isinstance(entropy, int)
+    scene = _Scene(record, sorted({output.size for output in outputs}), sparks, shatter_time, entropy, markers)
+    duration = meta.music_total_time + meta.prefix_free_time
+    if cache is not None and seed is None:
+        print("Render cache: skipped, effects are only reproducible with a fixed seed")
+        cache = None
+    if cache is not None:
+        settings = {"writer": writer_kwargs, "sparks": sparks, "markers": markers, "entropy": str(entropy)}
+        render_chunked(scene, outputs, duration, writer_kwargs, cache, settings)
+        return [output.path for output in outputs]
+
+    # frame i of an output at fps is tick i * (rate // fps) on the common grid
+    rate = lcm(*(output.fps for output in outputs))
+    n_frames = [max(1, int(duration * output.fps)) for output in outputs]
+    strides = [rate // output.fps for output in outputs]
+    ticks = np.unique(np.concatenate([np.arange(n) * stride for n, stride in zip(n_frames, strides)]))
+    scene.set_times(ticks / rate)
+    scene.start(-min(strides) / rate)
+
+    encoders = [_Encoder(output, n, writer_kwargs) for output, n in zip(outputs, n_frames)]
+    still = False
+    try:
+        for i, tick in enumerate(tqdm.tqdm(ticks.tolist(), desc="Rendering frames")):
+            scene.step(i)
+            for encoder, stride in zip(encoders, strides):
+                if tick % stride == 0 and encoder.written < encoder.n_frames:
+                    encoder.put(scene.frame(encoder.output.size))
+            if scene.still():
+                still = True
+                break
+        if still:
+            # very short remainders are cheaper to write directly than to encode and concatenate
+            for encoder in encoders:
+                remaining = encoder.n_frames - encoder.written
+                if 0 < remaining < MIN_STILL_FRAMES:
+                    for _ in range(remaining):
+                        encoder.put(scene.frame(encoder.output.size))
+    finally:
+        _close_encoders(encoders)
+    if still:
+        for encoder in encoders:
+            remaining = encoder.n_frames - encoder.written
+            if remaining > 0:
+                frame = scene.frame(encoder.output.size)
+                append_still(encoder.output.path, frame, remaining, encoder.output.fps, **writer_kwargs)
+    return [output.path for output in outputs]
+
+
+def _close_encoders(encoders: List[_Encoder]) -> None:
+    errors: List[BaseException] = []
+    for encoder in encoders:
+        try:
+            encoder.close()
+        except BaseException as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+
+
+def render_chunked(
+    scene: _Scene,
+    outputs: List[VideoOutput],
+    duration: float,
+    writer_kwargs: Dict[str, Any],
+    cache: ChunkCache,
+    settings: Dict[str, Any],
+) -> None:
+    """Render every output as a concatenation of cached chunks, only drawing the chunks that changed.
+
+    Chunks are cut from the same common grid as ``render_videos`` (the least common multiple of the
+    frame rates) and every chunk is drawn once for all outputs. Particles are integrated over the
+    steps of that grid, so the set of frame rates is part of the key: a 30 fps chunk rendered next
+    to a 60 fps output is not reused by a 30 fps render on its own, and vice versa.
+
+    A chunk is keyed by the render settings and the trajectory segments active from the start of its
+    pre-roll to its last frame (``src.render_cache``), so a re-simulation that only changes the last
+    bounces reuses every chunk before them. The pre-roll covers the sparks and markers still visible
+    at the first frame of the chunk, and reaches back before a shatter only when its pieces are.
+    Chunks are joined by stream copy and the still tail is appended as in ``render_videos``.
+    """
+    fps_set = sorted({output.fps for output in outputs})
+    settings = {
+        **settings,
+        "source": _source_digest(),
+        "grid": fps_set,
+        "shatter_time": scene.shatter_time,
+        "ball_radius": scene.ball_r,
+        "world": [scene.world_w, scene.world_h],
+        "outline": None if scene.outline is None else hashlib.sha256(scene.outline.tobytes()).hexdigest(),
+    }
+    rate = lcm(*fps_set)
+    strides = [rate // fps for fps in fps_set]
+    plans: List[_OutputPlan] = []
+    for output in outputs:
+        n_frames = max(1, int(duration * output.fps))
+        # frames after the still time are all the same and are appended as a still segment
+        n_live = max(1, min(n_frames, math.ceil(scene.still_time() * output.fps) + 1))
+        if n_frames - n_live < MIN_STILL_FRAMES:
+            n_live = n_frames
+        plans.append(_OutputPlan(output, rate // output.fps, n_frames, n_live))
+    n_ticks = max((plan.n_live - 1) * plan.stride + 1 for plan in plans)
+
+    warm = math.ceil(scene.effect_warmup * rate)
+    ends = [trajectory.end_time for ball, trajectory in zip(scene.balls, scene.trajectories) if len(ball)]
+    chunks: List[_Chunk] = []
+    n_chunks = n_reused = n_todo = 0
+    for a, b in chunk_ranges(n_ticks, rate):
+        lo = a - warm
+        for end in ends:
+            # pieces of a shatter before the chunk may still be flying at its first frame
+            if a / rate - scene.shatter_time - 1 / fps_set[0] <= end < a / rate:
+                lo = min(lo, math.floor(end * rate) - 1)
+        grid = _grid_ticks(max(0, lo - rate), b, strides)
+        i0 = int(np.searchsorted(grid, max(0, lo), side="right")) - 1
+        t_prev = float(grid[i0 - 1]) / rate if i0 > 0 else -min(strides) / rate
+        digests = [
+            segment_digest(ball, trajectory, t_prev, (b - 1) / rate)
+            for ball, trajectory in zip(scene.balls, scene.trajectories)
+        ]
+        chunk = _Chunk(a, b, grid[i0:], t_prev, {}, {}, {})
+        for j, plan in enumerate(plans):
+            fa, fb = -(-a // plan.stride), min(-(-b // plan.stride), plan.n_live)
+            if fa >= fb:
+                continue
+            size, fps = plan.output.size, plan.output.fps
+            key = chunk_key(hash_json({**settings, "size": size, "fps": fps}), digests, (fa, fb))
+            chunk.frames[j] = (fa, fb)
+            chunk.keys[j] = key
+            if cache.get(key) is None:
+                chunk.missing[j] = key
+        chunks.append(chunk)
+        n_chunks += len(chunk.keys)
+        n_reused += len(chunk.keys) - len(chunk.missing)
+        n_todo += len(chunk.ticks) if chunk.missing else 0
+    print(f"Render cache: reusing {n_reused}/{n_chunks} chunks")
+
+    with tqdm.tqdm(total=n_todo, desc="Rendering frames") as progress:
+        for chunk in chunks:
+            if chunk.missing:
+                _render_chunk(scene, rate, chunk, plans, cache, writer_kwargs)
+                progress.update(len(chunk.ticks))
+    for j, plan in enumerate(plans):
+        output = plan.output
+        output.path.parent.mkdir(parents=True, exist_ok=True)
+        concat_copy([cache.path(chunk.keys[j]) for chunk in chunks if j in chunk.keys], output.path)
+        if plan.n_frames > plan.n_live:
+            n_still = plan.n_frames - plan.n_live
+            append_still(output.path, scene.still_frame(output.size), n_still, output.fps, **writer_kwargs)
+    cache.prune()
+
+
+def _grid_ticks(lo: int, hi: int, strides: List[int]) -> np.ndarray:
+    """Ticks in [lo, hi) of the common grid where at least one of the frame rates has a frame."""
+    return np.unique(np.concatenate([np.arange(-(-lo // s) * s, hi, s) for s in strides]))
+
+
+def _render_chunk(
+    scene: _Scene,
+    rate: int,
+    chunk: _Chunk,
+    plans: List[_OutputPlan],
+    cache: ChunkCache,
+    writer_kwargs: Dict[str, Any],
+) -> None:
+    """Draw the frames of ``chunk`` for the outputs in ``chunk.missing`` and cache them under their keys."""
+    scene.set_times(chunk.ticks / rate)
+    scene.start(chunk.t_prev)
+    tmp_paths = {j: cache.temp_path(key) for j, key in chunk.missing.items()}
+    encoders: Dict[int, _Encoder] = {}
+    for j, path in tmp_paths.items():
+        fa, fb = chunk.frames[j]
+        output = plans[j].output
+        encoders[j] = _Encoder(VideoOutput(path, output.size, output.fps), fb - fa, writer_kwargs)
+    try:
+        try:
+            for i, tick in enumerate(chunk.ticks.tolist()):
+                scene.step(i)
+                if tick < chunk.a:
+                    continue
+                for j, encoder in encoders.items():
+                    plan = plans[j]
+                    if tick % plan.stride == 0 and tick // plan.stride < plan.n_live:
+                        encoder.put(scene.frame(plan.output.size))
+        finally:
+            _close_encoders(list(encoders.values()))
+    except BaseException:
+        for path in tmp_paths.values():
+            path.unlink(missing_ok=True)
+        raise
+    for j, key in chunk.missing.items():
+        cache.put(tmp_paths[j], key)
+
+
+@functools.cache
+def _source_digest() -> str:
+    """Hash of the modules that decide what a frame looks like; editing them invalidates every cached chunk."""
+    modules = [Path(__file__), *(Path(inspect.getfile(obj)) for obj in (ParticleSystem, Trajectory, append_still))]
+    return source_digest(modules)
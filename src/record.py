@@ -0,0 +1,476 @@
+"""
+仿真记录的列式存储格式，取代直接 pickle SimulationRecord
+
+文件布局：
+    MAGIC (8 字节) | header 长度 (uint32, 小端) | JSON header | 各列数据
+
+header 中保存格式版本、MetaData 以及每一列的 dtype/shape/偏移，
+每一列连续存放并按 64 字节对齐，读取时直接 np.memmap 为数组，不再反序列化成千上万个 Python 对象，
+也不会因为 src.models.manim 中的类移动而失效
+
+单球记录也可以只保存每次碰撞的步数与恢复系数（header 中 encoding 为 restitution，见 compact.py），
+读取时重放还原出位置与速度
+
+仿真过程中由 RecordWriter 将碰撞边产生边追加到 <记录>.part 行文件（见 stream.py），
+结束时再分块转换为列式记录；被强制终止时留下的 .part 文件同样可以直接读取
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import struct
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from .checkpoint import CheckpointLog, Checkpoints, load_checkpoint_stream, sketch_stream_path
+from .models.manim import CollisionEvent, MetaBall, MetaData, MetaEllipse, MetaPolygon, MetaSDF, SimulationRecord, Vec2
+from .stream import STREAM_MAGIC, RowStreamWriter, is_row_stream, read_row_stream
+
+if TYPE_CHECKING:
+    from jaxtyping import Bool, Float, Int
+
+MAGIC = b"BMREC\x00\x00\x01"
+FORMAT_VERSION = 4  # 2: 可选的检查点列；3: 多球记录的 ball 列；4: 仅含恢复系数的紧凑编码
+RECORD_SUFFIX = ".rec"
+RECORD_FILENAME = "bounce_history" + RECORD_SUFFIX
+LEGACY_SUFFIX = ".pkl"
+PARTIAL_SUFFIX = ".part"  # 仿真中/被中断的碰撞行文件
+CHECKPOINT_PARTIAL_SUFFIX = ".ckpt.part"  # 同上，检查点行文件
+
+# 碰撞行文件中每次碰撞的行结构
+COLLISION_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("position", "<f8", (2,)),
+        ("velocity_after", "<f8", (2,)),
+        ("is_note_event", "|b1"),
+    ]
+)
+# 多球记录额外保存小球编号
+BALL_COLLISION_DTYPE = np.dtype(COLLISION_DTYPE.descr + [("ball", "<i4")])
+
+_CHUNK = 1 << 16  # 分块写出列时每块的行数
+
+_ALIGN = 64
+_HEADER_LEN = struct.Struct("<I")
+
+# 边界元数据类型注册表，键与 Meta*.type 一致
+_BOUNDARY_META: Dict[str, type] = {
+    "ellipse": MetaEllipse,
+    "polygon": MetaPolygon,
+    "sdf": MetaSDF,
+}
+
+
+@dataclass
+class RecordArrays:
+    """列式的仿真记录，每个碰撞字段都是一个连续数组"""
+
+    meta: MetaData
+    time: Float[np.ndarray, "n"]
+    position: Float[np.ndarray, "n 2"]
+    velocity_after: Float[np.ndarray, "n 2"]
+    is_note_event: Bool[np.ndarray, "n"]
+    checkpoints: Checkpoints | None = None  # 用于增量重新仿真，仅在开启检查点时保存
+    ball: Int[np.ndarray, "n"] | None = None  # 多球记录中每次碰撞所属的小球，单球记录中没有
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def n_balls(self) -> int:
+        return 1 + len(self.meta.extra_balls)
+
+    def select_ball(self, k: int) -> "RecordArrays":
+        """
+        第 k 个小球的碰撞流，元数据中的 ball 换成该小球，可直接用于单球的轨迹与渲染代码
+        """
+        if not 0 <= k < self.n_balls:
+            raise IndexError(f"Ball {k} out of range, the record has {self.n_balls} balls")
+        if self.ball is None:
+            return self
+        idx = np.flatnonzero(self.ball == k)
+        balls = [self.meta.ball, *self.meta.extra_balls]
+        return RecordArrays(
+            meta=replace(self.meta, ball=balls[k], extra_balls=[]),
+            time=self.time[idx],
+            position=self.position[idx],
+            velocity_after=self.velocity_after[idx],
+            is_note_event=self.is_note_event[idx],
+        )
+
+    @classmethod
+    def from_record(cls, record: SimulationRecord, checkpoints: Checkpoints | None = None) -> "RecordArrays":
+        collisions = record.collisions
+        return cls(
+            meta=record.meta,
+            time=np.fromiter((c.time for c in collisions), dtype=np.float64, count=len(collisions)),
+            position=np.array([c.position for c in collisions], dtype=np.float64).reshape(-1, 2),
+            velocity_after=np.array([c.velocity_after for c in collisions], dtype=np.float64).reshape(-1, 2),
+            is_note_event=np.fromiter((c.is_note_event for c in collisions), dtype=np.bool_, count=len(collisions)),
+            checkpoints=checkpoints,
+            ball=(
+                np.fromiter((c.ball for c in collisions), dtype=np.int32, count=len(collisions))
+                if record.meta.extra_balls
+                else None
+            ),
+        )
+
+    def to_record(self) -> SimulationRecord:
+        """还原为对象形式的记录，供仍按 CollisionEvent 列表处理的代码使用"""
+        collisions = [
+            CollisionEvent(
+                time=float(t),
+                position=(float(p[0]), float(p[1])),
+                velocity_after=(float(v[0]), float(v[1])),
+                is_note_event=bool(n),
+                ball=int(b),
+            )
+            for t, p, v, n, b in zip(
+                self.time,
+                self.position,
+                self.velocity_after,
+                self.is_note_event,
+                self.ball if self.ball is not None else np.zeros(len(self), dtype=np.int32),
+            )
+        ]
+        return SimulationRecord(meta=self.meta, collisions=collisions)
+
+
+def meta_to_dict(meta: MetaData) -> Dict[str, Any]:
+    data = asdict(meta)
+    data["boundary"]["type"] = meta.boundary.type
+    return data
+
+
+def _vec2(v: Sequence[float]) -> Vec2:
+    return float(v[0]), float(v[1])
+
+
+def _ball_from_dict(data: Dict[str, Any]) -> MetaBall:
+    return MetaBall(
+        radius=float(data["radius"]),
+        initial_pos=_vec2(data["initial_pos"]),
+        initial_vel=_vec2(data["initial_vel"]),
+        acc=_vec2(data["acc"]),
+        final_vel=_vec2(data.get("final_vel", (0.0, 0.0))),
+    )
+
+
+def audio_tracks(meta: MetaData) -> List[int]:
+    """记录对应的发声音轨"""
+    return list(meta.tracks) if meta.tracks else [meta.inst_idx]
+
+
+def video_stem(meta: MetaData) -> str:
+    """渲染输出目录名：MIDI 文件名与音轨，多球记录另加小球数，与同一音轨的单球视频区分开"""
+    stem = f"{Path(meta.midi_file).stem}-{'-'.join(str(t) for t in audio_tracks(meta))}"
+    if meta.extra_balls:
+        stem += f"-{len(meta.extra_balls) + 1}balls"
+    return stem
+
+
+def meta_from_dict(data: Dict[str, Any]) -> MetaData:
+    data = dict(data)
+    ball = _ball_from_dict(data.pop("ball"))
+    extra_balls = [_ball_from_dict(b) for b in data.pop("extra_balls", [])]
+    boundary = dict(data.pop("boundary"))
+    boundary_type = boundary.pop("type")
+    if boundary_type not in _BOUNDARY_META:
+        raise ValueError(f"Unknown boundary type: {boundary_type}")
+    return MetaData(
+        ball=ball,
+        boundary=_BOUNDARY_META[boundary_type](**boundary),
+        extra_balls=extra_balls,
+        **data,
+    )
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def save_record(record: SimulationRecord | RecordArrays, path: Path, compact: bool = False) -> Path:
+    """
+    以列式格式写出仿真记录，先写临时文件再替换，避免中断时留下损坏的文件
+
+    Args:
+        record (SimulationRecord | RecordArrays): 仿真记录
+        path (Path): 输出路径
+        compact (bool): 只保存步数与恢复系数（仅单球记录），见 compact.py
+
+    Returns:
+        Path: 输出路径
+    """
+    arrays = record if isinstance(record, RecordArrays) else RecordArrays.from_record(record)
+    extra: Dict[str, Any] = {}
+    if compact:
+        from .compact import ENCODING, CompactRecord
+
+        compact_record = CompactRecord.from_arrays(arrays)
+        columns = compact_record.columns()
+        extra = {"encoding": ENCODING, "anchor_interval": compact_record.interval}
+    else:
+        columns = {
+            "time": arrays.time,
+            "position": arrays.position,
+            "velocity_after": arrays.velocity_after,
+            "is_note_event": arrays.is_note_event,
+        }
+        if arrays.ball is not None:
+            columns["ball"] = arrays.ball
+        if arrays.checkpoints is not None:
+            columns.update(arrays.checkpoints.columns())
+
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, col in columns.items():
+        dtype = col.dtype.newbyteorder("<") if col.dtype.byteorder == ">" else col.dtype
+        layout[name] = {"dtype": dtype.str, "shape": list(col.shape), "offset": offset}
+        offset = _align(offset + dtype.itemsize * col.size)
+
+    header = json.dumps(
+        {
+            "version": FORMAT_VERSION,
+            "length": len(arrays),
+            "meta": meta_to_dict(arrays.meta),
+            "columns": layout,
+            **extra,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    data_start = _align(len(MAGIC) + _HEADER_LEN.size + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for name, col in columns.items():
+            f.seek(data_start + layout[name]["offset"])
+            # 分块写出，列可以是内存映射的行文件字段视图，内存占用与记录长度无关
+            dtype = np.dtype(layout[name]["dtype"])
+            for i in range(0, len(col), _CHUNK):
+                f.write(np.ascontiguousarray(col[i : i + _CHUNK], dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class RecordWriter:
+    """
+    仿真过程中逐个追加碰撞，按批写入 <path>.part，检查点写入 <path>.ckpt.part（草图条目见 checkpoint.py），
+    内存占用与仿真长度无关；finalize() 时转换为列式记录并删除行文件
+
+    Args:
+        path (Path): 最终的记录路径
+        meta (MetaData): 仿真开始时的元数据，随行文件保存，使中断的记录也能直接读取
+        batch_size (int): 每批刷新的碰撞数；碰撞远比仿真步稀疏，小批量刷新的开销可以忽略
+    """
+
+    def __init__(self, path: Path, meta: MetaData, batch_size: int = 64):
+        self.path = path
+        self.stream_path = path.with_name(path.name + PARTIAL_SUFFIX)
+        self.checkpoint_path = path.with_name(path.name + CHECKPOINT_PARTIAL_SUFFIX)
+        self.first_time: float | None = None
+        self._multi = bool(meta.extra_balls)
+        dtype = BALL_COLLISION_DTYPE if self._multi else COLLISION_DTYPE
+        self._stream = RowStreamWriter(self.stream_path, dtype, {"meta": meta_to_dict(meta)}, batch_size)
+
+    def __len__(self) -> int:
+        return len(self._stream)
+
+    def append(self, event: CollisionEvent) -> None:
+        if self.first_time is None:
+            self.first_time = event.time
+        if self._multi:
+            self._stream.append((event.time, event.position, event.velocity_after, event.is_note_event, event.ball))
+        else:
+            self._stream.append((event.time, event.position, event.velocity_after, event.is_note_event))
+
+    def extend_arrays(self, arrays: RecordArrays, n: int) -> None:
+        """复用已有记录的前 n 次碰撞，分块复制，不创建 CollisionEvent"""
+        for i in range(0, n, _CHUNK):
+            j = min(i + _CHUNK, n)
+            rows = np.zeros(j - i, dtype=self._stream.dtype)
+            rows["time"] = arrays.time[i:j]
+            rows["position"] = arrays.position[i:j]
+            rows["velocity_after"] = arrays.velocity_after[i:j]
+            rows["is_note_event"] = arrays.is_note_event[i:j]
+            if arrays.ball is not None and self._multi:
+                rows["ball"] = arrays.ball[i:j]
+            self._stream.append_rows(rows)
+        if n and self.first_time is None:
+            self.first_time = float(arrays.time[0])
+
+    def checkpoint_log(
+        self, prefix: Checkpoints | None = None, n: int | None = None, collisions: RecordArrays | None = None
+    ) -> CheckpointLog:
+        """创建写入 <path>.ckpt.part 的检查点日志"""
+        return CheckpointLog(prefix, n, stream_path=self.checkpoint_path, collisions=collisions)
+
+    def finalize(self, meta: MetaData, checkpoints: CheckpointLog | None = None) -> Path:
+        """以最终的元数据写出列式记录，成功后删除行文件"""
+        self._stream.close()
+        ckpt_arrays = None
+        if checkpoints is not None:
+            ckpt_arrays = checkpoints.to_arrays()
+            checkpoints.close()
+        _, rows = read_row_stream(self.stream_path)
+        save_record(
+            RecordArrays(
+                meta=meta,
+                time=rows["time"],
+                position=rows["position"],
+                velocity_after=rows["velocity_after"],
+                is_note_event=rows["is_note_event"],
+                checkpoints=ckpt_arrays,
+                ball=rows["ball"] if self._multi else None,
+            ),
+            self.path,
+        )
+        self.stream_path.unlink()
+        self.checkpoint_path.unlink(missing_ok=True)
+        sketch_stream_path(self.checkpoint_path).unlink(missing_ok=True)
+        return self.path
+
+
+def _read_header(path: Path) -> Tuple[Dict[str, Any], int]:
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a bounce record file")
+        (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    if header["version"] > FORMAT_VERSION:
+        raise ValueError(f"Record format version {header['version']} is newer than supported ({FORMAT_VERSION})")
+    return header, _align(len(MAGIC) + _HEADER_LEN.size + header_len)
+
+
+def is_legacy_pickle(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) not in (MAGIC, STREAM_MAGIC)
+
+
+def _load_partial(path: Path) -> RecordArrays:
+    """读取仿真中或被中断的碰撞行文件，以及同名的检查点行文件（若存在）"""
+    header, rows = read_row_stream(path)
+    meta = meta_from_dict(header["meta"])
+    if len(rows):
+        meta.prefix_free_time = float(rows["time"][0])
+    checkpoint_path = path.with_name(path.name.removesuffix(PARTIAL_SUFFIX) + CHECKPOINT_PARTIAL_SUFFIX)
+    return RecordArrays(
+        meta=meta,
+        time=rows["time"],
+        position=rows["position"],
+        velocity_after=rows["velocity_after"],
+        is_note_event=rows["is_note_event"],
+        checkpoints=load_checkpoint_stream(checkpoint_path, len(rows)) if checkpoint_path.exists() else None,
+        ball=rows["ball"] if "ball" in (rows.dtype.names or ()) else None,
+    )
+
+
+def load_record_arrays(path: Path, mmap: bool = True) -> RecordArrays:
+    """
+    读取列式记录，默认内存映射各列；旧版 pickle 记录会在内存中转换，
+    未完成的 .part 行文件按已写入的部分读取，紧凑记录重放还原并校验（见 compact.py）
+
+    Args:
+        path (Path): 记录文件路径
+        mmap (bool): 是否以只读内存映射方式读取各列
+
+    Returns:
+        RecordArrays: 列式记录
+    """
+    if is_legacy_pickle(path):
+        with open(path, "rb") as f:
+            record: SimulationRecord = pickle.load(f)
+        return RecordArrays.from_record(record)
+    if is_row_stream(path):
+        return _load_partial(path)
+
+    header, data_start = _read_header(path)
+    columns: Dict[str, np.ndarray] = {}
+    for name, spec in header["columns"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            columns[name] = np.empty(shape, dtype=dtype)
+        elif mmap:
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(data_start + spec["offset"])
+                columns[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+    meta = meta_from_dict(header["meta"])
+    if header.get("encoding") is not None:
+        from .compact import ENCODING, CompactRecord
+
+        if header["encoding"] != ENCODING:
+            raise ValueError(f"Unknown record encoding: {header['encoding']}")
+        return CompactRecord.from_columns(meta, columns, header["anchor_interval"]).replay()
+
+    checkpoints = Checkpoints.from_columns(columns)
+    return RecordArrays(
+        meta=meta,
+        time=columns["time"],
+        position=columns["position"],
+        velocity_after=columns["velocity_after"],
+        is_note_event=columns["is_note_event"],
+        checkpoints=checkpoints,
+        ball=columns.get("ball"),
+    )
+
+
+def load_record(path: Path) -> SimulationRecord:
+    """读取记录并还原为 SimulationRecord，兼容旧版 pickle"""
+    return load_record_arrays(path, mmap=False).to_record()
+
+
+def iter_collisions(path: Path, batch_size: int = _CHUNK) -> Iterator[CollisionEvent]:
+    """按批惰性地逐个产生碰撞事件，不一次性创建全部对象，.part 行文件同样可用"""
+    arrays = load_record_arrays(path)
+    for i in range(0, len(arrays), batch_size):
+        j = i + batch_size
+        batch = RecordArrays(
+            meta=arrays.meta,
+            time=arrays.time[i:j],
+            position=arrays.position[i:j],
+            velocity_after=arrays.velocity_after[i:j],
+            is_note_event=arrays.is_note_event[i:j],
+            ball=None if arrays.ball is None else arrays.ball[i:j],
+        )
+        yield from batch.to_record().collisions
+
+
+def convert_pickle(pkl_path: Path, output_path: Path | None = None) -> Path:
+    """将旧版 pickle 记录转换为列式格式，默认输出到同目录下同名 .rec 文件"""
+    output_path = pkl_path.with_suffix(RECORD_SUFFIX) if output_path is None else output_path
+    return save_record(load_record_arrays(pkl_path), output_path)
+
+
+def is_compact_record(path: Path) -> bool:
+    """是否为只含恢复系数的紧凑记录"""
+    if is_legacy_pickle(path) or is_row_stream(path):
+        return False
+    return _read_header(path)[0].get("encoding") is not None
+
+
+def find_latest_record(root: Path) -> Path:
+    """在 root 下查找最新的仿真记录，列式记录、被中断仿真留下的 .part 文件与旧版 pickle 均可"""
+    record_files: List[Path] = [
+        *root.rglob(RECORD_FILENAME),
+        *root.rglob(RECORD_FILENAME + PARTIAL_SUFFIX),
+        *root.rglob(Path(RECORD_FILENAME).with_suffix(LEGACY_SUFFIX).name),
+    ]
+    if not record_files:
+        raise FileNotFoundError(f"No record files found in {root}")
+
+    # 按修改时间排序，取最新
+    return max(record_files, key=lambda p: p.stat().st_mtime)
@@ -0,0 +1,115 @@
+"""
+分块渲染缓存：视频按固定时长切成若干块，每块以其内容的哈希为键缓存编码好的片段
+
+一块画面只取决于该块时间窗口内（加上粒子寿命等向前延伸的部分）的轨迹分段与渲染参数，
+因此重新仿真只改动了最后几次碰撞时，前面各块的键不变，直接复用缓存的片段，只重新渲染变化的块，
+最后用 concat 分离器直接复制码流拼接（见 src/still.py）。片段文件存放在 .cache/render/ 下，
+超出容量上限时按最近使用时间淘汰
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from .record import RecordArrays
+from .trajectory import Trajectory
+from .utils import CACHE_PATH
+
+RENDER_CACHE_PATH = CACHE_PATH / "render"
+CHUNK_TIME = 4.0  # 每块的时长 (s)，按帧率取整为整数帧
+RENDER_CACHE_LIMIT = 4 << 30  # 缓存目录的容量上限 (bytes)
+
+
+def chunk_ranges(n_frames: int, fps: int, chunk_time: float = CHUNK_TIME) -> List[Tuple[int, int]]:
+    """将 [0, n_frames) 帧按 chunk_time 切块，返回各块的 [起始帧, 结束帧)；块边界只取决于帧率，与视频长度无关"""
+    step = max(1, round(chunk_time * fps))
+    return [(a, min(a + step, n_frames)) for a in range(0, n_frames, step)]
+
+
+def segment_digest(ball: RecordArrays, trajectory: Trajectory, t0: float, t1: float) -> bytes:
+    """
+    时间窗口 [t0, t1] 内起作用的轨迹分段的摘要
+
+    包括窗口起点所在的分段、窗口内的碰撞（位置、速度、是否为音符），以及窗口内结束时的碎裂参数；
+    分段按内容而非下标参与摘要，前面插入或删去碰撞不影响后面窗口的摘要
+    """
+    ct = trajectory.collision_time
+    k0 = int(np.searchsorted(ct, t0, side="right"))  # 窗口起点所在的分段
+    k1 = int(np.searchsorted(ct, t1, side="right"))  # 窗口终点所在的分段
+    h = hashlib.sha256()
+    for array in (trajectory.seg_t0, trajectory.seg_p0, trajectory.seg_v0):
+        h.update(np.ascontiguousarray(array[k0 : k1 + 1], dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(ball.is_note_event[max(k0 - 1, 0) : k1]).tobytes())
+    h.update(np.asarray(trajectory.acc, dtype=np.float64).tobytes())
+    if trajectory.end_time <= t1:  # 碎裂发生在窗口内或之前，其方向由末速度决定
+        h.update(np.asarray(ball.meta.ball.final_vel, dtype=np.float64).tobytes())
+        h.update(b"end")
+    return h.digest()
+
+
+def chunk_key(settings: str, digests: List[bytes], frames: Tuple[int, int]) -> str:
+    """一块的缓存键：渲染参数的哈希、各球的分段摘要与帧范围"""
+    h = hashlib.sha256(settings.encode("utf-8"))
+    for digest in digests:
+        h.update(digest)
+    h.update(np.asarray(frames, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+def source_digest(paths: List[Path]) -> str:
+    """渲染相关源码的哈希，源码改动后所有块失效"""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+class ChunkCache:
+    def __init__(self, root: Path = RENDER_CACHE_PATH, limit: int = RENDER_CACHE_LIMIT) -> None:
+        self.root = root
+        self.limit = limit
+
+    def path(self, key: str, suffix: str = ".mp4") -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = ".mp4") -> Path | None:
+        """命中时更新修改时间，作为淘汰依据"""
+        path = self.path(key, suffix)
+        if not path.exists():
+            return None
+        os.utime(path)
+        return path
+
+    def temp_path(self, key: str, suffix: str = ".mp4") -> Path:
+        """与最终位置在同一目录的临时文件，写完后由 put 原子地移入"""
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(suffix=suffix, prefix=f".{key[:8]}-", dir=path.parent)
+        os.close(fd)
+        return Path(name)
+
+    def put(self, tmp_path: Path, key: str, suffix: str = ".mp4") -> Path:
+        path = self.path(key, suffix)
+        os.replace(tmp_path, path)
+        return path
+
+    def prune(self) -> int:
+        """超出容量上限时从最久未使用的片段开始删除，返回删除的文件数"""
+        if not self.root.exists():
+            return 0
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.glob("*/*") if not p.name.startswith(".")]
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.limit:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
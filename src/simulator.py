@@ -1,5 +1,8 @@
+from typing import List, Tuple
+
 from .body import Ball
 from .boundary import Boundary, CircleBoundary
+from .utils.broadphase import SweepAndPrune
 from .utils.usable_class import Vec2
 
 
@@ -42,6 +45,94 @@ class Simulator:
                 self.bounce_flag = True
 
 
+class MultiBallSimulator:
+    """
+    同一边界内的多个小球，小球之间为弹性碰撞，宽相使用扫描排除，代价随小球数近似线性增长
+
+    小球之间的碰撞在 step() 内直接处理；与边界的碰撞和单球一样交由调用方规划恢复系数后 resolve_collision()。
+    已退出（声部结束）的小球不再步进，也不参与碰撞
+    """
+
+    def __init__(self, balls: List[Ball], boundary: Boundary, ball_restitution: float = 1.0) -> None:
+        self.time = 0
+        self.balls = balls
+        self.boundary = boundary
+        self.ball_restitution = ball_restitution
+        self.active = [True] * len(balls)
+        self.bounce_flags = [False] * len(balls)
+        self.vel_before_collision = [ball.vel for ball in balls]
+        self.contacts: List[Tuple[int, int]] = []  # 最近一步发生的小球间碰撞
+        self._broad_phase = SweepAndPrune(len(balls))
+
+    def reset_time(self) -> None:
+        """与单球相同，以第一次与边界的碰撞为时间起点"""
+        self.time = 0
+
+    def retire(self, i: int) -> None:
+        self.active[i] = False
+
+    def step(self, dt: float) -> List[int]:
+        """
+        步进所有活跃的小球并处理小球之间的碰撞，不处理与边界的碰撞
+
+        Returns:
+            List[int]: 本步与边界发生碰撞的小球编号
+        """
+        for i, ball in enumerate(self.balls):
+            if self.active[i]:
+                ball.update(dt)
+        self.time += dt
+        self._resolve_contacts()
+
+        hits: List[int] = []
+        for i, ball in enumerate(self.balls):
+            if not self.active[i]:
+                continue
+            if self.boundary.is_colliding(ball):
+                # 刚反弹仍在边界外的小球若被其他小球撞得再次向外运动，也要重新处理，否则会飞出边界
+                if not self.bounce_flags[i] or ball.vel.dot(self.boundary.get_normal(ball.pos)) > 0:
+                    hits.append(i)
+            else:
+                self.bounce_flags[i] = False
+        return hits
+
+    def _resolve_contacts(self) -> None:
+        """窄相：重叠且相互接近的小球对沿连心线交换冲量"""
+        self.contacts = []
+        balls = self.balls
+        if len(balls) < 2:
+            return
+        xs = [ball.pos.x for ball in balls]
+        ys = [ball.pos.y for ball in balls]
+        radii = [ball.radius for ball in balls]
+        for i, j in self._broad_phase.pairs(xs, ys, radii, self.active):
+            dx, dy = xs[j] - xs[i], ys[j] - ys[i]
+            dist2 = dx * dx + dy * dy
+            r = radii[i] + radii[j]
+            if dist2 >= r * r or dist2 == 0:
+                continue
+            a, b = balls[i], balls[j]
+            dist = dist2**0.5
+            nx, ny = dx / dist, dy / dist
+            approach = (a.vel.x - b.vel.x) * nx + (a.vel.y - b.vel.y) * ny
+            if approach <= 0:  # 已经在分离，避免重叠期间反复碰撞
+                continue
+            impulse = (1 + self.ball_restitution) * approach / (1 / a.mass + 1 / b.mass)
+            a.vel = Vec2(a.vel.x - impulse / a.mass * nx, a.vel.y - impulse / a.mass * ny)
+            b.vel = Vec2(b.vel.x + impulse / b.mass * nx, b.vel.y + impulse / b.mass * ny)
+            # 贴着边界被撞向外的小球可能在下一次边界碰撞被处理前越出很远，拉回边界上
+            a.pos = self.boundary.clamp(a.pos)
+            b.pos = self.boundary.clamp(b.pos)
+            self.contacts.append((i, j))
+
+    def resolve_collision(self, i: int, override_e: float | None = None) -> None:
+        """解析第 i 个小球与边界的碰撞，只应对 step() 返回的小球调用"""
+        ball = self.balls[i]
+        self.vel_before_collision[i] = ball.vel
+        ball.vel = self.boundary.reflect(ball, override_e=override_e)
+        self.bounce_flags[i] = True
+
+
 if __name__ == "__main__":
     # Example usage
     ball = Ball(pos=Vec2(0, 0), vel=Vec2(0, 0), acc=Vec2(0, -9.81))
@@ -0,0 +1,96 @@
+# pyright: standard
+"""
+静止片段：画面不再变化的一段只渲染一帧，由编码端延长
+
+最常见的是乐曲尾音：最后一次碰撞和分裂动画结束后，画面在剩余的几秒到几十秒内保持不变。
+这里只编码一个不超过 1 s 的静止片段（以及不足 1 s 的余数片段），在视频末尾按需重复拼接，
+拼接使用 ffmpeg concat 分离器直接复制码流，不重新编码。要求静止片段与原视频的编码参数一致，
+因此由调用方传入与原视频相同的 imageio 写入参数；ffmpeg 与编码时一样使用 imageio-ffmpeg 自带的可执行文件
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, List
+
+import imageio
+import imageio_ffmpeg
+import numpy as np
+
+# 静止帧数不超过该值时，直接重复写入更省事，不值得额外编码与拼接
+MIN_STILL_FRAMES = 2
+
+
+def write_still_clip(path: Path, frame: np.ndarray, n_frames: int, fps: int, **writer_kwargs: Any) -> None:
+    """将同一帧重复 n_frames 次编码为视频片段，writer_kwargs 透传给 imageio.get_writer"""
+    writer = imageio.get_writer(path.as_posix(), fps=fps, **writer_kwargs)
+    try:
+        for _ in range(n_frames):
+            writer.append_data(frame)
+    finally:
+        writer.close()
+
+
+def concat_copy(videos: List[Path], output: Path) -> None:
+    """用 concat 分离器按顺序拼接编码参数相同的视频，直接复制码流"""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        for video in videos:
+            # concat 列表中的单引号需要转义
+            escaped = video.resolve().as_posix().replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+        list_file = Path(f.name)
+    try:
+        cmd = (
+            [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error"]
+            + ["-f", "concat", "-safe", "0", "-i", list_file.as_posix()]
+            + ["-c", "copy", output.as_posix(), "-y"]
+        )
+        subprocess.run(cmd, check=True)
+    finally:
+        list_file.unlink(missing_ok=True)
+
+
+def append_still(video: Path, frame: np.ndarray, n_frames: int, fps: int, **writer_kwargs: Any) -> None:
+    """
+    在已经写完的视频末尾追加 n_frames 帧静止画面
+
+    Args:
+        video (Path): 原视频，原地替换
+        frame (np.ndarray): 静止画面 (h, w, 3) uint8
+        n_frames (int): 追加的帧数
+        fps (int): 帧率，与原视频一致
+        writer_kwargs: 原视频的 imageio 写入参数（codec、quality 等），静止片段必须与其一致才能直接拼接
+    """
+    if n_frames <= 0:
+        return
+    chunk, rest = divmod(n_frames, fps)
+    with tempfile.TemporaryDirectory(dir=video.parent) as tmp:
+        tmp_dir = Path(tmp)
+        parts = [video]
+        if chunk > 0:
+            still = tmp_dir / f"still{video.suffix}"
+            write_still_clip(still, frame, fps, fps, **writer_kwargs)
+            parts += [still] * chunk
+        if rest > 0:
+            still_rest = tmp_dir / f"still_rest{video.suffix}"
+            write_still_clip(still_rest, frame, rest, fps, **writer_kwargs)
+            parts.append(still_rest)
+        joined = tmp_dir / f"joined{video.suffix}"
+        concat_copy(parts, joined)
+        os.replace(joined, video)
+
+
+def last_frame(video: Path) -> np.ndarray:
+    """解码视频的最后一帧，只解码末尾的一小段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "last.png"
+        cmd = (
+            [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error"]
+            + ["-sseof", "-1", "-i", video.as_posix()]
+            + ["-update", "1", image.as_posix(), "-y"]
+        )
+        subprocess.run(cmd, check=True)
+        return np.asarray(imageio.imread(image.as_posix()))[..., :3]
@@ -0,0 +1,108 @@
+"""
+追加写入的定长行文件，仿真过程中边产生边落盘
+
+文件布局：
+    MAGIC (8 字节) | header 长度 (uint32, 小端) | JSON header | 行数据 ...
+
+header 中保存行的结构化 dtype 与调用方的附加信息；写入方按批刷新，进程被杀死时最多丢失最后一批，
+读取时忽略末尾不完整的行，直接内存映射为结构化数组
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+STREAM_MAGIC = b"BMSTRM\x00\x01"
+
+_HEADER_LEN = struct.Struct("<I")
+
+
+def _dtype_to_json(dtype: np.dtype[Any]) -> List[Any]:
+    return [list(field) for field in dtype.descr]
+
+
+def _dtype_from_json(descr: List[Any]) -> np.dtype[Any]:
+    return np.dtype([(name, typ, tuple(shape[0])) if shape else (name, typ) for name, typ, *shape in descr])
+
+
+class RowStreamWriter:
+    """
+    Args:
+        path (Path): 输出路径，已存在时覆盖
+        dtype (np.dtype): 每行的结构化 dtype
+        header (Dict[str, Any]): 随文件保存的附加信息
+        batch_size (int): 缓冲的行数，写满后刷新到磁盘
+    """
+
+    def __init__(self, path: Path, dtype: np.dtype[Any], header: Dict[str, Any], batch_size: int = 4096):
+        self.path = path
+        self.dtype = dtype
+        self.count = 0
+        self._buf = np.empty(batch_size, dtype=dtype)
+        self._n = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"dtype": _dtype_to_json(dtype), **header}, ensure_ascii=False).encode("utf-8")
+        self._file = open(path, "wb")
+        self._file.write(STREAM_MAGIC)
+        self._file.write(_HEADER_LEN.pack(len(data)))
+        self._file.write(data)
+        self._file.flush()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, row: Tuple[Any, ...]) -> None:
+        self._buf[self._n] = row
+        self._n += 1
+        self.count += 1
+        if self._n == len(self._buf):
+            self.flush()
+
+    def append_rows(self, rows: np.ndarray) -> None:
+        """直接写入一批结构化行（如复用的前缀），绕过缓冲区"""
+        self.flush()
+        self._file.write(np.ascontiguousarray(rows, dtype=self.dtype).tobytes())
+        self._file.flush()
+        self.count += len(rows)
+
+    def flush(self) -> None:
+        if self._n:
+            self._file.write(self._buf[: self._n].tobytes())
+            self._n = 0
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def is_row_stream(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+
+def read_row_stream(path: Path) -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    读取行文件，可用于仍在写入或被中断的文件
+
+    Returns:
+        Tuple[Dict[str, Any], np.ndarray]: header 与只读内存映射的结构化数组（只含完整的行）
+    """
+    with open(path, "rb") as f:
+        if f.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+            raise ValueError(f"{path} is not a row stream file")
+        (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    dtype = _dtype_from_json(header.pop("dtype"))
+    offset = len(STREAM_MAGIC) + _HEADER_LEN.size + header_len
+    n_rows = (path.stat().st_size - offset) // dtype.itemsize
+    if n_rows == 0:
+        return header, np.empty(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n_rows,))
@@ -0,0 +1,520 @@
+"""
+外部进程（ffmpeg、Manim）的监督执行与各阶段指标
+
+每个阶段是 asyncio 中的一个子进程：ffmpeg 加上 -progress pipe:1 后从标准输出读取结构化的进度，
+Manim 从其 tqdm 进度条的输出中解析百分比。执行期间定期采样整个进程树的 CPU 时间与内存，
+支持超时与取消（先 terminate，宽限期后 kill 整个进程树；POSIX 上子进程自成进程组），多个阶段可在同一事件循环中并发执行，
+任一阶段失败时其余阶段随之取消。
+
+每个阶段结束后（成功、失败、超时或取消）都向 .cache/stage_metrics.jsonl 追加一行 JSON：
+阶段名、状态、退出码、墙钟时间、CPU 时间、峰值 RSS、最后的进度，以及标签。
+环境变量 BOUNCE_METRICS_TAGS（JSON 对象）中的标签会并入每一行，batch.py 以此标注任务与步骤；
+进程内执行的阶段用 measure() 记录同样的指标。
+进程树的统计（以及 Windows 上终止子孙进程）依赖可选的 psutil；没有 psutil 时 CPU 时间取自 resource 的子进程统计（并发执行时包含同时运行的其他阶段），
+峰值 RSS 不记录
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Generator, List, cast
+
+from rich import print
+from rich.markup import escape
+from rich.table import Table
+
+from .utils import CACHE_PATH
+
+METRICS_PATH = CACHE_PATH / "stage_metrics.jsonl"
+METRICS_TAGS_ENV = "BOUNCE_METRICS_TAGS"
+
+STAGE_KINDS = ("ffmpeg", "manim", "plain")
+STATUSES = ("ok", "failed", "timeout", "cancelled")
+SAMPLE_INTERVAL = 0.25  # 进程树的采样间隔 (s)，最后不足一个间隔的 CPU 时间不计
+TERMINATE_GRACE = 5.0  # terminate 之后等待退出的时间 (s)，超时则 kill
+OUTPUT_TAIL = 40  # 失败时显示的最后几行输出
+
+DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+TQDM_RE = re.compile(r"(\d+)%\|")
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: List[str]
+    kind: str = "plain"  # 见 STAGE_KINDS，决定如何解析进度
+    timeout: float | None = None  # (s)
+    duration: float | None = None  # ffmpeg 输出的时长 (s)，缺省时取输入中最长的 Duration
+    tags: Dict[str, Any] = field(default_factory=lambda: {})
+
+
+@dataclass
+class StageMetrics:
+    stage: str
+    status: str = "running"  # 结束后为 STATUSES 之一
+    returncode: int | None = None
+    started: float = 0.0  # unix 时间戳
+    wall_time: float = 0.0  # (s)
+    cpu_time: float | None = None  # 进程树的用户态 + 内核态时间 (s)
+    peak_rss: int | None = None  # 进程树的峰值常驻内存 (bytes)
+    progress: float | None = None  # 最后解析到的进度 [0, 1]
+    command: str = ""
+    tags: Dict[str, Any] = field(default_factory=lambda: {})
+
+
+def env_tags() -> Dict[str, Any]:
+    """环境变量 METRICS_TAGS_ENV 中的标签，格式不对时忽略"""
+    try:
+        tags = json.loads(os.environ.get(METRICS_TAGS_ENV, "{}"))
+    except json.JSONDecodeError:
+        return {}
+    return cast(Dict[str, Any], tags) if isinstance(tags, dict) else {}
+
+
+def write_metrics(metrics: StageMetrics, path: Path = METRICS_PATH) -> None:
+    """追加一行 JSON；单次 write 追加一整行，多个进程同时写入也不会交错"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(asdict(metrics), ensure_ascii=False) + "\n")
+
+
+def load_metrics(path: Path = METRICS_PATH) -> List[Dict[str, Any]]:
+    """读取所有指标行，跳过被中断写入的残行"""
+    if not path.exists():
+        return []
+    rows: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return rows
+
+
+def metrics_table(rows: List[Dict[str, Any]], title: str = "Stage metrics") -> Table:
+    """按阶段汇总：执行次数、失败次数、墙钟时间与 CPU 时间的总和与均值、最大峰值 RSS"""
+    table = Table(title=title)
+    for column in ["Stage", "Runs", "Failed", "Wall (s)", "Mean wall (s)", "CPU (s)", "Peak RSS (MB)"]:
+        table.add_column(column, justify="left" if column == "Stage" else "right")
+    by_stage: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_stage.setdefault(row["stage"], []).append(row)
+    for stage, group in sorted(by_stage.items()):
+        wall = sum(r["wall_time"] for r in group)
+        cpu = [r["cpu_time"] for r in group if r.get("cpu_time") is not None]
+        rss = [r["peak_rss"] for r in group if r.get("peak_rss") is not None]
+        table.add_row(
+            stage,
+            str(len(group)),
+            str(sum(r["status"] != "ok" for r in group)),
+            f"{wall:.1f}",
+            f"{wall / len(group):.2f}",
+            f"{sum(cpu):.1f}" if cpu else "-",
+            f"{max(rss) / 2**20:.0f}" if rss else "-",
+        )
+    return table
+
+
+def _psutil() -> Any:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil
+
+
+def _children_cpu_time() -> float | None:
+    """本进程已回收的子进程的 CPU 时间总和，没有 resource 模块（Windows）时为 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _self_peak_rss() -> int | None:
+    """本进程迄今的峰值 RSS (bytes)"""
+    try:
+        import resource
+    except ImportError:
+        psutil = _psutil()
+        if psutil is None:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024  # Linux 上以 KB 为单位
+
+
+class _TreeMonitor:
+    """定期采样以 pid 为根的进程树，记录 CPU 时间与 RSS 之和的最大值"""
+
+    def __init__(self, pid: int) -> None:
+        self.psutil = _psutil()
+        self.root = None
+        if self.psutil is not None:
+            try:
+                self.root = self.psutil.Process(pid)
+            except self.psutil.Error:
+                pass
+        self.children: Dict[int, Any] = {}
+        self.cpu_time: float | None = None
+        self.peak_rss: int | None = None
+        self._rusage_start = _children_cpu_time()
+
+    def sample(self) -> None:
+        if self.root is None:
+            return
+        try:
+            times = self.root.cpu_times()
+            # 已退出并被回收的子进程计入根进程的 children_*，仍在运行的逐个累加
+            cpu = times.user + times.system + times.children_user + times.children_system
+            rss = self.root.memory_info().rss
+            for child in self.root.children(recursive=True):
+                self.children.setdefault(child.pid, child)
+                try:
+                    child_times = child.cpu_times()
+                    cpu += child_times.user + child_times.system
+                    rss += child.memory_info().rss
+                except self.psutil.Error:
+                    continue
+        except self.psutil.Error:
+            return
+        self.cpu_time = max(self.cpu_time or 0.0, cpu)
+        self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def finish(self) -> None:
+        if self.root is None and self._rusage_start is not None:
+            end = _children_cpu_time()
+            self.cpu_time = None if end is None else end - self._rusage_start
+
+    def collect_children(self) -> None:
+        if self.root is None:
+            return
+        try:
+            for child in self.root.children(recursive=True):
+                self.children.setdefault(child.pid, child)
+        except self.psutil.Error:
+            pass
+
+    def signal_children(self, kill: bool) -> None:
+        """向见过的子孙进程发送 terminate 或 kill，Manim 调用的 ffmpeg 等不会随父进程退出（Windows）"""
+        for child in self.children.values():
+            try:
+                child.kill() if kill else child.terminate()
+            except self.psutil.Error:
+                continue
+
+
+class _OutputParser:
+    """从子进程的输出中解析进度，保留最后几行输出，并按需显示进度条"""
+
+    def __init__(self, stage: Stage, show_progress: bool, position: int) -> None:
+        self.stage = stage
+        self.duration = stage.duration
+        self.input_duration = 0.0
+        self.fraction: float | None = None
+        self.tail: Deque[str] = deque(maxlen=OUTPUT_TAIL)
+        self.fields: Dict[str, str] = {}
+        self.bar = None
+        if show_progress:
+            import tqdm
+
+            self.bar = tqdm.tqdm(total=100, desc=stage.name, position=position, leave=True, unit="%")
+
+    def _set_progress(self, fraction: float) -> None:
+        self.fraction = min(max(fraction, 0.0), 1.0)
+        if self.bar is not None:
+            self.bar.n = round(self.fraction * 100)
+            self.bar.refresh()
+
+    def _echo(self, line: str) -> None:
+        if self.bar is not None:
+            self.bar.write(line)
+        else:
+            print(line, flush=True)
+
+    def stdout(self, line: str) -> None:
+        if self.stage.kind != "ffmpeg":
+            self.stderr(line)
+            return
+        # -progress 每次输出一组 key=value，以 progress=continue/end 结束
+        key, _, value = line.partition("=")
+        self.fields[key.strip()] = value.strip()
+        if key != "progress":
+            return
+        if value.strip() == "end":
+            self._set_progress(1.0)
+            return
+        out_time = self.fields.get("out_time_us", "N/A")
+        duration = self.duration or self.input_duration
+        if out_time.lstrip("-").isdigit() and duration > 0:
+            self._set_progress(int(out_time) / 1e6 / duration)
+
+    def stderr(self, line: str) -> None:
+        if self.stage.kind == "ffmpeg":
+            self.tail.append(line)
+            m = DURATION_RE.search(line)
+            if m:
+                h, mm, s = m.groups()
+                self.input_duration = max(self.input_duration, int(h) * 3600 + int(mm) * 60 + float(s))
+            return
+        if self.stage.kind == "manim":
+            m = TQDM_RE.search(line)
+            if m:
+                # 每个动画各有一个进度条，这里显示当前动画的进度
+                self._set_progress(int(m.group(1)) / 100)
+                if self.bar is not None:
+                    self.bar.set_postfix_str(line[: m.start()].strip().rstrip(":")[:40], refresh=False)
+                return
+        self.tail.append(line)
+        self._echo(line)
+
+    def close(self) -> None:
+        if self.bar is not None:
+            self.bar.close()
+
+
+async def _read_lines(stream: asyncio.StreamReader, on_line: Callable[[str], None]) -> None:
+    """按行读取，\\r 也视为换行（进度条以 \\r 原地刷新）"""
+    buffer = b""
+    while chunk := await stream.read(1 << 16):
+        *lines, buffer = re.split(rb"[\r\n]", buffer + chunk)
+        for line in lines:
+            if line.strip():
+                on_line(line.decode(errors="replace"))
+    if buffer.strip():
+        on_line(buffer.decode(errors="replace"))
+
+
+def _signal_tree(proc: asyncio.subprocess.Process, monitor: _TreeMonitor, kill: bool) -> None:
+    """
+    向整个进程树发送 terminate 或 kill
+
+    POSIX 上子进程是独立进程组的组长，直接向进程组发送信号；Windows 上依赖 psutil 找到子孙进程。
+    不用 proc.terminate()：其内部的 Popen.send_signal 会先 poll，若进程恰好刚退出就被它回收，
+    asyncio 的子进程监视器随后只能报告退出码 255
+    """
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        return
+    monitor.collect_children()
+    if proc.returncode is None:
+        try:
+            proc.kill() if kill else proc.terminate()
+        except ProcessLookupError:
+            pass
+    monitor.signal_children(kill)
+
+
+async def _wait_exit(proc: asyncio.subprocess.Process, timeout: float) -> bool:
+    """等待进程退出；不用 proc.wait()，它还要等输出管道关闭，而管道可能仍被未退出的孙进程持有"""
+    deadline = time.monotonic() + timeout
+    while proc.returncode is None and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return proc.returncode is not None
+
+
+async def _terminate(proc: asyncio.subprocess.Process, monitor: _TreeMonitor) -> None:
+    """先 terminate 整个进程树，宽限期内未退出则 kill"""
+    _signal_tree(proc, monitor, kill=False)
+    if not await _wait_exit(proc, TERMINATE_GRACE):
+        _signal_tree(proc, monitor, kill=True)
+        await _wait_exit(proc, TERMINATE_GRACE)
+
+
+async def run_stage_async(
+    stage: Stage,
+    check: bool = True,
+    metrics_path: Path = METRICS_PATH,
+    show_progress: bool | None = None,
+    position: int = 0,
+) -> StageMetrics:
+    """
+    执行一个阶段并记录指标
+
+    Args:
+        stage (Stage): 阶段名、命令与超时
+        check (bool): 失败或超时时是否抛出 CalledProcessError / TimeoutExpired
+        metrics_path (Path): 指标追加写入的 JSON lines 文件
+        show_progress (bool | None): 是否显示进度条，None 时仅在终端中显示
+        position (int): 并发执行时进度条所在的行
+
+    Returns:
+        StageMetrics: 本次执行的指标
+    """
+    progress = sys.stderr.isatty() if show_progress is None else show_progress
+    cmd = list(stage.cmd)
+    if stage.kind == "ffmpeg":
+        cmd = cmd[:1] + ["-hide_banner", "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    metrics = StageMetrics(
+        stage.name, started=time.time(), command=" ".join(stage.cmd), tags={**env_tags(), **stage.tags}
+    )
+    t0 = time.perf_counter()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=os.name == "posix",  # 自成进程组，终止时连同子孙进程一起
+        )
+    except OSError:
+        metrics.status = "failed"
+        metrics.wall_time = time.perf_counter() - t0
+        write_metrics(metrics, metrics_path)
+        raise
+    assert proc.stdout is not None and proc.stderr is not None
+
+    monitor = _TreeMonitor(proc.pid)
+    parser = _OutputParser(stage, progress, position)
+
+    async def sample() -> None:
+        while True:
+            monitor.sample()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    sampler = asyncio.create_task(sample())
+    readers = [
+        asyncio.create_task(_read_lines(proc.stdout, parser.stdout)),
+        asyncio.create_task(_read_lines(proc.stderr, parser.stderr)),
+    ]
+    try:
+        async with asyncio.timeout(stage.timeout):
+            await asyncio.gather(*readers)
+            await proc.wait()
+        metrics.status = "ok" if proc.returncode == 0 else "failed"
+    except TimeoutError:
+        metrics.status = "timeout"
+        await _terminate(proc, monitor)
+    except asyncio.CancelledError:
+        metrics.status = "cancelled"
+        await _terminate(proc, monitor)
+        raise
+    finally:
+        sampler.cancel()
+        for reader in readers:
+            reader.cancel()
+        monitor.finish()
+        parser.close()
+        metrics.returncode = proc.returncode
+        metrics.wall_time = time.perf_counter() - t0
+        metrics.cpu_time = monitor.cpu_time
+        metrics.peak_rss = monitor.peak_rss
+        metrics.progress = parser.fraction
+        write_metrics(metrics, metrics_path)
+
+    if metrics.status != "ok":
+        detail = f"timed out after {stage.timeout} s" if metrics.status == "timeout" else f"exit code {proc.returncode}"
+        print(f"[red]{stage.name} failed ({detail})[/red]: {metrics.command}")
+        for line in parser.tail:
+            print(f"  {escape(line)}")
+        if check and metrics.status == "timeout":
+            raise subprocess.TimeoutExpired(stage.cmd, stage.timeout or 0.0, stderr="\n".join(parser.tail))
+        if check:
+            raise subprocess.CalledProcessError(proc.returncode or 1, stage.cmd, stderr="\n".join(parser.tail))
+    return metrics
+
+
+def run_stages(
+    stages: List[Stage],
+    check: bool = True,
+    metrics_path: Path = METRICS_PATH,
+    show_progress: bool | None = None,
+) -> List[StageMetrics]:
+    """
+    并发执行多个阶段，等待全部结束后按顺序返回各自的指标
+
+    check 为真时任一阶段失败即取消其余阶段，并抛出第一个失败阶段的异常；
+    Ctrl+C 或 SIGTERM 同样会终止所有子进程，后者以退出码 143 退出
+    """
+    terminated = False
+
+    async def main() -> List[StageMetrics]:
+        nonlocal terminated
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        assert task is not None
+
+        def on_sigterm() -> None:
+            nonlocal terminated
+            terminated = True
+            task.cancel()
+
+        try:
+            loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+        except (NotImplementedError, RuntimeError, ValueError):  # Windows 或非主线程
+            pass
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [
+                    group.create_task(run_stage_async(stage, check, metrics_path, show_progress, k))
+                    for k, stage in enumerate(stages)
+                ]
+        except BaseExceptionGroup as e:  # 只抛出第一个失败的阶段，其余阶段是被它取消的
+            raise e.exceptions[0] from None
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGTERM)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+        return [t.result() for t in tasks]
+
+    try:
+        return asyncio.run(main())
+    except asyncio.CancelledError:
+        if terminated:
+            raise SystemExit(128 + signal.SIGTERM) from None
+        raise
+
+
+def run_stage(
+    stage: Stage, check: bool = True, metrics_path: Path = METRICS_PATH, show_progress: bool | None = None
+) -> StageMetrics:
+    """执行单个阶段，见 run_stages"""
+    return run_stages([stage], check, metrics_path, show_progress)[0]
+
+
+@contextlib.contextmanager
+def measure(
+    stage: str, tags: Dict[str, Any] | None = None, metrics_path: Path = METRICS_PATH
+) -> Generator[StageMetrics, None, None]:
+    """
+    记录进程内执行的阶段：墙钟时间、本进程的 CPU 时间与进程迄今的峰值 RSS，退出时写入指标
+
+        with measure("render") as m:
+            ...
+        print(m.wall_time)
+    """
+    metrics = StageMetrics(stage, started=time.time(), command="(in-process)", tags={**env_tags(), **(tags or {})})
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    try:
+        yield metrics
+        metrics.status = "ok"
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        metrics.status = "cancelled"
+        raise
+    except BaseException:
+        metrics.status = "failed"
+        raise
+    finally:
+        metrics.wall_time = time.perf_counter() - t0
+        metrics.cpu_time = time.process_time() - cpu0
+        metrics.peak_rss = _self_peak_rss()
+        write_metrics(metrics, metrics_path)
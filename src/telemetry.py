@@ -0,0 +1,102 @@
+"""
+可选的逐步遥测记录，用于排查异常反弹
+
+时间、位置、速度与边界约束值写入预分配的数组，每步只做标量赋值，不创建 Python 对象；
+仿真结束或中断时导出为 .npz，离线分析无需重新仿真
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Literal
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from jaxtyping import Float
+
+TELEMETRY_FILENAME = "telemetry.npz"
+
+TelemetryMode = Literal["ring", "full"]
+
+
+class TelemetryRecorder:
+    """
+    Args:
+        capacity (int): ring 模式下保留的最近样本数；full 模式下的初始容量，写满后按倍增扩容
+        decimation (int): 每隔多少步记录一次
+        mode (TelemetryMode): ring 为固定内存的环形缓冲区，full 记录完整轨迹
+    """
+
+    def __init__(self, capacity: int = 100_000, decimation: int = 1, mode: TelemetryMode = "ring"):
+        if capacity <= 0 or decimation <= 0:
+            raise ValueError("capacity and decimation must be positive")
+        if mode not in ("ring", "full"):
+            raise ValueError(f"Unknown telemetry mode: {mode}")
+        self.mode = mode
+        self.decimation = decimation
+        self.steps = 0  # 收到的总步数（含被抽稀跳过的）
+        self.count = 0  # 写入的总样本数
+        self._alloc(capacity)
+
+    def _alloc(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.t: Float[np.ndarray, "n"] = np.empty(capacity)
+        self.pos: Float[np.ndarray, "n 2"] = np.empty((capacity, 2))
+        self.vel: Float[np.ndarray, "n 2"] = np.empty((capacity, 2))
+        self.constraint: Float[np.ndarray, "n"] = np.empty(capacity)
+
+    def _grow(self) -> None:
+        old = self.arrays()
+        self._alloc(self.capacity * 2)
+        n = len(old["t"])
+        self.t[:n] = old["t"]
+        self.pos[:n] = old["pos"]
+        self.vel[:n] = old["vel"]
+        self.constraint[:n] = old["constraint"]
+
+    def tick(self) -> bool:
+        """计入一步，返回这一步是否需要记录；被抽稀跳过的步不必计算样本"""
+        step = self.steps
+        self.steps += 1
+        return step % self.decimation == 0
+
+    def record(self, t: float, x: float, y: float, vx: float, vy: float, constraint: float) -> None:
+        """写入一个样本，只对 tick() 返回 True 的步调用"""
+        if self.count == self.capacity and self.mode == "full":
+            self._grow()
+        i = self.count % self.capacity
+        self.t[i] = t
+        self.pos[i, 0] = x
+        self.pos[i, 1] = y
+        self.vel[i, 0] = vx
+        self.vel[i, 1] = vy
+        self.constraint[i] = constraint
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """按时间顺序返回已记录的样本，ring 模式下环形缓冲区会先被展开"""
+        n = len(self)
+        if self.count <= self.capacity:
+            order = slice(0, n)
+        else:
+            order = np.roll(np.arange(self.capacity), -(self.count % self.capacity))
+        return {
+            "t": self.t[order],
+            "pos": self.pos[order],
+            "vel": self.vel[order],
+            "constraint": self.constraint[order],
+        }
+
+    def dump(self, path: Path) -> Path:
+        data: Dict[str, Any] = {
+            **self.arrays(),
+            "decimation": self.decimation,
+            "steps": self.steps,
+            "dropped": max(self.count - self.capacity, 0),
+        }
+        np.savez(path, **data)
+        return path
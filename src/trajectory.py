@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .record import RecordArrays
+
+if TYPE_CHECKING:
+    from jaxtyping import Float
+
+
+class Trajectory:
+    """
+    由碰撞记录构成的分段抛物线轨迹，直接在记录的数组上批量求值
+
+    第一段从初始状态开始，此后每次碰撞开始新的一段；最后一次碰撞之后小球停在碰撞点
+    """
+
+    def __init__(
+        self,
+        p0: Float[np.ndarray, "2"],
+        v0: Float[np.ndarray, "2"],
+        acc: Float[np.ndarray, "2"],
+        time: Float[np.ndarray, "n"],
+        position: Float[np.ndarray, "n 2"],
+        velocity_after: Float[np.ndarray, "n 2"],
+    ):
+        self.acc = np.asarray(acc, dtype=np.float64)
+        self.collision_time = np.asarray(time, dtype=np.float64)
+        # 每一段的起始时间、位置与速度，第 0 段为初始状态
+        self.seg_t0 = np.concatenate([[0.0], self.collision_time])
+        self.seg_p0 = np.concatenate([np.asarray(p0, dtype=np.float64)[None], np.asarray(position).reshape(-1, 2)])
+        self.seg_v0 = np.concatenate([np.asarray(v0, dtype=np.float64)[None], np.asarray(velocity_after).reshape(-1, 2)])
+
+    @classmethod
+    def from_arrays(cls, arrays: RecordArrays) -> "Trajectory":
+        ball = arrays.meta.ball
+        return cls(
+            p0=np.array(ball.initial_pos),
+            v0=np.array(ball.initial_vel),
+            acc=np.array(ball.acc),
+            time=arrays.time,
+            position=arrays.position,
+            velocity_after=arrays.velocity_after,
+        )
+
+    @property
+    def end_time(self) -> float:
+        return float(self.collision_time[-1]) if len(self.collision_time) else float("inf")
+
+    def positions_at(self, t: Float[np.ndarray, "m"]) -> Float[np.ndarray, "m 2"]:
+        """批量计算给定时刻的位置"""
+        t = np.minimum(np.asarray(t, dtype=np.float64), self.end_time)
+        k = np.searchsorted(self.collision_time, t, side="right")
+        dt = (t - self.seg_t0[k])[:, None]
+        return self.seg_p0[k] + self.seg_v0[k] * dt + 0.5 * self.acc * dt * dt
+
+    def position_at(self, t: float) -> Float[np.ndarray, "2"]:
+        return self.positions_at(np.array([t]))[0]
+
+    def collisions_between(self, t0: float, t1: float) -> slice:
+        """时间区间 (t0, t1] 内发生的碰撞的索引范围，二分查找而非遍历全部碰撞"""
+        lo = int(np.searchsorted(self.collision_time, t0, side="right"))
+        hi = int(np.searchsorted(self.collision_time, t1, side="right"))
+        return slice(lo, hi)
+
+    def impact_normals(self) -> Float[np.ndarray, "n 2"]:
+        """
+        各次碰撞处的单位外法向，由碰撞前后的速度差得到，不依赖具体边界类型
+
+        反射公式 v' = v - (1 + e)(v·n)n，碰撞前小球向外运动 (v·n > 0)，因此 v - v' 与 n 同向
+        """
+        dt = (self.collision_time - self.seg_t0[:-1])[:, None]
+        vel_before = self.seg_v0[:-1] + self.acc * dt
+        diff = vel_before - self.seg_v0[1:]
+        norm = np.linalg.norm(diff, axis=-1, keepdims=True)
+        return diff / np.where(norm > 0, norm, 1.0)
@@ -0,0 +1,51 @@
+"""
+小球之间碰撞检测的宽相：扫描排除（sweep and prune）
+
+按 x 方向包围区间的左端排序后扫描，只有区间重叠的小球对才进入精确检测；
+小球每步移动很少，上一步的顺序几乎有序，插入排序的代价接近线性
+"""
+
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+
+class SweepAndPrune:
+    def __init__(self, n: int):
+        self.order: List[int] = list(range(n))  # 跨步保留的排序结果
+
+    def pairs(
+        self,
+        xs: Sequence[float],
+        ys: Sequence[float],
+        radii: Sequence[float],
+        active: Sequence[bool],
+    ) -> List[Tuple[int, int]]:
+        """
+        包围盒重叠的小球对 (i, j)，i < j；不活跃的小球不参与
+
+        Returns:
+            List[Tuple[int, int]]: 候选小球对，仍需由调用方做精确检测
+        """
+        lo = [x - r for x, r in zip(xs, radii)]
+        order = self.order
+        for k in range(1, len(order)):
+            i = order[k]
+            key = lo[i]
+            m = k - 1
+            while m >= 0 and lo[order[m]] > key:
+                order[m + 1] = order[m]
+                m -= 1
+            order[m + 1] = i
+
+        pairs: List[Tuple[int, int]] = []
+        sweep: List[int] = []  # x 区间可能与后续小球重叠的小球
+        for i in order:
+            if not active[i]:
+                continue
+            sweep = [j for j in sweep if xs[j] + radii[j] >= lo[i]]
+            for j in sweep:
+                if abs(ys[i] - ys[j]) <= radii[i] + radii[j]:
+                    pairs.append((j, i) if j < i else (i, j))
+            sweep.append(i)
+        return pairs
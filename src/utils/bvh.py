@@ -0,0 +1,163 @@
+"""
+线段集合的包围盒层次结构（BVH），用于多边形边界的最近边、射线与扫掠查询
+
+按质心中位数自顶向下划分，叶子最多 LEAF_SIZE 条线段；节点数组在构建时转换为 Python 列表，
+单点查询逐个访问节点时不产生 numpy 标量的开销
+"""
+
+from __future__ import annotations
+
+from math import inf
+from typing import TYPE_CHECKING, List, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from jaxtyping import Float, Int
+
+
+class SegmentBVH:
+    LEAF_SIZE = 4
+
+    def __init__(self, a: Float[np.ndarray, "n 2"], b: Float[np.ndarray, "n 2"]):
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        seg_lo = np.minimum(a, b)
+        seg_hi = np.maximum(a, b)
+        centroid = (a + b) / 2
+
+        lo: List[Tuple[float, float]] = []
+        hi: List[Tuple[float, float]] = []
+        children: List[Tuple[int, int]] = []  # 叶子为 (-1, -1)
+        span: List[Tuple[int, int]] = []  # 叶子中的线段在重排后数组中的 [start, end)
+        order: List[int] = []
+
+        def build(idx: Int[np.ndarray, "k"]) -> int:
+            node = len(lo)
+            box_lo, box_hi = seg_lo[idx].min(axis=0), seg_hi[idx].max(axis=0)
+            lo.append((float(box_lo[0]), float(box_lo[1])))
+            hi.append((float(box_hi[0]), float(box_hi[1])))
+            children.append((-1, -1))
+            span.append((len(order), len(order)))
+            if len(idx) <= self.LEAF_SIZE:
+                span[node] = (len(order), len(order) + len(idx))
+                order.extend(idx.tolist())
+                return node
+            axis = int(np.argmax(box_hi - box_lo))
+            idx = idx[np.argsort(centroid[idx, axis], kind="stable")]
+            mid = len(idx) // 2
+            left = build(idx[:mid])
+            right = build(idx[mid:])
+            children[node] = (left, right)
+            return node
+
+        build(np.arange(len(a)))
+        self.index: Int[np.ndarray, "n"] = np.array(order, dtype=np.int64)  # 重排后位置 -> 原线段编号
+        self._lo, self._hi, self._children, self._span = lo, hi, children, span
+        self._a: List[Tuple[float, float]] = [(float(x), float(y)) for x, y in a[self.index]]
+        self._b: List[Tuple[float, float]] = [(float(x), float(y)) for x, y in b[self.index]]
+
+    def __len__(self) -> int:
+        return len(self._a)
+
+    def _box_dist2(self, node: int, x: float, y: float) -> float:
+        (lx, ly), (hx, hy) = self._lo[node], self._hi[node]
+        dx = lx - x if x < lx else (x - hx if x > hx else 0.0)
+        dy = ly - y if y < ly else (y - hy if y > hy else 0.0)
+        return dx * dx + dy * dy
+
+    def nearest(self, x: float, y: float) -> Tuple[int, float, float, float]:
+        """
+        距离点 (x, y) 最近的线段
+
+        Returns:
+            Tuple[int, float, float, float]: (线段编号, 距离平方, 线段上最近点 x, y)
+        """
+        best = (-1, inf, 0.0, 0.0)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_dist2(node, x, y) >= best[1]:
+                continue
+            left, right = self._children[node]
+            if left >= 0:
+                # 先访问更近的子节点，使剪枝尽早生效
+                if self._box_dist2(left, x, y) < self._box_dist2(right, x, y):
+                    stack += (right, left)
+                else:
+                    stack += (left, right)
+                continue
+            for i in range(*self._span[node]):
+                (ax, ay), (bx, by) = self._a[i], self._b[i]
+                ex, ey = bx - ax, by - ay
+                len2 = ex * ex + ey * ey
+                u = ((x - ax) * ex + (y - ay) * ey) / len2 if len2 > 0 else 0.0
+                u = 0.0 if u < 0.0 else (1.0 if u > 1.0 else u)
+                cx, cy = ax + u * ex, ay + u * ey
+                d2 = (x - cx) ** 2 + (y - cy) ** 2
+                if d2 < best[1]:
+                    best = (int(self.index[i]), d2, cx, cy)
+        return best
+
+    def line_intersections(self, ox: float, oy: float, dx: float, dy: float) -> List[Tuple[float, int]]:
+        """
+        直线 o + t·d 与所有线段的交点，t 可正可负；线段按 [a, b) 半开区间计，首尾相连时顶点只计一次
+
+        Returns:
+            List[Tuple[float, int]]: (参数 t, 线段编号)
+        """
+        hits: List[Tuple[float, int]] = []
+        # 直线的法向，用于判断包围盒是否跨越直线
+        nx, ny = -dy, dx
+        anx, any_ = abs(nx), abs(ny)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            (lx, ly), (hx, hy) = self._lo[node], self._hi[node]
+            cx, cy = (lx + hx) / 2 - ox, (ly + hy) / 2 - oy
+            if abs(nx * cx + ny * cy) > anx * (hx - lx) / 2 + any_ * (hy - ly) / 2:
+                continue
+            left, right = self._children[node]
+            if left >= 0:
+                stack += (left, right)
+                continue
+            for i in range(*self._span[node]):
+                (ax, ay), (bx, by) = self._a[i], self._b[i]
+                ex, ey = bx - ax, by - ay
+                denom = dx * ey - dy * ex
+                if denom == 0:
+                    continue
+                wx, wy = ax - ox, ay - oy
+                u = (wx * dy - wy * dx) / denom
+                if 0.0 <= u < 1.0:
+                    hits.append(((wx * ey - wy * ex) / denom, int(self.index[i])))
+        return hits
+
+    def first_hit(self, x0: float, y0: float, x1: float, y1: float) -> Tuple[float, int] | None:
+        """
+        点沿线段 p0 -> p1 扫掠时最先碰到的线段（连续碰撞检测）
+
+        Returns:
+            Tuple[float, int] | None: (碰撞时刻占整段的比例 [0, 1], 线段编号)，不相交时为 None
+        """
+        hits = [hit for hit in self.line_intersections(x0, y0, x1 - x0, y1 - y0) if 0.0 <= hit[0] <= 1.0]
+        return min(hits) if hits else None
+
+    def crossings(self, x: float, y: float) -> int:
+        """从点 (x, y) 向 +x 方向的射线穿过线段的次数，奇数表示点在闭合折线内部"""
+        count = 0
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            ly, (hx, hy) = self._lo[node][1], self._hi[node]
+            if y < ly or y > hy or x > hx:
+                continue
+            left, right = self._children[node]
+            if left >= 0:
+                stack += (left, right)
+                continue
+            for i in range(*self._span[node]):
+                (ax, ay), (bx, by) = self._a[i], self._b[i]
+                if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+                    count += 1
+        return count
@@ -2,6 +2,7 @@ from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 ASSETS_PATH = PROJECT_ROOT / "assets"
+CACHE_PATH = PROJECT_ROOT / ".cache"
 
 
 def get_default_sf2_file() -> Path:
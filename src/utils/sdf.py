@@ -0,0 +1,285 @@
+"""
+有符号距离场（SDF）的构建与缓存：由 SVG 路径或位图遮罩生成规则网格上的距离场
+
+与边界类的约定一致，形状描述圆心限制区域，内部为负；形状平移到原点、等比缩放到最长边为 size，y 轴朝上。
+网格只需构建一次，按源文件内容与构建参数的哈希缓存在 .cache/sdf 下
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Tuple, cast
+
+import numpy as np
+
+from .common import ASSETS_PATH, CACHE_PATH
+
+if TYPE_CHECKING:
+    from jaxtyping import Bool, Float
+
+SDF_CACHE_PATH = CACHE_PATH / "sdf"
+SDF_VERSION = 1  # 构建算法变化时递增，使旧缓存失效
+CURVE_SEGMENTS = 16  # 每段贝塞尔曲线离散成的线段数
+MARGIN = 0.15  # 网格在形状外侧额外覆盖的范围（相对 size），容纳渲染时膨胀的轮廓
+
+_SVG_TOKEN = re.compile(r"[MmLlHhVvCcSsQqTtZzAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+@dataclass
+class SDFGrid:
+    values: Float[np.ndarray, "ny nx"]  # values[j, i] 为点 (x0 + i·h, y0 + j·h) 处的有符号距离
+    x0: float
+    y0: float
+    h: float
+
+
+def resolve_shape_path(source: str) -> Path:
+    """相对路径相对于 assets/"""
+    path = Path(source)
+    return path if path.is_absolute() else ASSETS_PATH / path
+
+
+def _bezier(points: Float[np.ndarray, "k 2"]) -> Float[np.ndarray, "s 2"]:
+    """按伯恩斯坦多项式离散二次或三次贝塞尔曲线，不含起点"""
+    t = np.linspace(0.0, 1.0, CURVE_SEGMENTS + 1)[1:, None]
+    if len(points) == 3:
+        p0, p1, p2 = points
+        return (1 - t) ** 2 * p0 + 2 * (1 - t) * t * p1 + t**2 * p2
+    p0, p1, p2, p3 = points
+    return (1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1 + 3 * (1 - t) * t**2 * p2 + t**3 * p3
+
+
+def _point(p: Float[np.ndarray, "2"]) -> Tuple[float, float]:
+    return float(p[0]), float(p[1])
+
+
+def parse_svg_path(d: str) -> List[Float[np.ndarray, "k 2"]]:
+    """
+    解析 SVG 路径数据（M/L/H/V/C/S/Q/T/Z 及其相对形式），曲线离散为折线，每个子路径视作一个闭合环
+
+    不支持圆弧命令 A；路径上的 transform 属性不生效
+    """
+    tokens = _SVG_TOKEN.findall(d)
+    rings: List[List[Tuple[float, float]]] = []
+    ring: List[Tuple[float, float]] = []
+    cur = np.zeros(2)
+    start = np.zeros(2)
+    last_ctrl: np.ndarray | None = None  # 上一段曲线的控制点，用于 S/T 的反射
+    last_upper = ""
+    cmd = ""
+    i = 0
+
+    def take(n: int) -> Float[np.ndarray, "n"]:
+        nonlocal i
+        values = np.array([float(v) for v in tokens[i : i + n]])
+        i += n
+        return values
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]
+            i += 1
+            if cmd in "Zz":
+                if len(ring) > 1:
+                    rings.append(ring)
+                ring = [_point(start)]
+                cur = start.copy()
+                last_ctrl, last_upper = None, ""
+                continue
+        elif not cmd or cmd in "Zz":
+            raise ValueError(f"Invalid SVG path data near token {i}: {tokens[i]!r}")
+
+        rel = cmd.islower()
+        base = cur if rel else np.zeros(2)
+        upper = cmd.upper()
+        ctrl: np.ndarray | None = None
+        if upper == "M":
+            cur = take(2) + base
+            if len(ring) > 1:
+                rings.append(ring)
+            ring = [_point(cur)]
+            start = cur.copy()
+            cmd = "l" if rel else "L"  # M 之后的坐标对按 L 处理
+        elif upper == "L":
+            cur = take(2) + base
+            ring.append(_point(cur))
+        elif upper == "H":
+            cur = np.array([take(1)[0] + base[0], cur[1]])
+            ring.append(_point(cur))
+        elif upper == "V":
+            cur = np.array([cur[0], take(1)[0] + base[1]])
+            ring.append(_point(cur))
+        elif upper in "CSQT":
+            if upper == "C":
+                c1, ctrl, end = take(2) + base, take(2) + base, take(2) + base
+                points = np.stack([cur, c1, ctrl, end])
+            elif upper == "S":
+                c1 = 2 * cur - last_ctrl if last_ctrl is not None and last_upper in "CS" else cur
+                ctrl, end = take(2) + base, take(2) + base
+                points = np.stack([cur, c1, ctrl, end])
+            elif upper == "Q":
+                ctrl, end = take(2) + base, take(2) + base
+                points = np.stack([cur, ctrl, end])
+            else:
+                ctrl = 2 * cur - last_ctrl if last_ctrl is not None and last_upper in "QT" else cur.copy()
+                end = take(2) + base
+                points = np.stack([cur, ctrl, end])
+            ring.extend(_point(p) for p in _bezier(points))
+            cur = end
+        else:
+            raise ValueError(f"Unsupported SVG path command: {cmd}")
+        last_ctrl, last_upper = ctrl, upper
+
+    if len(ring) > 1:
+        rings.append(ring)
+    return [np.array(r, dtype=np.float64) for r in rings if len(r) >= 3]
+
+
+def load_svg_rings(path: Path) -> List[Float[np.ndarray, "k 2"]]:
+    """读取 SVG 文件中所有 path、polygon 与 polyline 元素，返回闭合环（SVG 坐标，y 轴朝下）"""
+    rings: List[Float[np.ndarray, "k 2"]] = []
+    for elem in ET.parse(path).iter():
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "path" and elem.get("d"):
+            rings.extend(parse_svg_path(elem.get("d", "")))
+        elif tag in ("polygon", "polyline") and elem.get("points"):
+            values = [float(v) for v in _SVG_TOKEN.findall(elem.get("points", ""))]
+            rings.append(np.array(values, dtype=np.float64).reshape(-1, 2))
+    if not rings:
+        raise ValueError(f"No closed shape found in {path}")
+    return rings
+
+
+def load_mask(path: Path, invert: bool = False) -> Bool[np.ndarray, "h w"]:
+    """读取位图遮罩：有 alpha 通道时按不透明度，否则按亮度取阈值，亮（不透明）处为内部"""
+    import imageio.v3 as iio
+
+    img = np.asarray(iio.imread(path))  # pyright: ignore[reportUnknownMemberType]
+    scale = float(np.iinfo(img.dtype).max) if np.issubdtype(img.dtype, np.integer) else 1.0
+    img = img.astype(np.float64) / scale
+    if img.ndim == 3:
+        img = img[..., 3] if img.shape[-1] == 4 else img[..., :3].mean(axis=-1)
+    mask = img > 0.5
+    return ~mask if invert else mask
+
+
+def _grid_axes(
+    lo: Float[np.ndarray, "2"], hi: Float[np.ndarray, "2"], size: float, h: float
+) -> Tuple[Float[np.ndarray, "nx"], Float[np.ndarray, "ny"]]:
+    margin = MARGIN * size
+    n = np.ceil((hi - lo + 2 * margin) / h).astype(int) + 1
+    nx, ny = int(n[0]), int(n[1])
+    x0 = (lo[0] + hi[0]) / 2 - (nx - 1) / 2 * h
+    y0 = (lo[1] + hi[1]) / 2 - (ny - 1) / 2 * h
+    return x0 + h * np.arange(nx), y0 + h * np.arange(ny)
+
+
+def sdf_from_rings(rings: List[Float[np.ndarray, "k 2"]], size: float, resolution: int) -> SDFGrid:
+    """
+    由闭合折线计算精确的有符号距离场，符号按奇偶规则确定（环可以表示孔洞）
+
+    Args:
+        rings (List[np.ndarray]): SVG 坐标下的闭合环
+        size (float): 形状最长边缩放到的长度
+        resolution (int): 最长边上的网格数
+    """
+    points = np.concatenate(rings)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scale = size / float(np.max(hi - lo))
+    mid = (lo + hi) / 2
+    # 平移到原点、缩放并翻转 y 轴
+    rings = [(r - mid) * scale * np.array([1.0, -1.0]) for r in rings]
+    a = np.concatenate(rings)
+    b = np.concatenate([np.roll(r, -1, axis=0) for r in rings])
+    lo, hi = a.min(axis=0), a.max(axis=0)
+
+    h = size / resolution
+    xs, ys = _grid_axes(lo, hi, size, h)
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    values = np.empty(len(grid))
+    edges = b - a
+    len2 = np.maximum(np.einsum("ni,ni->n", edges, edges), 1e-300)
+    dy = np.where(b[:, 1] != a[:, 1], b[:, 1] - a[:, 1], 1.0)
+    # 分块计算，控制 (点数 × 边数) 临时数组的大小
+    for s in range(0, len(grid), 4096):
+        p = grid[s : s + 4096]
+        d2 = np.full(len(p), np.inf)
+        inside = np.zeros(len(p), dtype=bool)
+        for e in range(0, len(a), 256):
+            ae, ee = a[e : e + 256], edges[e : e + 256]
+            w = p[:, None, :] - ae[None]
+            u = np.clip(np.einsum("pei,ei->pe", w, ee) / len2[e : e + 256], 0.0, 1.0)
+            d2 = np.minimum(d2, np.sum((w - u[..., None] * ee) ** 2, axis=-1).min(axis=1))
+            py = p[:, 1:2]
+            crosses = (ae[:, 1] > py) != (b[e : e + 256, 1] > py)
+            x_int = ae[:, 0] + (py - ae[:, 1]) * ee[:, 0] / dy[e : e + 256]
+            inside ^= np.sum(crosses & (p[:, 0:1] < x_int), axis=1) % 2 == 1
+        values[s : s + 4096] = np.where(inside, -np.sqrt(d2), np.sqrt(d2))
+    return SDFGrid(values.reshape(len(ys), len(xs)), float(xs[0]), float(ys[0]), h)
+
+
+def sdf_from_mask(mask: Bool[np.ndarray, "h w"], size: float, resolution: int) -> SDFGrid:
+    """
+    由位图遮罩计算有符号距离场（欧氏距离变换），过大的位图先按步长降采样
+
+    像素中心之间的边界取在两像素正中，距离按半个像素修正，使零等值线与遮罩边缘对齐
+    """
+    # 只在构建位图距离场时需要
+    from scipy.ndimage import distance_transform_edt  # pyright: ignore[reportUnknownVariableType]
+
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        raise ValueError("Mask is empty")
+    mask = mask[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+    step = max(1, int(np.ceil(max(mask.shape) / resolution)))
+    mask = mask[::step, ::step][::-1]  # 图像第 0 行在上方，翻转使行号随 y 增大
+    h = size / max(mask.shape)
+
+    pad = int(np.ceil(MARGIN * size / h))
+    mask = np.pad(mask, pad, constant_values=False)
+    d_out = cast(np.ndarray, distance_transform_edt(~mask))
+    d_in = cast(np.ndarray, distance_transform_edt(mask))
+    values = np.where(mask, 0.5 - d_in, d_out - 0.5) * h
+    ny, nx = mask.shape
+    return SDFGrid(values, -(nx - 1) / 2 * h, -(ny - 1) / 2 * h, h)
+
+
+def shape_digest(path: Path, size: float, resolution: int, invert: bool = False) -> str:
+    """源文件内容与构建参数的哈希，作为缓存键"""
+    h = hashlib.sha256(path.read_bytes())
+    params = {"size": size, "resolution": resolution, "invert": invert, "version": SDF_VERSION}
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def build_sdf(path: Path, size: float, resolution: int, invert: bool = False) -> SDFGrid:
+    if path.suffix.lower() == ".svg":
+        return sdf_from_rings(load_svg_rings(path), size, resolution)
+    return sdf_from_mask(load_mask(path, invert), size, resolution)
+
+
+def load_sdf(path: Path, size: float, resolution: int, invert: bool = False) -> Tuple[SDFGrid, str]:
+    """
+    读取缓存的距离场，不存在时构建并写入缓存
+
+    Returns:
+        Tuple[SDFGrid, str]: 距离场与缓存键
+    """
+    digest = shape_digest(path, size, resolution, invert)
+    cache_file = SDF_CACHE_PATH / f"{digest}.npz"
+    if cache_file.exists():
+        with np.load(cache_file) as data:
+            grid = SDFGrid(data["values"], float(data["x0"]), float(data["y0"]), float(data["h"]))
+        return grid, digest
+
+    grid = build_sdf(path, size, resolution, invert)
+    SDF_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_suffix(".tmp.npz")
+    np.savez(tmp, values=grid.values, x0=grid.x0, y0=grid.y0, h=grid.h)
+    tmp.replace(cache_file)
+    return grid, digest
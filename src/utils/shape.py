@@ -1,6 +1,6 @@
 # pyright: standard
 import numpy as np
-from manim import VMobject
+from manim import Polygon, VMobject
 from scipy.ndimage import binary_dilation
 from skimage import measure
 
@@ -68,3 +68,8 @@ def ellipse_boundary_to_manim(Q: np.ndarray, center: Vec2, ball_r: float, grid_r
     vm = VMobject(**kwargs)
     vm.set_points_smoothly(np.array(pts))
     return vm
+
+
+def outline_to_manim(points: np.ndarray, **kwargs) -> VMobject:
+    """将渲染用的闭合轮廓 (m, 2) 转为 Manim 多边形，kwargs 透传给 Polygon"""
+    return Polygon(*[np.array([x, y, 0.0]) for x, y in points], **kwargs)
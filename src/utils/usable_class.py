@@ -1,7 +1,11 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
-from math import hypot
+from math import hypot, log
 from typing import (
+    TYPE_CHECKING,
     Any,
+    Dict,
     Generic,
     Iterable,
     Iterator,
@@ -15,17 +19,19 @@ from typing import (
 )
 
 import numpy as np
-from jaxtyping import Float
 from rich import print
 
+if TYPE_CHECKING:
+    from jaxtyping import Float, Int
+
+    Mat2 = Float[np.ndarray, "2 2"]
+
 
 class XYProtocol(Protocol):
     x: float
     y: float
 
 
-Mat2 = Float[np.ndarray, "2 2"]
-
 
 @dataclass
 class Vec2:
@@ -87,6 +93,83 @@ class Vec2:
         return f"Vec2{{x:{self.x:.3f}, y:{self.y:.3f}}}"
 
 
+class QuantileSketch:
+    """
+    对数分桶的流式分位数估计（类似 DDSketch），相对误差不超过 alpha
+
+    桶数有上限，超出时合并绝对值最小的桶，内存固定；两个草图直接按桶相加即可合并
+    """
+
+    def __init__(self, alpha: float = 0.01, max_buckets: int = 2048, min_value: float = 1e-9):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value  # 绝对值小于该值的样本计入零桶
+        self.pos: Dict[int, int] = {}
+        self.neg: Dict[int, int] = {}
+        self.zero = 0
+        self.n = 0
+
+    def _add(self, store: Dict[int, int], keys: Int[np.ndarray, "m"]) -> None:
+        uniq, counts = np.unique(keys, return_counts=True)
+        for k, c in zip(uniq.tolist(), counts.tolist()):
+            store[k] = store.get(k, 0) + c
+        self._collapse(store)
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        if len(store) <= self.max_buckets:
+            return
+        keys = sorted(store)
+        n_merge = len(keys) - self.max_buckets + 1
+        merged = sum(store.pop(k) for k in keys[:n_merge])
+        target = keys[n_merge - 1]
+        store[target] = store.get(target, 0) + merged
+
+    def update(self, x: float) -> None:
+        self.update_many(np.array([x]))
+
+    def update_many(self, xs: Float[np.ndarray, "m"]) -> None:
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        mag = np.abs(xs)
+        nonzero = mag >= self.min_value
+        self.zero += int(len(xs) - np.count_nonzero(nonzero))
+        keys = np.ceil(np.log(mag[nonzero]) / self._log_gamma).astype(np.int64)
+        positive = xs[nonzero] > 0
+        if positive.any():
+            self._add(self.pos, keys[positive])
+        if not positive.all():
+            self._add(self.neg, keys[~positive])
+        self.n += len(xs)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for store, other_store in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in other_store.items():
+                store[k] = store.get(k, 0) + c
+            self._collapse(store)
+        self.zero += other.zero
+        self.n += other.n
+
+    def quantile(self, q: float) -> float:
+        if self.n == 0:
+            return float("nan")
+        rank = q * (self.n - 1)
+        seen = 0
+        # 从最小值开始累计：负数按绝对值从大到小，然后零，最后正数从小到大
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -2 * self.gamma**k / (self.gamma + 1)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return 2 * self.gamma**k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.pos) / (self.gamma + 1) if self.pos else 0.0
+
+
 class OnlineStats:
     def __init__(self):
         self.n = 0
@@ -94,6 +177,7 @@ class OnlineStats:
         self.m2 = 0.0  # 和方差相差一个除数n
         self.max = float("-inf")
         self.min = float("inf")
+        self.sketch = QuantileSketch()  # p50/p95/p99 等分位数
 
     def update(self, x: float):
         self.n += 1
@@ -110,6 +194,33 @@ class OnlineStats:
         if x < self.min:
             self.min = x
 
+        self.sketch.update(x)
+
+    def update_many(self, xs: Float[np.ndarray, "m"]):
+        """批量更新，先对整批求矩再按并行公式合并"""
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        if len(xs) == 0:
+            return
+        batch_mean = float(xs.mean())
+        self._combine(len(xs), batch_mean, float(((xs - batch_mean) ** 2).sum()), float(xs.min()), float(xs.max()))
+        self.sketch.update_many(xs)
+
+    def merge(self, other: "OnlineStats"):
+        """合并另一份统计（如来自工作进程），方差使用 Chan 等人的并行合并公式"""
+        if other.n == 0:
+            return
+        self._combine(other.n, other.mean, other.m2, other.min, other.max)
+        self.sketch.merge(other.sketch)
+
+    def _combine(self, n_b: int, mean_b: float, m2_b: float, min_b: float, max_b: float):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        self.min = min(self.min, min_b)
+        self.max = max(self.max, max_b)
+
     @property
     def variance(self):
         return self.m2 / self.n if self.n > 0 else 0.0
@@ -118,10 +229,14 @@ class OnlineStats:
     def std(self):
         return self.variance**0.5
 
+    def quantile(self, q: float) -> float:
+        return self.sketch.quantile(q)
+
     def print_stats(self):
         print(
             f"{self.mean:.4f}±{self.std:.4f}",
             f"[{self.min:.4f}, {self.max:.4f}]",
+            f"p50/p95/p99={self.quantile(0.5):.4f}/{self.quantile(0.95):.4f}/{self.quantile(0.99):.4f}",
             f"(n={self.n})",
         )
 
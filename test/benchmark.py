@@ -0,0 +1,354 @@
+# pyright: standard
+# 性能基准：仿真步进、恢复系数求解、完整规划、边界轮廓生成与 pygame 渲染，以及时间误差随步长的变化
+# 用法：python test/benchmark.py [--quick] [--only step,solve] [-o bench.json] [--compare baseline.json]
+# 随机数种子与合成音符流固定，结果写为 JSON；给定 --compare 时与基线逐项比较，退化超过阈值时返回非零退出码
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, PROJECT_ROOT.as_posix())
+
+from src.body import Ball  # noqa: E402
+from src.boundary import Boundary, CircleBoundary, EllipseBoundary, PolygonBoundary, SDFBoundary  # noqa: E402
+from src.models.hydra import BallConfig, CircleConfig, Config, MusicConfig, SimulationConfig  # noqa: E402
+from src.planner import prepare_simulation, run_simulation  # noqa: E402
+from src.record import RecordArrays  # noqa: E402
+from src.simulator import Simulator  # noqa: E402
+from src.utils import ASSETS_PATH  # noqa: E402
+from src.utils.usable_class import OnlineStats, Vec2  # noqa: E402
+
+SEED = 0
+BUNDLED_MIDI = sorted((ASSETS_PATH / "midi").glob("*.mid"))[0]
+# 与 assets/conf 中的默认配置一致：default_ball + default_circle
+BALL_POS = (-5.0, 0.0)
+BALL_VEL = (0.0, -2.0)
+BALL_ACC = (0.0, -9.81)
+BALL_RADIUS = 0.5
+CIRCLE_RADIUS = 5.5
+
+Result = Dict[str, Any]
+
+
+def best_of(repeat: int, func: Callable[[], Any]) -> float:
+    """重复 repeat 次取最短耗时 (s)，排除偶发的调度与缓存抖动"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def make_ball(pos: Tuple[float, float] = BALL_POS) -> Ball:
+    return Ball(pos=Vec2(*pos), vel=Vec2(*BALL_VEL), acc=Vec2(*BALL_ACC), radius=BALL_RADIUS)
+
+
+def make_boundaries() -> Dict[str, Boundary]:
+    """各类型边界，参数与 assets/conf/boundary 下的默认配置一致"""
+    return {
+        "circle": CircleBoundary(center=Vec2(0, 0), radius=CIRCLE_RADIUS),
+        "ellipse": EllipseBoundary.from_ab(center=Vec2(0, 0), a=6, b=5.5),
+        "polygon": PolygonBoundary.regular(sides=6, radius=6, rotation=0.0),
+        "sdf": SDFBoundary.from_file("shapes/heart.svg", size=11),
+    }
+
+
+def synthetic_notes(rate: float, duration: float, rng: np.random.Generator) -> List[float]:
+    """平均每秒 rate 个音符的随机音符流，相邻音符至少相隔 0.1 s"""
+    mean_gap = 1 / rate
+    gaps = 0.1 + rng.exponential(max(mean_gap - 0.1, 1e-3), size=int(duration * rate * 2) + 8)
+    times = 0.5 + np.cumsum(gaps)
+    return times[times < duration].tolist()
+
+
+def write_midi(path: Path, times: List[float]) -> Path:
+    """将音符时刻写为单音轨 MIDI，经由 NoteRecord 读取，与真实输入走同一条路径"""
+    import pretty_midi
+
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(program=0)
+    inst.notes = [pretty_midi.Note(velocity=100, pitch=60, start=t, end=t + 0.05) for t in times]
+    pm.instruments.append(inst)
+    pm.write(path.as_posix())
+    return path
+
+
+def simulate(midi_path: Path, inst_idx: int, dt: float) -> Tuple[Result, RecordArrays | None]:
+    """用默认小球与圆形边界完整规划一次，返回统计与记录（规划失败时记录为 None）"""
+    cfg = Config(
+        ball=BallConfig(pos=Vec2(*BALL_POS), vel=Vec2(*BALL_VEL), acc=Vec2(*BALL_ACC), radius=BALL_RADIUS),
+        boundary=CircleConfig(radius=CIRCLE_RADIUS),
+        music=MusicConfig(midi=midi_path.name, inst_idx=inst_idx),
+        simulation=SimulationConfig(dt=dt),
+    )
+    simulator, midi, record = prepare_simulation(cfg, midi_path)
+    stats_vel, stats_err = OnlineStats(), OnlineStats()
+    t0 = time.perf_counter()
+    try:
+        completed = run_simulation(simulator, midi, record, stats_vel, stats_err)
+    except AssertionError:  # 找不到合适的恢复系数
+        completed = False
+    seconds = time.perf_counter() - t0
+    arrays = RecordArrays.from_record(record)
+    steps = (arrays.time[-1] if len(arrays) else 0.0) / dt
+    res: Result = {
+        "completed": completed,
+        "notes": len(midi.notes[inst_idx]),
+        "collisions": len(arrays),
+        "non_note": int(np.count_nonzero(~arrays.is_note_event)),
+        "seconds": seconds,
+        "steps_per_s": steps / seconds if seconds > 0 else 0.0,
+    }
+    if stats_err.n:
+        res.update(
+            error_mean_ms=stats_err.mean * 1e3,
+            error_std_ms=stats_err.std * 1e3,
+            error_max_abs_ms=max(abs(stats_err.min), abs(stats_err.max)) * 1e3,
+            error_p95_ms=stats_err.quantile(0.95) * 1e3,
+        )
+    return res, arrays if completed else None
+
+
+def bench_step(quick: bool) -> Result:
+    """Simulator.step 的吞吐：圆形边界内按默认恢复系数反弹"""
+    n = 50_000 if quick else 200_000
+    dt = 1e-3
+
+    def run():
+        simulator = Simulator(make_ball(), CircleBoundary(center=Vec2(0, 0), radius=CIRCLE_RADIUS))
+        for _ in range(n):
+            if simulator.step(dt):
+                simulator.resolve_collision()
+
+    seconds = best_of(3, run)
+    return {"steps": n, "seconds": seconds, "steps_per_s": n / seconds}
+
+
+def collision_states(boundary: Boundary, n: int) -> List[Tuple[Vec2, Vec2, Vec2]]:
+    """从中心出发按默认恢复系数仿真，收集前 n 次碰撞时小球的 (位置, 速度, 加速度)"""
+    simulator = Simulator(make_ball((0.0, 0.0)), boundary)
+    states: List[Tuple[Vec2, Vec2, Vec2]] = []
+    for _ in range(2_000_000):
+        if simulator.step(1e-3):
+            ball = simulator.ball
+            states.append((ball.pos, ball.vel, ball.acc))
+            simulator.resolve_collision()
+            if len(states) == n:
+                break
+    return states
+
+
+def bench_solve(quick: bool) -> Result:
+    """calc_desired_restitution 的吞吐，按边界类型分别统计"""
+    n = 100 if quick else 400
+    rng = np.random.default_rng(SEED)
+    res: Result = {}
+    for name, boundary in make_boundaries().items():
+        states = collision_states(boundary, n)
+        durations = rng.uniform(0.1, 1.0, size=len(states)).tolist()
+        solved = sum(
+            boundary.calc_desired_restitution(d, pos, vel, acc) is not None
+            for d, (pos, vel, acc) in zip(durations, states)
+        )
+
+        def run():
+            for d, (pos, vel, acc) in zip(durations, states):
+                boundary.calc_desired_restitution(d, pos, vel, acc)
+
+        seconds = best_of(3, run)
+        res[name] = {
+            "solves": len(states),
+            "solved_ratio": solved / max(1, len(states)),
+            "solves_per_s": len(states) / seconds,
+        }
+    return res
+
+
+def bench_plan(quick: bool) -> Result:
+    """完整规划：密度与长度递增的合成音符流，以及自带的 MIDI"""
+    rng = np.random.default_rng(SEED)
+    rates = [1, 2, 4, 8]
+    durations = [15.0] if quick else [15.0, 60.0]
+    res: Result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in durations:
+            for rate in rates:
+                notes = synthetic_notes(rate, duration, rng)
+                path = write_midi(Path(tmp) / f"synthetic-{rate}-{duration:g}.mid", notes)
+                res[f"synthetic_{rate}hz_{duration:g}s"] = simulate(path, 0, 1e-3)[0]
+    if not quick:
+        res["bundled"] = simulate(BUNDLED_MIDI, 0, 1e-3)[0]
+    return res
+
+
+def bench_dt(quick: bool) -> Result:
+    """时间误差随步长的变化"""
+    dts = [2e-3, 1e-3, 5e-4] if quick else [4e-3, 2e-3, 1e-3, 5e-4, 2.5e-4]
+    if quick:
+        tmp = tempfile.TemporaryDirectory()
+        notes = synthetic_notes(2, 30.0, np.random.default_rng(SEED))
+        midi_path = write_midi(Path(tmp.name) / "synthetic.mid", notes)
+    else:
+        tmp = None
+        midi_path = BUNDLED_MIDI
+    try:
+        return {f"dt_{dt:g}": simulate(midi_path, 0, dt)[0] for dt in dts}
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def bench_shape(quick: bool) -> Result:
+    """ellipse_boundary_to_manim 的耗时随网格分辨率的变化，依赖 manim、scipy 与 scikit-image"""
+    try:
+        from src.utils.shape import ellipse_boundary_to_manim
+    except ImportError as e:
+        return {"skipped": f"{e}"}
+    boundary = EllipseBoundary.from_ab(center=Vec2(0, 0), a=6, b=5.5)
+    res: Result = {}
+    for grid_res in [250, 500, 1000] if quick else [250, 500, 1000, 2000]:
+        seconds = best_of(3, lambda: ellipse_boundary_to_manim(boundary.Q, boundary.center, 0.5, grid_res=grid_res))
+        res[f"grid_{grid_res}"] = {"latency_ms": seconds * 1e3}
+    return res
+
+
+def bench_render(quick: bool) -> Result:
+    """pygame 渲染器的帧率，不含视频编码"""
+    try:
+        from src.pygame_renderer import Renderer, world_size_from_meta
+    except ImportError as e:
+        return {"skipped": f"{e}"}
+    from src.trajectory import Trajectory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_midi(Path(tmp) / "render.mid", synthetic_notes(2, 30.0, np.random.default_rng(SEED)))
+        _, record = simulate(path, 0, 1e-3)
+    assert record is not None, "the render benchmark needs a completed simulation"
+    n_frames = 60 if quick else 240
+    positions = Trajectory.from_arrays(record).positions_at(np.arange(n_frames) / 30).tolist()
+    world_w, world_h = world_size_from_meta(record.meta)
+    res: Result = {}
+    for size in [480, 960, 1920]:
+        renderer = Renderer(size, size, world_w, world_h)
+
+        def run():
+            for x, y in positions:
+                renderer.render_frame((x, y), 0.5)
+
+        seconds = best_of(3, run)
+        res[f"{size}px"] = {"frames": n_frames, "fps": n_frames / seconds}
+    return res
+
+
+BENCHMARKS: Dict[str, Callable[[bool], Result]] = {
+    "step": bench_step,
+    "solve": bench_solve,
+    "plan": bench_plan,
+    "dt": bench_dt,
+    "shape": bench_shape,
+    "render": bench_render,
+}
+
+
+def environment() -> Result:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def flatten(data: Result, prefix: str = "") -> Dict[str, float]:
+    """将嵌套结果展开为 a.b.c -> 数值"""
+    flat: Dict[str, float] = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(baseline: Result, current: Result, threshold: float) -> List[str]:
+    """
+    逐项比较吞吐（*_per_s、fps，越大越好）与耗时（*_ms、seconds，越小越好），打印变化并返回退化的指标名
+    时间误差等其他指标只打印，不判断好坏
+    """
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions: List[str] = []
+    for name in sorted(old.keys() & new.keys()):
+        a, b = old[name], new[name]
+        metric = name.rsplit(".", 1)[-1]
+        if metric.endswith("_per_s") or metric == "fps":
+            change = b / a - 1 if a else 0.0
+        elif metric.startswith("error") or metric in ("collisions", "non_note", "notes", "solves", "frames", "steps"):
+            if a != b:
+                print(f"  {name:55s} {a:12.4f} -> {b:12.4f}")
+            continue
+        elif metric.endswith("_ms") or metric == "seconds":
+            change = a / b - 1 if b else 0.0  # 统一为正值表示变快
+        else:
+            continue
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:55s} {a:12.4f} -> {b:12.4f}  {change * 100:+6.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Smaller workloads, for a fast sanity check")
+    parser.add_argument("--only", type=str, default=None, help=f"Comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    names = list(BENCHMARKS) if args.only is None else args.only.split(",")
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results: Result = {}
+    for name in names:
+        t0 = time.perf_counter()
+        results[name] = BENCHMARKS[name](args.quick)
+        print(f"{name}: {time.perf_counter() - t0:.1f}s")
+        print(json.dumps(results[name], indent=2))
+    report = {"environment": environment(), "quick": args.quick, "results": results}
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Results saved to {args.output}")
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("quick") != args.quick:
+            print("WARN: comparing runs with different workloads (--quick)")
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit')}):")
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"FAIL: {len(regressions)} metric(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
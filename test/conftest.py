@@ -0,0 +1,6 @@
+# 测试从仓库根目录导入 src，与 benchmark.py 相同
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, PROJECT_ROOT.as_posix())
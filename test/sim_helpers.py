@@ -0,0 +1,48 @@
+# 测试共用的短仿真：合成音符流，小球与圆形边界与 benchmark.py 一致
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from benchmark import BALL_ACC, BALL_POS, BALL_RADIUS, BALL_VEL, CIRCLE_RADIUS, synthetic_notes, write_midi
+from src.checkpoint import CheckpointLog
+from src.models.hydra import BallConfig, CircleConfig, Config, MusicConfig, SimulationConfig
+from src.models.manim import SimulationRecord
+from src.onset import NoteSource
+from src.planner import prepare_simulation, run_simulation
+from src.record import RecordArrays
+from src.simulator import Simulator
+from src.utils.usable_class import OnlineStats, Vec2
+
+DT = 0.001  # 与 assets/conf/config.yaml 一致
+# 平均每秒 2 个音符、共 12 s 的合成音符流，仿真不到 0.1 s
+NOTES: List[float] = synthetic_notes(2.0, 12.0, np.random.default_rng(0))
+COLUMNS = ["time", "position", "velocity_after", "is_note_event"]
+
+Simulation = Tuple[Simulator, NoteSource, SimulationRecord]
+
+
+def prepare(midi_path: Path, times: List[float]) -> Simulation:
+    """将音符时刻写为 midi_path，并以默认配置准备仿真"""
+    write_midi(midi_path, times)
+    cfg = Config(
+        ball=BallConfig(pos=Vec2(*BALL_POS), vel=Vec2(*BALL_VEL), acc=Vec2(*BALL_ACC), radius=BALL_RADIUS),
+        boundary=CircleConfig(radius=CIRCLE_RADIUS),
+        music=MusicConfig(midi=midi_path.name, inst_idx=0),
+        simulation=SimulationConfig(dt=DT),
+    )
+    return prepare_simulation(cfg, midi_path)
+
+
+def run(sim: Simulation, checkpoints: CheckpointLog | None = None) -> Tuple[RecordArrays, OnlineStats, OnlineStats]:
+    """运行仿真直到音符耗尽，返回记录（给定检查点日志时包含检查点）与速率、时间误差的统计量"""
+    simulator, midi, record = sim
+    stats_vel, stats_err = OnlineStats(), OnlineStats()
+    assert run_simulation(simulator, midi, record, stats_vel, stats_err, checkpoints=checkpoints)
+    arrays = RecordArrays.from_record(record, None if checkpoints is None else checkpoints.to_arrays())
+    return arrays, stats_vel, stats_err
+
+
+def assert_same_columns(a: RecordArrays, b: RecordArrays) -> None:
+    for name in COLUMNS:
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
@@ -0,0 +1,74 @@
+# 检查点：从第一处改动之前的检查点继续仿真，结果与从头仿真一致；草图按桶合并
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+from sim_helpers import NOTES, assert_same_columns, prepare, run
+from src.checkpoint import CheckpointLog, Checkpoints
+from src.planner import new_checkpoint_log, prepare_resume, run_simulation
+from src.record import RecordWriter, load_record_arrays, save_record
+from src.utils.usable_class import OnlineStats, QuantileSketch
+
+
+def assert_same_checkpoints(a: Checkpoints | None, b: Checkpoints | None) -> None:
+    assert a is not None and b is not None
+    np.testing.assert_array_equal(a.to_rows(), b.to_rows())
+    np.testing.assert_array_equal(a.sketch, b.sketch)
+
+
+def assert_same_stats(a: OnlineStats, b: OnlineStats) -> None:
+    assert (a.n, a.mean, a.m2, a.min, a.max) == (b.n, b.mean, b.m2, b.min, b.max)
+    assert (a.sketch.pos, a.sketch.neg, a.sketch.zero) == (b.sketch.pos, b.sketch.neg, b.sketch.zero)
+    assert a.sketch.n == b.sketch.n
+
+
+def test_resume_matches_full_simulation(tmp_path: Path):
+    old, _, _ = run(prepare(tmp_path / "old.mid", NOTES), CheckpointLog())
+    assert old.checkpoints is not None and len(old.checkpoints) == len(NOTES)
+    old = load_record_arrays(save_record(old, tmp_path / "old.rec"))
+
+    # 改动后三分之一的音符
+    m = len(NOTES) * 2 // 3
+    changed = NOTES[:m] + [t + 0.05 for t in NOTES[m:]]
+    expected, expected_vel, expected_err = run(prepare(tmp_path / "expected.mid", changed), CheckpointLog())
+
+    sim = prepare(tmp_path / "changed.mid", changed)
+    log = prepare_resume(old, sim[1], sim[2])
+    assert 0 < len(log) <= m
+    resumed, resumed_vel, resumed_err = run(sim, log)
+
+    assert_same_columns(resumed, expected)
+    assert replace(resumed.meta, midi_file=expected.meta.midi_file) == expected.meta
+    assert_same_checkpoints(resumed.checkpoints, expected.checkpoints)
+    assert_same_stats(resumed_vel, expected_vel)
+    assert_same_stats(resumed_err, expected_err)
+
+
+def test_streamed_checkpoints_match_in_memory(tmp_path: Path):
+    expected, _, _ = run(prepare(tmp_path / "notes.mid", NOTES), CheckpointLog())
+
+    simulator, midi, record = prepare(tmp_path / "notes.mid", NOTES)
+    writer = RecordWriter(tmp_path / "streamed.rec", record.meta)
+    checkpoints = new_checkpoint_log(writer)
+    assert run_simulation(simulator, midi, record, OnlineStats(), OnlineStats(), checkpoints=checkpoints, writer=writer)
+    streamed = load_record_arrays(writer.finalize(record.meta, checkpoints))
+
+    assert_same_columns(streamed, expected)
+    assert_same_checkpoints(streamed.checkpoints, expected.checkpoints)
+
+
+def test_sketch_merge():
+    rng = np.random.default_rng(0)
+    xs = np.concatenate([rng.normal(0, 1e-3, 500), np.zeros(20), rng.exponential(2.0, 500)])
+    whole = QuantileSketch()
+    whole.update_many(xs)
+    head, tail = QuantileSketch(), QuantileSketch()
+    head.update_many(xs[:400])
+    tail.update_many(xs[400:])
+    head.merge(tail)
+
+    assert (head.pos, head.neg, head.zero, head.n) == (whole.pos, whole.neg, whole.zero, whole.n)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = float(np.quantile(xs, q, method="lower"))
+        assert abs(head.quantile(q) - exact) <= whole.alpha * abs(exact) + 1e-12
@@ -0,0 +1,67 @@
+# 导入耗时回归检查：仿真核心只应依赖 numpy 与 pretty_midi
+# 用法：python -m pytest test/test_import_time.py，超出预算或导入了渲染依赖时失败
+
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+IMPORT_BUDGET = 1.0  # 核心模块的导入耗时预算 (s)
+
+# 仿真核心模块，以及只需要 Vec2 / NoteRecord 的工具会导入的模块
+CORE_MODULES = [
+    "src.utils.usable_class",
+    "src.midi",
+    "src.models",
+    "src.body",
+    "src.boundary",
+    "src.simulator",
+    "src.planner",
+    "src.record",
+    "src.trajectory",
+]
+
+# 只允许在渲染或前端中导入的依赖
+FORBIDDEN = ["manim", "scipy", "skimage", "jaxtyping", "hydra", "omegaconf", "soundfile", "pygame"]
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import_time() -> Dict[str, int]:
+    """以 -X importtime 在新进程中导入核心模块，返回每个模块的自身耗时 (us)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(CORE_MODULES)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+
+    self_us: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            self_us[m.group(4)] = int(m.group(1))
+    return self_us
+
+
+@pytest.fixture(scope="module")
+def self_us() -> Dict[str, int]:
+    return measure_import_time()
+
+
+def test_core_skips_frontend_dependencies(self_us: Dict[str, int]):
+    leaked = sorted({name.split(".")[0] for name in self_us} & set(FORBIDDEN))
+    assert not leaked, f"rendering/front-end dependencies imported by the core: {', '.join(leaked)}"
+
+
+def test_core_import_time_within_budget(self_us: Dict[str, int]):
+    total = sum(self_us.values()) / 1e6
+    slowest = sorted(self_us.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    report = "\n".join(f"  {us / 1e3:8.1f} ms  {name}" for name, us in slowest)
+    assert total <= IMPORT_BUDGET, f"core import time {total:.3f}s exceeds {IMPORT_BUDGET:.3f}s:\n{report}"